@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+'''
+Copyright (C) 2015 The Regents of the University of California.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+__author__ = "Alex Huszagh"
+__maintainer__ = "Alex Huszagh"
+__email__ = "ahuszagh@gmail.com"
+
+# This program benchmarks the scan parsers over deterministic, synthetic
+# TPP, PAVA, RV and PD files, reporting the scans/s, MB/s and peak RSS
+# of each parser and of each converter script. Every case runs in its
+# own process, so the peak RSS is not shared between cases. Parser cases
+# are timed within the process, scripts include the interpreter startup.
+# With --verify, the converter output through the columnar cache is
+# checked against the uncached output instead, for each dialect.
+
+# Ex.:
+#   $ python benchmark.py -n 100000 -k 50 --crlf --ms3
+#   Case            Scans   MB      Seconds Scans/s MB/s    RSS MB
+#   split           100000  74.31   0.35    285714  212.31  81.20
+#   ....
+#   $ python benchmark.py -n 1000 --missing-intensity 0.25 --verify
+
+# Tested on Python 2.7.9 Ubuntu and Python 3.4.3, Ubuntu
+
+# load modules
+import argparse
+import filecmp
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# load objects/functions
+from lanhuang.dialects import DIALECTS
+from lanhuang.index import ScanIndex, sidecar_path
+from lanhuang.reader import MgfReader
+from lanhuang.scans import ScanSplitter
+from lanhuang.synthetic import write_mgf
+
+# constants
+PATH = os.path.dirname(os.path.realpath(__file__))
+FILES = {
+    'TPP': 'synthetic_tpp.mgf',
+    'PAVA': 'synthetic_pava.txt',
+    'RV': 'synthetic_rv.mgf',
+    'PD': 'synthetic_pd.mgf',
+}
+
+# case -> input dialect, in the order run
+PARSER_CASES = [
+    ('split', 'PAVA'),
+    ('tpp-headers', 'TPP'),
+    ('pava-headers', 'PAVA'),
+    ('rv-headers', 'RV'),
+    ('pd-headers', 'PD'),
+    ('tpp-index', 'TPP'),
+    ('pava-peaks', 'PAVA'),
+]
+SCRIPT_CASES = [
+    ('fix_pava', 'PAVA'),
+    ('fix_fusion', 'PAVA'),
+    ('fix_mgf', 'PAVA'),
+    ('rv_mgf_converter', 'RV'),
+    ('pd_mgf_converter', 'PD'),
+]
+
+# process arguments
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument("-n", "--scans", help="Scans per file", type=int,
+                    default=10000)
+PARSER.add_argument("-k", "--peaks", help="Peaks per scan", type=int,
+                    default=100)
+PARSER.add_argument("--crlf", help="Windows line endings",
+                    action="store_true")
+PARSER.add_argument("--missing-charge", help="Fraction of scans without "
+                    "a CHARGE line", type=float, default=0.25)
+PARSER.add_argument("--missing-intensity", help="Fraction of scans "
+                    "without a precursor intensity", type=float, default=0)
+PARSER.add_argument("--ms3", help="Add the _ms3cid header lines to the "
+                    "PAVA file", action="store_true")
+PARSER.add_argument("--seed", help="Random seed", type=int, default=0)
+PARSER.add_argument("-d", "--directory", help="Keep the synthetic files "
+                    "in this directory (Optional)", type=str)
+PARSER.add_argument("-c", "--cases", help="Comma-separated cases to run "
+                    "(Optional)", type=str)
+PARSER.add_argument("--verify", help="Check the cached converter output "
+                    "equals the uncached output", action="store_true")
+PARSER.add_argument("--case", help=argparse.SUPPRESS, type=str)
+PARSER.add_argument("--input", help=argparse.SUPPRESS, type=str)
+
+# ------------------
+#      PARSERS
+# ------------------
+
+
+def count_headers(path, dialect):
+    '''Splits the scans and parses each header'''
+
+    dialect = DIALECTS[dialect]
+    count = 0
+    with ScanSplitter(path) as scans:
+        for start, _ in scans:
+            dialect.parse(scans.map, start)
+            count += 1
+    return count
+
+
+def run_parser_case(case, path):
+    '''Runs a single parser case, returning the scan count'''
+
+    if case == 'split':
+        with ScanSplitter(path) as scans:
+            return sum(1 for _ in scans)
+    elif case == 'tpp-index':
+        if os.path.exists(sidecar_path(path)):
+            os.remove(sidecar_path(path))
+        index = ScanIndex.load(path)
+        count = len(index)
+        index.close()
+        return count
+    elif case == 'pava-peaks':
+        with MgfReader(path, 'PAVA') as reader:
+            return sum(1 for _ in reader)
+    dialect = case.split('-')[0].upper()
+    return count_headers(path, dialect)
+
+# ------------------
+#      RUNNERS
+# ------------------
+
+
+def wait(process):
+    '''Waits for the process, returning its peak RSS in MB or None'''
+
+    if not hasattr(os, 'wait4'):
+        process.wait()
+        return None
+
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = status
+    if status:
+        raise subprocess.CalledProcessError(status >> 8, process.args)
+    # ru_maxrss is in kilobytes, except bytes on OS X
+    if sys.platform == 'darwin':
+        return usage.ru_maxrss / 1e6
+    return usage.ru_maxrss / 1e3
+
+
+def script_command(case, paths, directory):
+    '''Returns the command line for a converter script'''
+
+    script = os.path.join(PATH, case + '.py')
+    output = os.path.join(directory, case + '_out.txt')
+    if case in ('rv_mgf_converter', 'pd_mgf_converter'):
+        dialect = 'RV' if case.startswith('rv') else 'PD'
+        return [sys.executable, script, '-m', paths[dialect], '-o', output]
+    return [sys.executable, script, '-t', paths['TPP'], '-p',
+            paths['PAVA'], '-o', output]
+
+
+def run_case(case, dialect, paths, directory, scans):
+    '''Runs one case in a new process, returning its table row'''
+
+    parser_case = case in dict(PARSER_CASES)
+    if parser_case:
+        command = [sys.executable, os.path.realpath(__file__),
+                   '--case', case, '--input', paths[dialect]]
+    else:
+        command = script_command(case, paths, directory)
+        # cold start, without the tpp index sidecar
+        if os.path.exists(sidecar_path(paths['TPP'])):
+            os.remove(sidecar_path(paths['TPP']))
+
+    start = time.time()
+    stdout = subprocess.PIPE if parser_case else None
+    process = subprocess.Popen(command, cwd=directory, stdout=stdout)
+    process.args = command
+    output = process.stdout.read() if parser_case else None
+    rss = wait(process)
+    seconds = time.time() - start
+    if parser_case:
+        seconds = float(output.split()[1])
+
+    megabytes = os.path.getsize(paths[dialect]) / 1e6
+    return [case, str(scans), '{0:.2f}'.format(megabytes),
+            '{0:.2f}'.format(seconds),
+            '{0:.0f}'.format(scans / seconds),
+            '{0:.2f}'.format(megabytes / seconds),
+            'n/a' if rss is None else '{0:.2f}'.format(rss)]
+
+
+def verify_cache(paths, directory):
+    '''
+    Converts each MGF file with and without the columnar cache, and
+    returns the dialects whose outputs differ.
+    '''
+
+    script = os.path.join(PATH, 'mgf_converter.py')
+    differ = []
+    for dialect in ('TPP', 'RV', 'PD'):
+        outputs = []
+        for cache in ([], ['--cache']):
+            output = os.path.join(directory, '{0}{1}_out.txt'.format(
+                dialect.lower(), '_cached' if cache else ''))
+            subprocess.check_call([sys.executable, script, '-m',
+                                   paths[dialect], '-d', dialect, '-o',
+                                   output] + cache, cwd=directory)
+            outputs.append(output)
+        same = filecmp.cmp(outputs[0], outputs[1], shallow=False)
+        print('{0}\t{1}'.format(dialect, 'ok' if same else 'differs'))
+        if not same:
+            differ.append(dialect)
+    return differ
+
+# ------------------
+#       MAIN
+# ------------------
+
+
+def make_files(directory, args):
+    '''Writes a synthetic file per dialect, returning the paths'''
+
+    paths = {}
+    for dialect, name in FILES.items():
+        paths[dialect] = write_mgf(
+            os.path.join(directory, name), dialect, args.scans, args.peaks,
+            args.crlf, args.missing_charge, args.ms3 and dialect == 'PAVA',
+            args.seed, args.missing_intensity)
+    return paths
+
+
+def main(argv=None):
+    '''Runs the core tasks'''
+
+    args = PARSER.parse_args(argv)
+    if args.case:
+        # time within the case process, without interpreter startup
+        start = time.time()
+        count = run_parser_case(args.case, args.input)
+        print('{0} {1!r}'.format(count, time.time() - start))
+        return
+
+    cases = PARSER_CASES + SCRIPT_CASES
+    if args.cases:
+        names = args.cases.split(',')
+        cases = [i for i in cases if i[0] in names]
+
+    directory = args.directory or tempfile.mkdtemp()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        paths = make_files(directory, args)
+        if args.verify:
+            if verify_cache(paths, directory):
+                sys.exit(1)
+            return
+        columns = ['Case', 'Scans', 'MB', 'Seconds', 'Scans/s', 'MB/s',
+                   'RSS MB']
+        print('\t'.join(columns))
+        for case, dialect in cases:
+            print('\t'.join(run_case(case, dialect, paths, directory,
+                                     args.scans)))
+            sys.stdout.flush()
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
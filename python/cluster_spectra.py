@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+'''
+Copyright (C) 2015 The Regents of the University of California.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+__author__ = "Alex Huszagh"
+__maintainer__ = "Alex Huszagh"
+__email__ = "ahuszagh@gmail.com"
+
+# This program clusters the near-duplicate spectra across the MGF files
+# of an experiment, ie, the same precursor fragmented in several
+# fractions or technical replicates, and writes one spectrum per
+# cluster, so each precursor is only searched once. The spectra within
+# the precursor m/z tolerance, with the same charge, are hashed into
+# locality-sensitive buckets from their most intense peaks, and joined
+# by the cosine similarity of their binned peak vectors.
+# Each cluster is written as its most intense spectrum, or as a
+# consensus of the peaks found in most of its spectra.
+
+# Ex.:
+#       python cluster_spectra.py -i fraction01.txt fraction02.txt
+#       python cluster_spectra.py -b fractions -o clustered.txt --consensus
+
+# load modules
+import argparse
+import os
+
+# load objects/functions
+from lanhuang.batch import find_spectra
+from lanhuang.cluster import (BIN_WIDTH, HASHES, PPM_TOLERANCE, ROWS,
+                              SIMILARITY, Clustering, cluster_spectra)
+
+# constants
+PATH = os.path.dirname(os.path.realpath(__file__))
+OUT_NAME = 'clustered.txt'
+REPORT_NAME = 'spectrum_clusters.txt'
+
+# process arguments
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument("-i", "--inputs", help="MGF Files, all of one dialect",
+                    nargs='+', type=str)
+PARSER.add_argument("-b", "--batch", help="Directory or manifest of the "
+                    "MGF files", type=str)
+PARSER.add_argument("-o", "--output", help="Output File Name (Optional)",
+                    type=str)
+PARSER.add_argument("--ppm", help="Precursor m/z tolerance, in ppm",
+                    type=float, default=PPM_TOLERANCE)
+PARSER.add_argument("--similarity", help="Cosine similarity of the "
+                    "binned peaks to join two spectra", type=float,
+                    default=SIMILARITY)
+PARSER.add_argument("--bin-width", help="m/z bin width of the peak "
+                    "vectors", type=float, default=BIN_WIDTH)
+PARSER.add_argument("--hashes", help="MinHash functions per spectrum",
+                    type=int, default=HASHES)
+PARSER.add_argument("--rows", help="MinHash rows per LSH band; fewer "
+                    "rows find more candidates", type=int, default=ROWS)
+PARSER.add_argument("--consensus", help="Write a consensus spectrum for "
+                    "each cluster, rather than its most intense spectrum",
+                    action="store_true")
+PARSER.add_argument("-s", "--summary", help="List the cluster of every "
+                    "spectrum", action="store_true")
+
+# ------------------
+#       MAIN
+# ------------------
+
+
+def main(argv=None):
+    '''Runs the core tasks'''
+
+    args = PARSER.parse_args(argv)
+    # parse arguments
+    if args.batch:
+        paths = find_spectra(os.path.join(PATH, args.batch))
+    else:
+        paths = [os.path.join(PATH, i) for i in args.inputs or []]
+    if not paths:
+        raise argparse.ArgumentTypeError("Please include the MGF files, "
+                                         "or a directory of them")
+    for path in paths:
+        if not os.path.exists(path):
+            raise argparse.ArgumentTypeError("MGF File not found: "
+                                             "{0}".format(path))
+    out_path = os.path.join(PATH, args.output or OUT_NAME)
+
+    mode = 'consensus' if args.consensus else 'representative'
+    try:
+        clustering = Clustering(args.ppm, args.similarity, mode,
+                                args.bin_width, args.hashes, args.rows)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+    # cluster report
+    if args.summary:
+        clustering.report = open(os.path.join(PATH, REPORT_NAME), 'w')
+    try:
+        cluster_spectra(paths, out_path, clustering)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    finally:
+        if clustering.report is not None:
+            clustering.report.close()
+
+if __name__ == '__main__':
+    main()
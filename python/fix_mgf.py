@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+'''
+Copyright (C) 2015 The Regents of the University of California.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+__author__ = "Alex Huszagh"
+__maintainer__ = "Alex Huszagh"
+__email__ = "ahuszagh@gmail.com"
+
+# This program combines fix_fusion.py and fix_pava.py, applying a chain
+# of fixers to each PAVA scan from the TPP data in a single pass, rather
+# than writing and re-reading an intermediate "_corrected.txt" file.
+# The fixers are applied in the order given:
+#       precursor -- replaces the PEPMASS m/z and intensity (fix_fusion)
+#       charge -- raises mis-assigned charge states (fix_pava)
+
+# Ex.:
+#       python fix_mgf.py -t file.mgf -p file_ms2.txt -f precursor,charge
+
+# Tested on Python 2.7.9 Ubuntu and Python 3.4.3, Ubuntu
+
+# load modules
+import argparse
+import os
+
+# load objects/functions
+from lanhuang.compression import from_extension, strip_extension
+from lanhuang.fixers import FIXERS, fix_mgf
+from lanhuang.join import open_lookup
+from lanhuang.output import Output
+from lanhuang.scans import ScanSource
+from lanhuang.shards import MODES, Sharding, parse_cuts
+
+# constants
+PATH = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_FIXERS = 'precursor,charge'
+SUMMARY_NAME = 'charge_states.txt'
+
+# process arguments
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument("-t", "--TPP", help="TPP File",
+                    type=str)
+PARSER.add_argument("-p", "--PAVA", help="PAVA File",
+                    type=str)
+PARSER.add_argument("-o", "--output", help="Output File Name (Optional)",
+                    type=str)
+PARSER.add_argument("-f", "--fixers", help="Comma-separated fixers to "
+                    "apply, in order, from: {0}".format(
+                        ', '.join(sorted(FIXERS))),
+                    type=str, default=DEFAULT_FIXERS)
+PARSER.add_argument("-s", "--summary", help="Change Summary",
+                    action="store_true")
+PARSER.add_argument("--stream", help="Merge-join scan-ordered TPP and "
+                    "PAVA files without indexing", action="store_true")
+PARSER.add_argument("--pipeline", help="Read ahead and write behind in "
+                    "background threads, overlapping I/O with parsing",
+                    action="store_true")
+PARSER.add_argument("--resume", help="Continue an interrupted run from "
+                    "its last checkpoint, rather than from the start",
+                    action="store_true")
+PARSER.add_argument("--shards", help="Split the output into this many "
+                    "shards, balanced by --shard-by, with a manifest",
+                    type=int)
+PARSER.add_argument("--shard-by", help="Balance the shards by scan count, "
+                    "peak count or byte size (default scans), or cut "
+                    "them by retention time (min) or precursor m/z at "
+                    "--shard-cuts", choices=MODES)
+PARSER.add_argument("--shard-cuts", help="Comma-separated retention times "
+                    "or m/z values to cut the shards at", type=parse_cuts)
+
+# ------------------
+#       MAIN
+# ------------------
+
+
+def main(argv=None):
+    '''Runs the core tasks'''
+
+    args = PARSER.parse_args(argv)
+    # parse arguments
+    if not args.TPP or not args.PAVA:
+        raise argparse.ArgumentTypeError("Please include both a PAVA file "
+                                         "and TPP file in the working "
+                                         "directory")
+    tpp_path = os.path.join(PATH, args.TPP)
+    pava_path = os.path.join(PATH, args.PAVA)
+    base_name = os.path.basename(strip_extension(args.PAVA))
+    base_name = os.path.splitext(base_name)[0] + "_corrected.txt"
+    out_path = os.path.join(PATH, base_name)
+    if args.output:
+        out_path = os.path.join(PATH, args.output)
+    names = [i.strip() for i in args.fixers.split(',') if i.strip()]
+    for name in names:
+        if name not in FIXERS:
+            raise argparse.ArgumentTypeError("Unknown fixer: {0}".format(
+                name))
+    if not os.path.exists(tpp_path):
+        raise argparse.ArgumentTypeError("MGF File not found. Make sure it "
+                                         "is in the current working "
+                                         "directory.")
+    if not os.path.exists(pava_path):
+        raise argparse.ArgumentTypeError("PAVA File not found. Make sure it "
+                                         "is in the current working "
+                                         "directory.")
+    if args.resume and from_extension(out_path):
+        raise argparse.ArgumentTypeError("Only uncompressed outputs can be "
+                                         "resumed.")
+
+    sharding = None
+    if args.shards is not None or args.shard_by or args.shard_cuts:
+        try:
+            sharding = Sharding(args.shards, args.shard_by or 'scans',
+                                args.shard_cuts)
+        except ValueError as error:
+            raise argparse.ArgumentTypeError(str(error))
+    if sharding is not None and args.resume:
+        raise argparse.ArgumentTypeError("Sharded outputs cannot be "
+                                         "resumed.")
+
+    # summary output
+    summary = None
+    if args.summary:
+        # beside the output, appended to from the checkpoint when resuming
+        mode = 'a' if args.resume else 'w'
+        summary = open(os.path.join(os.path.dirname(out_path),
+                                    SUMMARY_NAME), mode)
+    try:
+        with Output(out_path, [tpp_path, pava_path], args.resume,
+                    args.pipeline, sharding) as out:
+            with ScanSource(pava_path, out.offset,
+                            prefetch=args.pipeline) as scans:
+                tpp_data = open_lookup(tpp_path, args.stream)
+                try:
+                    fix_mgf(scans, tpp_data, out, names, summary)
+                finally:
+                    tpp_data.close()
+    finally:
+        if summary is not None:
+            summary.close()
+
+if __name__ == '__main__':
+    main()
@@ -42,43 +42,23 @@ __email__ = "ahuszagh@gmail.com"
 # load modules
 import argparse
 import os
-import re
-import six
 
-if six.PY2:
-    from cStringIO import StringIO
-else:
-    from io import StringIO
-
-# pylint: disable=protected-access, too-many-instance-attributes
+# load objects/functions
+from lanhuang.cache import SpectrumCache
+from lanhuang.charges import SOURCES, InferredCharges
+from lanhuang.compression import from_extension, strip_extension
+from lanhuang.join import open_lookup
+from lanhuang.match import PPM_TOLERANCE, RT_TOLERANCE, Matching, match_scans
+from lanhuang.output import Output
+from lanhuang.pava import fix_pava, fix_pava_batch, fix_pava_jobs
+from lanhuang.scans import ScanSource
+from lanhuang.shards import MODES, Sharding, parse_cuts
+from lanhuang.watch import INTERVAL, watch_folder
 
 # constants
 PATH = os.path.dirname(os.path.realpath(__file__))
-TPP_PARSER = re.compile(
-    r'BEGIN IONS\r?\n'
-    r'TITLE=(.*)\.[0-9]+\.[0-9]+\.[0-9]* '
-    # one massively long line
-    r'File:\"(.*)\", NativeID:\"'
-    r'controllerType=[0-9]+ '
-    r'controllerNumber=[0-9]+ scan=([0-9]+)\"\r?\n'
-    # newline
-    r'RTINSECONDS=([0-9]*\.?[0-9]*)\r?\n'
-    r'PEPMASS=([0-9]+\.[0-9]+)'
-    r'(?: ([0-9]*\.[0-9]+))?\r?\n'
-    r'(CHARGE=([0-9]+)\+\r?\n)?')
-PAVA_PARSER = re.compile(
-    r'^BEGIN IONS\r?\n'
-    # In case of file header line, in _ms3cid files
-    r'(.*\r?\n)?'
-    # precursor in ms2
-    r'(?:MS2_SCAN_NUMBER= ([0-9]+)\r?\n)?'
-    r'TITLE=Scan ([0-9]+) '
-    r'\(rt=([0-9]*\.[0-9]+)\) \[(.*)\]\r?\n'
-    r'PEPMASS=([0-9]+\.?[0-9]*)\s+'
-    r'([0-9]*(\.?[0-9]*)?)\r?\n'
-    # Line could be missing if CHARGE=1+
-    r'(CHARGE=([0-9]+)\+\r?\n)?'
-)
+SUMMARY_NAME = 'charge_states.txt'
+MATCHES_NAME = 'scan_matches.txt'
 
 # process arguments
 PARSER = argparse.ArgumentParser()
@@ -90,330 +70,198 @@ PARSER.add_argument("-o", "--output", help="Output File Name (Optional)",
                     type=str)
 PARSER.add_argument("-s", "--summary", help="Change Summary",
                     action="store_true")
-ARGS = PARSER.parse_args()
-# parse arguments
-if not ARGS.TPP or not ARGS.PAVA:
-    raise argparse.ArgumentTypeError("Please include both a PAVA file and "
-                                     "TPP file in the working directory")
-TPP_PATH = os.path.join(PATH, ARGS.TPP)
-PAVA_PATH = os.path.join(PATH, ARGS.PAVA)
-BASE_NAME = os.path.splitext(os.path.basename(ARGS.PAVA))[0] + "_corrected.txt"
-OUT_PATH = os.path.join(PATH, BASE_NAME)
-if ARGS.output:
-    OUT_PATH = os.path.join(PATH, ARGS.output)
-# summary output
-SUMMARY_PATH = os.path.join(PATH, 'charge_states.txt')
-if ARGS.summary:
-    SUMMARY_FILE = open(SUMMARY_PATH, 'w')
-else:
-    SUMMARY_FILE = StringIO()
-
-# ------------------
-#        I/O
-# ------------------
-
-# output
-try:
-    TPP_SCANS = open(TPP_PATH, 'r')
-except IOError:
-    raise argparse.ArgumentTypeError("MGF File not found. Make sure it is "
-                                     "in the current working directory.")
-
-# process input
-try:
-    PAVA_SCANS = open(PAVA_PATH, 'r')
-except IOError:
-    raise argparse.ArgumentTypeError("PAVA File not found. Make sure it is "
-                                     "in the current working directory.")
-
-# ------------------
-#    SCAN FINDER
-# ------------------
-
-
-class ScanFinder(object):
-    '''Iteratively parses chunks and breaks them into scans, with
-    a bound remainder.
-    '''
-
-    def __init__(self, start_sub, end_sub):
-        '''Binds instance atrributes and calls object'''
-        super(ScanFinder, self).__init__()
-
-        # bind instance attributes
-        self.remainder = ''
-        self.start_sub = start_sub
-        self.end_sub = end_sub
-
-    def parse_chunk(self, chunk):
-        '''Parses a read chunk and adds to the remainder, and then
-        processes scan subs.
-
-        Arguments:
-            chunk -- read chunk, ie, 4096 chars, etc.
-        '''
-
-        # add to stored
-        self.remainder += chunk
-        # init return
-        scans = []
-        start = None
-        end = None
-        # iteratively add until not found
-        while end != -1:
-            # find start and end subs
-            start = self.find_start()
-            end, match = self.find_end()
-            # if both found
-            if end != -1:
-                # yield scan
-                scan = self.get_scan(start, end, match)
-                scans.append(scan)
-                # adjust remainder
-                self.adjust_remainder(end, match)
-        return scans
-
-    def find_start(self):
-        '''Finds the start position of a given scan'''
-
-        if isinstance(self.start_sub, six.string_types):
-            start = self.remainder.find(self.start_sub)
-        # if re sub
-        elif isinstance(self.start_sub, re._pattern_type):
-            match = self.start_sub.search(self.remainder)
-            if match is None:
-                start = -1
-            else:
-                start = match.start()
-        return start
-
-    def find_end(self):
-        '''Finds the end position of a given scan'''
-
-        if isinstance(self.end_sub, six.string_types):
-            end = self.remainder.find(self.end_sub)
-            match = None
-        # if re sub
-        elif isinstance(self.end_sub, re._pattern_type):
-            match = self.end_sub.search(self.remainder)
-            if match is None:
-                end = -1
-            else:
-                end = match.start()
-        return end, match
-
-    def get_scan(self, start, end, match):
-        '''Gets the full scan string of the MS scan file.
-
-        Arguments:
-            start, end -- ints for start and end of the scan
-            match -- re match pattern or NoneType
-        '''
-
-        # grab sub lengths
-        if isinstance(self.end_sub, six.string_types):
-            sub_end = end + len(self.end_sub)
-        # if re sub
-        elif isinstance(self.end_sub, re._pattern_type):
-            sub_end = match.end()
-        # grab full scan and return
-        scan = self.remainder[start:sub_end]
-        return scan
-
-    def adjust_remainder(self, end, match):
-        '''Adjusts the remaining string length for new scan processing.
-
-        Arguments:
-            end -- ints for start and end of the scan
-            match -- re match pattern or NoneType
-        '''
-
-        # grab sub lengths
-        if isinstance(self.end_sub, six.string_types):
-            sub_end = end + len(self.end_sub)
-        # if re sub
-        elif isinstance(self.end_sub, re._pattern_type):
-            sub_end = match.end()
-        self.remainder = self.remainder[sub_end:]
+PARSER.add_argument("--stream", help="Merge-join scan-ordered TPP and "
+                    "PAVA files without indexing", action="store_true")
+PARSER.add_argument("-j", "--jobs", help="Worker processes, each "
+                    "correcting a byte range of the PAVA file, or a "
+                    "PAVA/TPP pair in batch mode", type=int)
+PARSER.add_argument("--cache", help="Read the PAVA scans through a "
+                    "columnar cache, built on first use", action="store_true")
+PARSER.add_argument("--splice", help="Copy the unchanged bytes of the "
+                    "PAVA file straight to the output, writing only the "
+                    "corrected CHARGE values", action="store_true")
+PARSER.add_argument("-b", "--batch", help="Directory or manifest of "
+                    "TPP and PAVA files, paired by RAW file name; "
+                    "--output is then the output directory", type=str)
+PARSER.add_argument("--pipeline", help="Read ahead and write behind in "
+                    "background threads, overlapping I/O with parsing",
+                    action="store_true")
+PARSER.add_argument("--resume", help="Continue an interrupted correction "
+                    "from its last checkpoint, rather than from the start",
+                    action="store_true")
+PARSER.add_argument("--shards", help="Split the output into this many "
+                    "shards, balanced by --shard-by, with a manifest",
+                    type=int)
+PARSER.add_argument("--shard-by", help="Balance the shards by scan count, "
+                    "peak count or byte size (default scans), or cut "
+                    "them by retention time (min) or precursor m/z at "
+                    "--shard-cuts", choices=MODES)
+PARSER.add_argument("--shard-cuts", help="Comma-separated retention times "
+                    "or m/z values to cut the shards at", type=parse_cuts)
+PARSER.add_argument("--match", help="Join the TPP and PAVA scans by "
+                    "retention time and precursor m/z, rather than scan "
+                    "number, reporting the unmatched and ambiguous scans",
+                    action="store_true")
+PARSER.add_argument("--rt-tolerance", help="Retention time tolerance for "
+                    "--match, in seconds", type=float, default=RT_TOLERANCE)
+PARSER.add_argument("--ppm", help="Precursor m/z tolerance for --match, "
+                    "in ppm", type=float, default=PPM_TOLERANCE)
+PARSER.add_argument("--charge-source", help="Raise the charges to the "
+                    "TPP charges, to those inferred from the isotope "
+                    "envelope of each precursor, without a TPP file, or to "
+                    "the inferred charges, falling back to the TPP charges",
+                    choices=SOURCES, default='tpp')
+PARSER.add_argument("-w", "--watch", help="Directory to watch, correcting "
+                    "each PAVA file once it and its TPP file are written; "
+                    "--output is then the output directory", type=str)
+PARSER.add_argument("--interval", help="Seconds between polls of the "
+                    "watched directory", type=float, default=INTERVAL)
 
 # ------------------
-#    SCAN PARSER
+#     CORRECTION
 # ------------------
 
 
-class ParseMgf(object):
-    '''Parses MGF file format using series of known subs (specific
-    to each version of MGF file) and stores data in dictionary.
-    MGF Format:
-        BEGIN IONS
-        scan=470
-        PEPMASS=473.456
-        ...
-        475.34\t1800
-        ...
-        END IONS
-    '''
-
-    _start_sub = 'BEGIN IONS'
-    _end_sub = 'END IONS'
-    _charge = 'CHARGE={0}'
-
-    def __init__(self, fileobj, mode, **kwargs):
-        super(ParseMgf, self).__init__()
-
-        # bind instance attributes
-        self.fileobj = fileobj
-        self.scan_finder = ScanFinder(self._start_sub,
-                                      self._end_sub)
-        # set parser mode
-        if mode == 'PAVA':
-            # if read/write new string
-            self.parser = self.process_pava_scan
-            self.re_scan = PAVA_PARSER
-            self.data = OUT_FILE
-            self.summary = SUMMARY_FILE
-            self.counters = {'TPP': 0, 'PAVA': 0}
-            self.tpp_data = kwargs.get('TPP')
-        elif mode == 'TPP':
-            # grab charges, don't replace
-            self.data = {}
-            self.parser = self.process_tpp_scan
-            self.re_scan = TPP_PARSER
-
-    def run(self):
-        '''On start. Reads line by line until StopIterationError.
-        Use of next() over readline() is to control exit loop.
-        '''
-
-        # need to write comparative header
-        if hasattr(self, "summary"):
-            self.summary.write('Scan\tMGF\tPAVA\n')
-        chunk = True
-        while chunk:
-            # grab chunks
-            chunk = self.fileobj.read(4096)
-            scans = self.scan_finder.parse_chunk(chunk)
-            for scan in scans:
-                self.parser(scan)
-        # end of charges
-        if hasattr(self, "summary"):
-            tpp_count = 'TPP Scans Above 1: {0}\n'.format(self.counters['TPP'])
-            self.summary.write(tpp_count)
-            pava_count = 'PAVA Scans Above 1: {0}\n'.format(
-                self.counters['PAVA'])
-            self.summary.write(pava_count)
-
-    # ------------------
-    #        MAIN
-    # ------------------
-
-    def process_pava_scan(self, scan_string):
-        '''Processes a single scan and stores the data in self.data.
-        Stores the meta-data directly and then processes the scan
-        spectra via self.process_data(). Processes PAVA-like formats.
-
-        Arguments:
-            scan_string -- string encompassing the full scan
-        '''
-
-        # grab our match
-        match = self.re_scan.split(scan_string)
-        # init return
-        num = int(match[3])
-        tpp_charge = self.tpp_data.get(num, {}).get('precursorCharge')
-        # precursor charge
-        if match[10] is None:
-            charge = 1
-        else:
-            charge = int(match[10])
-        # process changes
-        scan_string = self.replace_charges(scan_string, tpp_charge, charge)
-        # write to file
-        self.write_new_scan(scan_string)
-        # process summary
-        self.adjust_counters(tpp_charge, charge)
-        self.write_line(num, tpp_charge, charge)
+def correct(args, tpp_path, pava_path, out_path, summary, sharding,
+            matching):
+    '''Corrects the PAVA file from the parsed arguments'''
+
+    if args.jobs is not None and args.jobs > 1:
+        with Output(out_path, pipeline=args.pipeline,
+                    splice=args.splice) as out:
+            fix_pava_jobs(tpp_path, pava_path, out, args.jobs, summary)
+        return
+
+    # the cached scans are corrected without a checkpoint
+    inputs = None if args.cache else [tpp_path, pava_path]
+    cache = None
+    if args.cache and not args.splice:
+        cache = SpectrumCache.load(pava_path, 'PAVA')
+    lookups = []
+    with Output(out_path, inputs, args.resume, args.pipeline, sharding,
+                args.splice) as out:
+        with ScanSource(pava_path, out.offset, prefetch=args.pipeline,
+                        cache=cache) as scans:
+            try:
+                tpp_data = None
+                if matching is not None:
+                    # join on RT and m/z rather than the scan numbers
+                    out.track('matches', matching.report)
+                    tpp_data = match_scans(
+                        tpp_path, scans.splitter, matching,
+                        # already reported before the resumed checkpoint
+                        report=not out.resumed)
+                    lookups.append(tpp_data)
+                if args.charge_source != 'tpp':
+                    # raise to the charges inferred from the envelopes
+                    tpp_data = InferredCharges(args.charge_source, tpp_path,
+                                               tpp_data)
+                    lookups.append(tpp_data)
+                if tpp_data is None:
+                    tpp_data = open_lookup(tpp_path, args.stream)
+                    lookups.append(tpp_data)
+                fix_pava(scans, tpp_data, out, summary)
+            finally:
+                for lookup in lookups:
+                    lookup.close()
 
-    def process_tpp_scan(self, scan_string):
-        '''Processes a single scan and stores the data in self.data.
-        Stores the meta-data directly and then processes the scan
-        spectra via self.process_data(). Processes TPP-like formats.
-
-        Arguments:
-            scan_string -- string encompassing the full scan
-        '''
-
-        # grab our match
-        match = self.re_scan.split(scan_string)
-        # init return
-        scan = {}
-        num = int(match[3])
-        self.data[num] = scan
-        # precursor charge
-        if match[8] is None:
-            scan['precursorCharge'] = 1
-        else:
-            scan['precursorCharge'] = int(match[8])
-
-    # ------------------
-    #        UTILS
-    # ------------------
-
-    def replace_charges(self, scan_string, tpp_charge, charge):
-        '''Writes the adjust scan charges back to PAVA file'''
-
-        if tpp_charge is not None:
-            if tpp_charge > charge:
-                old_charge = self._charge.format(charge)
-                new_charge = self._charge.format(tpp_charge)
-                scan_string = scan_string.replace(old_charge, new_charge)
-        return scan_string
-
-    def write_new_scan(self, scan_string):
-        '''Writes the new scan string to file'''
-
-        scan_string = ''.join([scan_string, '\n\n'])
-        # pylint: disable=maybe-no-member
-        self.data.write(scan_string)
-
-    def adjust_counters(self, tpp_charge, pava_charge):
-        '''Toggles the counters depending on the charge states of
-        given scans.
-        '''
-
-        # add counters
-        if tpp_charge != 1:
-            self.counters['TPP'] += 1
-        if pava_charge != 1:
-            self.counters['PAVA'] += 1
-
-    def write_line(self, num, tpp_charge, pava_charge):
-        '''Writes a line if the two charges differ'''
-
-        if tpp_charge != pava_charge:
-            out = '{0}\t{1}\t{2}\n'.format(num, tpp_charge, pava_charge)
-            self.summary.write(out)
 
 # ------------------
 #       MAIN
 # ------------------
 
 
-def main():
+def main(argv=None):
     '''Runs the core tasks'''
 
-    # parse the tpp
-    tpp_cls = ParseMgf(TPP_SCANS, 'TPP')
-    tpp_cls.run()
-    # parse the pava file
-    pava_cls = ParseMgf(PAVA_SCANS, 'PAVA', TPP=tpp_cls.data)
-    pava_cls.run()
-    # grab shared keys
+    args = PARSER.parse_args(argv)
+    if args.watch:
+        out_dir = args.output and os.path.join(PATH, args.output)
+        watch_folder(os.path.join(PATH, args.watch), 'pava', out_dir,
+                     args.summary, args.jobs, args.interval)
+        return
+    if args.batch:
+        out_dir = args.output and os.path.join(PATH, args.output)
+        fix_pava_batch(os.path.join(PATH, args.batch), out_dir,
+                       args.summary, args.jobs)
+        return
+
+    # parse arguments
+    inferred = args.charge_source == 'inferred'
+    if not args.PAVA or not (args.TPP or inferred):
+        raise argparse.ArgumentTypeError("Please include both a PAVA file "
+                                         "and TPP file in the working "
+                                         "directory")
+    tpp_path = None
+    if not inferred:
+        tpp_path = os.path.join(PATH, args.TPP)
+    pava_path = os.path.join(PATH, args.PAVA)
+    base_name = os.path.basename(strip_extension(args.PAVA))
+    base_name = os.path.splitext(base_name)[0]
+    out_path = os.path.join(PATH, base_name + "_corrected.txt")
+    if args.output:
+        out_path = os.path.join(PATH, args.output)
+    if tpp_path is not None and not os.path.exists(tpp_path):
+        raise argparse.ArgumentTypeError("MGF File not found. Make sure it "
+                                         "is in the current working "
+                                         "directory.")
+    if not os.path.exists(pava_path):
+        raise argparse.ArgumentTypeError("PAVA File not found. Make sure it "
+                                         "is in the current working "
+                                         "directory.")
+    parallel = args.jobs is not None and args.jobs > 1
+    if args.resume and (parallel or args.cache or args.splice or
+                        from_extension(out_path)):
+        raise argparse.ArgumentTypeError("Only uncompressed outputs "
+                                         "written without --jobs, --cache "
+                                         "or --splice can be resumed.")
+    sharding = None
+    if args.shards is not None or args.shard_by or args.shard_cuts:
+        try:
+            sharding = Sharding(args.shards, args.shard_by or 'scans',
+                                args.shard_cuts)
+        except ValueError as error:
+            raise argparse.ArgumentTypeError(str(error))
+    if sharding is not None and (parallel or args.splice or args.resume):
+        raise argparse.ArgumentTypeError("Sharded outputs are written "
+                                         "without --jobs, --splice or "
+                                         "--resume.")
+    if args.match and (parallel or args.cache):
+        raise argparse.ArgumentTypeError("Scans are matched without --jobs "
+                                         "or --cache.")
+    if args.match and inferred:
+        raise argparse.ArgumentTypeError("Scans are only matched to the "
+                                         "TPP charges.")
+    if args.charge_source != 'tpp' and (parallel or args.cache):
+        raise argparse.ArgumentTypeError("Charges are inferred without "
+                                         "--jobs or --cache.")
+
+    # reports beside the output, appended to from the checkpoint when
+    # resuming
+    out_dir = os.path.dirname(out_path)
+    mode = 'a' if args.resume else 'w'
+
+    # scan match report
+    matching = None
+    if args.match:
+        try:
+            matching = Matching(args.rt_tolerance, args.ppm)
+        except ValueError as error:
+            raise argparse.ArgumentTypeError(str(error))
+        matching.report = open(os.path.join(out_dir, MATCHES_NAME), mode)
+
+    # summary output
+    summary = None
+    if args.summary:
+        summary = open(os.path.join(out_dir, SUMMARY_NAME), mode)
+    try:
+        correct(args, tpp_path, pava_path, out_path, summary, sharding,
+                matching)
+    finally:
+        if summary is not None:
+            summary.close()
+        if matching is not None:
+            matching.report.close()
 
 if __name__ == '__main__':
-
-    # make write file
-    OUT_FILE = open(OUT_PATH, 'w')
-    # call main tasks
     main()
-    OUT_FILE.close()
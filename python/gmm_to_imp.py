@@ -67,16 +67,6 @@ PARSER.add_argument('-f', "--file", type=str, required=True,
                     help="Full (preferably) or local path to GMM file")
 PARSER.add_argument('-o', "--output", type=str, default="out.gmm.txt",
                     help="Output file")
-ARGS = PARSER.parse_args()
-
-# check arguments
-if os.path.exists(ARGS.file):
-    FILE = ARGS.file
-elif os.path.exists(os.path.join(os.getcwd(), ARGS.file)):
-    FILE = os.path.join(os.getcwd(), ARGS.file)
-else:
-    raise argparse.ArgumentTypeError("Please enter a valid path to a "
-                                     "GMM file.")
 
 # ------------------
 #      FUNCTIONS
@@ -232,17 +222,29 @@ class MakeOutput(GmmParser):
 # ------------------
 
 
-def main():
+def find_file(path):
+    '''Returns the full path to the GMM file'''
+
+    if os.path.exists(path):
+        return path
+    elif os.path.exists(os.path.join(os.getcwd(), path)):
+        return os.path.join(os.getcwd(), path)
+    raise argparse.ArgumentTypeError("Please enter a valid path to a "
+                                     "GMM file.")
+
+
+def main(argv=None):
     '''On init'''
 
-    with open(FILE, 'r') as fileobj:
+    args = PARSER.parse_args(argv)
+    with open(find_file(args.file), 'r') as fileobj:
         cls = MakeOutput(fileobj)
         cls.run()
         cls.write_header()
         cls.write_lines()
         cls.buf.seek(0)         # if not, empty output
 
-    with open(ARGS.output, 'w') as dst:
+    with open(args.output, 'w') as dst:
         shutil.copyfileobj(cls.buf, dst)
 
 if __name__ == '__main__':
@@ -0,0 +1,36 @@
+'''Shared MGF utilities for the Lan Huang Laboratory scripts'''
+
+# load objects/functions
+from .batch import (find_inputs, find_spectra, pair_inputs, run_batch,
+                    write_summary)
+from .cache import SpectrumCache
+from .charges import InferredCharges, infer_charges
+from .checkpoint import Checkpoint
+from .cluster import (Clustering, SpectrumClusterer, cluster_block,
+                      cluster_spectra, consensus_peaks)
+from .compression import (decompress, decompressed_chunks, detect,
+                          open_file)
+from .converters import convert_mgf
+from .coverage import get_coverage, protein_coverage, read_report
+from .dialects import (DIALECTS, Dialect, Header, register, sniff_dialect,
+                       sniff_file)
+from .fixers import (ChargeFixer, FixerChain, FixMgf, PrecursorFixer,
+                     ScanFixer, fix_mgf)
+from .fusion import fix_fusion, fix_fusion_batch, fix_fusion_jobs
+from .header import ScanHeader, tokenize_header
+from .index import ScanIndex
+from .join import MergeJoin, ScanOrderError, open_lookup
+from .masses import MassIndex, neutral_mass
+from .match import Matching, MatchedIndex, ScanMatcher, match_scans
+from .parallel import map_shards, stitch
+from .output import Output, ScanWriter
+from .pava import fix_pava, fix_pava_batch, fix_pava_jobs
+from .peaks import PeakFilter, isotope_peaks, top_per_window
+from .pipeline import ReadAhead, ThreadedWriter
+from .reader import MgfReader, Spectrum, decode_peaks
+from .rewrite import FieldTemplate, HeaderRewriter
+from .scans import ScanSource, ScanSplitter
+from .shards import ShardedWriter, Sharding
+from .splice import SpliceWriter
+from .store import TppScan, TppStore
+from .watch import TppCache, watch_folder
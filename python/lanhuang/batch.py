@@ -0,0 +1,242 @@
+'''Batch pairing and processing of TPP/PAVA files across an experiment'''
+
+# load modules/submodules
+import functools
+import multiprocessing
+import os
+import re
+
+from .compression import open_file, strip_extension
+from .dialects import PAVA, SNIFF_SIZE, TPP, sniff_dialect
+from .scans import START_SUB
+
+
+# CONSTANTS
+# ---------
+
+# sidecars, caches and outputs which are never batch inputs
+SKIPPED = ('.idx', '.cache', '.tmp', '.ckpt', '_corrected.txt',
+           '_charge_states.txt', '_summary.txt')
+# sidecars, caches and indexes which are never spectra, unlike the
+# corrected outputs
+SIDECARS = ('.idx', '.cache', '.tmp', '.ckpt', '.mzidx')
+OUT_SUFFIX = '_corrected.txt'
+SUMMARY_NAME = 'batch_summary.txt'
+
+
+# INPUTS
+# ------
+
+
+def find_inputs(path, skipped=SKIPPED):
+    '''
+    Returns the candidate files for a batch, either every file within
+    a directory, without the `skipped` suffixes, before any compression
+    extension, or each non-empty line of a manifest file.
+    '''
+
+    if os.path.isdir(path):
+        names = sorted(os.listdir(path))
+        paths = [os.path.join(path, i) for i in names
+                 if not i.startswith('.') and
+                 not strip_extension(i).endswith(skipped)]
+        return [i for i in paths if os.path.isfile(i)]
+
+    root = os.path.dirname(os.path.abspath(path))
+    with open(path) as fileobj:
+        lines = (i.strip() for i in fileobj)
+        return [os.path.join(root, i) for i in lines if i]
+
+
+def sniff(path):
+    '''
+    Returns the (dialect name, RAW file name) from the leading scans
+    of path, or (None, None) if it is no registered dialect.
+    '''
+
+    # only the head is decompressed for compressed files
+    with open_file(path, 'rb') as fileobj:
+        head = fileobj.read(SNIFF_SIZE)
+    dialect = sniff_dialect(head)
+    if dialect is None:
+        return None, None
+
+    match = dialect.pattern.match(head, head.find(START_SUB))
+    raw = dialect.header(match).raw
+    # TPP and RV titles hold the full, possibly Windows, path
+    return dialect.name, re.split(r'[\\/]', raw)[-1]
+
+
+def find_spectra(path):
+    '''
+    Returns the MGF files of any registered dialect in a directory or
+    manifest, including the corrected outputs. Files of no recognized
+    dialect, ie, reports, are skipped, while missing manifest entries
+    are kept for the caller to report.
+    '''
+
+    paths = find_inputs(path, SIDECARS)
+    return [i for i in paths if not os.path.isfile(i) or sniff(i)[0]]
+
+
+def pair_inputs(paths):
+    '''
+    Pairs each PAVA file with the TPP file extracted from the same RAW
+    file. Several PAVA variants, ie, _ms2 and _ms3cid, may share a TPP
+    file. Files of any other dialect, or of none, ie, the outputs and
+    reports, are skipped.
+
+    Returns the (tpp, pava) pairs, the unpaired files, ie, PAVA files
+    without a TPP file and missing manifest entries, and the ambiguous
+    files, ie, the TPP files sharing a RAW file name, and the PAVA
+    files of that RAW file, in input order.
+    '''
+
+    tpp = {}
+    pava = []
+    unpaired = []
+    for path in paths:
+        if not os.path.isfile(path):
+            unpaired.append(path)
+            continue
+        dialect, raw = sniff(path)
+        if dialect == TPP.name:
+            tpp.setdefault(raw, []).append(path)
+        elif dialect == PAVA.name:
+            pava.append((raw, path))
+
+    pairs = []
+    ambiguous = set(j for i in tpp.values() if len(i) > 1 for j in i)
+    for raw, path in pava:
+        found = tpp.get(raw, [])
+        if len(found) > 1:
+            ambiguous.add(path)
+        elif found:
+            pairs.append((found[0], path))
+        else:
+            unpaired.append(path)
+
+    return pairs, unpaired, [i for i in paths if i in ambiguous]
+
+
+def batch_directory(path):
+    '''Returns the batch directory, or the directory of the manifest'''
+
+    if os.path.isdir(path):
+        return path
+    return os.path.dirname(path)
+
+
+def output_path(pava, directory=None):
+    '''Returns the corrected output path for a PAVA file in a batch'''
+
+    name = os.path.basename(strip_extension(pava))
+    name = os.path.splitext(name)[0] + OUT_SUFFIX
+    return os.path.join(directory or os.path.dirname(pava), name)
+
+
+# PROCESSING
+# ----------
+
+
+def run_task(worker, task):
+    '''
+    Runs worker on a (tpp, pava, ...) task, returning an error row
+    with the TPP and PAVA paths rather than raising, so one failed
+    pair never stops the batch.
+    '''
+
+    try:
+        return worker(task)
+    except Exception as error:  # pylint: disable=broad-except
+        return {'tpp': task[0], 'pava': task[1], 'error': str(error)}
+
+
+def run_batch(tasks, worker, jobs):
+    '''
+    Maps worker over the tasks in a pool of `jobs` processes, so the
+    interpreter startup is paid once per worker rather than per file.
+    Results are returned in task order, with an error row for each
+    failed task, as returned by run_task().
+    '''
+
+    worker = functools.partial(run_task, worker)
+    if jobs <= 1 or len(tasks) <= 1:
+        return [worker(i) for i in tasks]
+
+    pool = multiprocessing.Pool(min(jobs, len(tasks)))
+    try:
+        return pool.map(worker, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+# SUMMARY
+# -------
+
+
+def write_summary(fileobj, results, fields, unpaired=(), elapsed=None,
+                  ambiguous=()):
+    '''
+    Writes one tab-delimited summary table across a batch, with a
+    throughput column per file and a totals row, followed by the
+    unpaired, ambiguous and failed files.
+
+    Arguments:
+        results -- per-file stats dicts, with 'pava', 'tpp', 'scans',
+            'bytes' and 'seconds' keys along with each of `fields`, or
+            error rows with 'pava', 'tpp' and 'error' keys
+        fields -- counter keys to write for each file
+        unpaired, ambiguous -- files from pair_inputs()
+        elapsed -- batch wall time, for the totals throughput
+    '''
+
+    write_columns(fileobj, fields)
+    done = [i for i in results if 'error' not in i]
+    totals = dict.fromkeys(['scans', 'bytes', 'seconds'] + list(fields), 0)
+    for stats in done:
+        for key in totals:
+            totals[key] += stats[key]
+        write_stats(fileobj, stats, fields)
+
+    if elapsed is not None:
+        totals['seconds'] = elapsed
+    row = ['Total ({0} files)'.format(len(done)), '']
+    fileobj.write('\t'.join(row + _row(totals, fields)) + '\n')
+
+    for path in unpaired:
+        fileobj.write('Unpaired: {0}\n'.format(path))
+    for path in ambiguous:
+        fileobj.write('Ambiguous: {0}\n'.format(path))
+    for stats in results:
+        if 'error' in stats:
+            fileobj.write('Failed: {0}: {1}\n'.format(stats['pava'],
+                                                      stats['error']))
+
+
+def write_columns(fileobj, fields):
+    '''Writes the column names of the summary table'''
+
+    columns = ['PAVA', 'TPP', 'Scans'] + list(fields)
+    columns += ['MB', 'Seconds', 'Scans/s', 'MB/s']
+    fileobj.write('\t'.join(columns) + '\n')
+
+
+def write_stats(fileobj, stats, fields):
+    '''Writes the summary row for a single corrected file'''
+
+    row = [os.path.basename(stats[i]) for i in ('pava', 'tpp')]
+    fileobj.write('\t'.join(row + _row(stats, fields)) + '\n')
+
+
+def _row(stats, fields):
+    '''Formats the counters and throughput for a summary row'''
+
+    megabytes = stats['bytes'] / 1e6
+    seconds = max(stats['seconds'], 1e-9)
+    row = [str(stats['scans'])] + [str(stats[i]) for i in fields]
+    row += ['{0:.2f}'.format(megabytes), '{0:.2f}'.format(stats['seconds']),
+            '{0:.0f}'.format(stats['scans'] / seconds),
+            '{0:.2f}'.format(megabytes / seconds)]
+    return row
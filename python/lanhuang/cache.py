@@ -0,0 +1,233 @@
+'''Binary columnar spectrum cache, so each MGF file is parsed once'''
+
+# load modules/submodules
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .dialects import DIALECTS, Header
+from .reader import MgfReader, Spectrum
+from .scans import ScanSplitter
+
+
+# CONSTANTS
+# ---------
+
+SUFFIX = '.cache'
+VERSION = 2
+
+META = 'meta.json'
+SPECTRA = 'spectra.bin'
+MZ = 'mz.f8'
+INTENSITY = 'intensity.f8'
+
+# header columns, byte offsets into the source file (scan start, peak
+# list start, scan end), and the slice of the concatenated peak arrays
+DTYPE = np.dtype([
+    ('num', '<i4'),
+    ('raw', '<i4'),
+    ('rt', '<f8'),
+    ('mz', '<f8'),
+    ('intensity', '<f8'),
+    ('charge', 'i1'),
+    ('start', '<i8'),
+    ('peaks', '<i8'),
+    ('end', '<i8'),
+    ('peak_start', '<i8'),
+    ('peak_count', '<i4'),
+])
+
+# stored charge of the scans without a CHARGE line, which the
+# Header of each Spectrum still reads as 1+
+MISSING_CHARGE = 0
+
+# rows converted to Python objects at once during iteration
+BLOCK = 4096
+
+
+# HELPERS
+# -------
+
+
+def cache_path(path):
+    '''Returns the cache directory for an MGF file'''
+
+    return path + SUFFIX
+
+
+def _map(path, dtype, count):
+    '''Memory-maps `count` records from path, read-only'''
+
+    if not count:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+# CACHE
+# -----
+
+
+class SpectrumCache(object):
+    '''
+    Columnar cache of an MGF file: one DTYPE row of header columns per
+    scan, and the peak lists concatenated into m/z and intensity arrays.
+    Every column is memory-mapped, so repeat runs read the header
+    fields and copy the original scan text by offset, without running
+    the dialect regexes.
+
+    A missing CHARGE line is stored as MISSING_CHARGE, so a converted
+    scan omits it as from the source file.
+
+    The cache lives in a directory next to the MGF file
+    (`file.mgf.cache`) and is keyed to the MGF size, mtime and dialect.
+    '''
+
+    def __init__(self, path, meta, spectra, mz, intensity):
+        super(SpectrumCache, self).__init__()
+
+        self.path = path
+        self.meta = meta
+        self.raws = meta['raws']
+        self.spectra = spectra
+        self.mz = mz
+        self.intensity = intensity
+        self._splitter = None
+
+    @classmethod
+    def load(cls, path, dialect):
+        '''Loads the cache for path, (re)building it if stale'''
+
+        dialect = DIALECTS.get(dialect, dialect)
+        stat = os.stat(path)
+        directory = cache_path(path)
+        cache = cls._read(path, directory, stat, dialect)
+        if cache is None:
+            cls._write(path, directory, stat, dialect)
+            cache = cls._read(path, directory, stat, dialect)
+
+        return cache
+
+    # ------------------
+    #       ACCESS
+    # ------------------
+
+    def __len__(self):
+        return len(self.spectra)
+
+    def __iter__(self):
+        '''Yields a Spectrum, with peak array views, for each scan'''
+
+        for index in range(0, len(self.spectra), BLOCK):
+            rows = self.spectra[index:index+BLOCK].tolist()
+            for row in rows:
+                yield self._spectrum(row)
+
+    def charges(self):
+        '''Yields the stored charge of each scan, or MISSING_CHARGE'''
+
+        for index in range(0, len(self.spectra), BLOCK):
+            for charge in self.spectra['charge'][index:index+BLOCK].tolist():
+                yield charge
+
+    def __getitem__(self, index):
+        return self._spectrum(self.spectra[index].tolist())
+
+    def _spectrum(self, row):
+        '''Converts a DTYPE row to a Spectrum'''
+
+        (num, raw, rt, mz, intensity, charge, start, peaks, end,
+         peak_start, peak_count) = row
+        header = Header(num, self.raws[raw], rt, mz, intensity,
+                        charge or 1)
+        peak_end = peak_start + peak_count
+        return Spectrum(header, self.mz[peak_start:peak_end],
+                        self.intensity[peak_start:peak_end],
+                        start, peaks, end)
+
+    def text(self, start, end):
+        '''Returns the decoded source text between two byte offsets'''
+
+        if self._splitter is None:
+            self._splitter = ScanSplitter(self.path)
+        start, end = self._splitter.locate(start, end)
+        return self._splitter.text(start, end)
+
+    def close(self):
+        '''Closes the source map opened for text lookups'''
+
+        if self._splitter is not None:
+            self._splitter.close()
+            self._splitter = None
+
+    # ------------------
+    #         I/O
+    # ------------------
+
+    @classmethod
+    def _read(cls, path, directory, stat, dialect):
+        '''Maps the cache columns, returning None if missing or stale'''
+
+        try:
+            with open(os.path.join(directory, META)) as fileobj:
+                meta = json.load(fileobj)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if (meta.get('version') != VERSION or
+                meta.get('dialect') != dialect.name or
+                meta.get('size') != stat.st_size or
+                meta.get('mtime') != stat.st_mtime):
+            return None
+
+        spectra = _map(os.path.join(directory, SPECTRA), DTYPE,
+                       meta['count'])
+        mz = _map(os.path.join(directory, MZ), np.float64, meta['peaks'])
+        intensity = _map(os.path.join(directory, INTENSITY), np.float64,
+                         meta['peaks'])
+        return cls(path, meta, spectra, mz, intensity)
+
+    @staticmethod
+    def _write(path, directory, stat, dialect):
+        '''Parses the MGF file once and writes the columns'''
+
+        temp = directory + '.tmp'
+        if os.path.exists(temp):
+            shutil.rmtree(temp)
+        os.makedirs(temp)
+
+        rows = []
+        raws = {}
+        peak_start = 0
+        with MgfReader(path, dialect, MISSING_CHARGE) as reader:
+            with open(os.path.join(temp, MZ), 'wb') as mz_file:
+                with open(os.path.join(temp, INTENSITY), 'wb') as int_file:
+                    for spectrum in reader:
+                        header = spectrum.header
+                        raw = raws.setdefault(header.raw, len(raws))
+                        count = len(spectrum.mz)
+                        rows.append((header.num, raw, header.rt, header.mz,
+                                     header.intensity, header.charge,
+                                     spectrum.start, spectrum.peaks,
+                                     spectrum.end, peak_start, count))
+                        spectrum.mz.tofile(mz_file)
+                        spectrum.intensity.tofile(int_file)
+                        peak_start += count
+
+        np.array(rows, dtype=DTYPE).tofile(os.path.join(temp, SPECTRA))
+        meta = {
+            'version': VERSION,
+            'dialect': dialect.name,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'count': len(rows),
+            'peaks': peak_start,
+            'raws': sorted(raws, key=raws.get),
+        }
+        with open(os.path.join(temp, META), 'w') as fileobj:
+            json.dump(meta, fileobj)
+
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.rename(temp, directory)
@@ -0,0 +1,205 @@
+'''Charge state inference from the isotope envelope of each precursor'''
+
+# load modules/submodules
+import numpy as np
+
+from .dialects import NAN, PAVA
+from .index import ScanIndex
+from .reader import decode_peaks
+from .scans import END_SUB
+from .store import TppScan
+
+
+# CONSTANTS
+# ---------
+
+# mass difference between the 13C and 12C isotopes
+NEUTRON = 1.0033548
+MAX_CHARGE = 8
+# isotope peaks searched above the precursor, and the fewest
+# consecutive ones found for a conclusive charge
+ISOTOPES = 3
+MIN_ISOTOPES = 2
+PPM_TOLERANCE = 20.0
+# spectra scored per vectorised batch
+BATCH = 4096
+SOURCES = ('tpp', 'inferred', 'both')
+
+
+# INFERENCE
+# ---------
+
+
+def infer_charges(precursors, mzs, intensities, max_charge=MAX_CHARGE,
+                  ppm=PPM_TOLERANCE):
+    '''
+    Scores the charges 1..max_charge of a batch of spectra from the
+    isotope spacing above each precursor m/z, and returns the inferred
+    charges, with 0 for an inconclusive envelope.
+
+    The peaks of the batch are flattened into a single array sorted by
+    spectrum and m/z, so every expected isotope of every candidate
+    charge is found with one binary search. A charge scores the run of
+    consecutive isotopes found, and ties go to the higher charge,
+    whose envelope holds every isotope of the lower charges.
+
+    Arguments:
+        precursors -- precursor m/z of each spectrum, or 0 if missing
+        mzs, intensities -- peak arrays of each spectrum
+        max_charge -- highest candidate charge
+        ppm -- isotope m/z tolerance, in ppm
+    '''
+
+    precursors = np.asarray(precursors, dtype=np.float64)
+    count = len(precursors)
+    charges = np.zeros(count, dtype=np.int64)
+    if not count:
+        return charges
+
+    sizes = [len(i) for i in mzs]
+    owners = np.repeat(np.arange(count), sizes)
+    mz = np.concatenate(mzs) if sizes else np.empty(0)
+    intensity = np.concatenate(intensities) if sizes else np.empty(0)
+    # only the envelope above each precursor is searched
+    lower = precursors[owners] - NEUTRON / (2 * max_charge)
+    upper = precursors[owners] + NEUTRON * (ISOTOPES + 0.5)
+    keep = (mz >= lower) & (mz <= upper) & (intensity > 0)
+    owners = owners[keep]
+    mz = mz[keep]
+
+    # spectra laid end to end on one m/z axis, in spectrum order
+    span = float(np.ceil(precursors.max() + NEUTRON * (ISOTOPES + 1)))
+    keys = np.sort(owners * span + mz)
+    candidates = np.arange(1, max_charge + 1, dtype=np.float64)
+    isotopes = np.arange(1, ISOTOPES + 1, dtype=np.float64)
+    # (spectrum, charge, isotope) expected m/z
+    targets = (precursors[:, None, None] +
+               isotopes[None, None, :] * NEUTRON / candidates[None, :, None])
+    tolerance = targets * ppm * 1e-6
+    targets += (np.arange(count) * span)[:, None, None]
+
+    if len(keys):
+        index = np.searchsorted(keys, targets)
+        right = keys[np.minimum(index, len(keys) - 1)]
+        left = keys[np.maximum(index - 1, 0)]
+        found = ((np.abs(right - targets) <= tolerance) |
+                 (np.abs(left - targets) <= tolerance))
+    else:
+        found = np.zeros(targets.shape, dtype=bool)
+
+    # consecutive isotopes from the first, for each charge
+    runs = np.cumprod(found, axis=2).sum(axis=2)
+    # the last of the best-scoring charges, ie, the highest
+    best = max_charge - 1 - np.argmax(runs[:, ::-1], axis=1)
+    conclusive = ((runs[np.arange(count), best] >= MIN_ISOTOPES) &
+                  (precursors > 0))
+    charges[conclusive] = best[conclusive] + 1
+    return charges
+
+
+# SOURCE
+# ------
+
+
+class InferredCharges(object):
+    '''
+    Drop-in replacement for ScanIndex.get() which returns the charge
+    inferred from the isotope envelope of the PAVA scan being
+    corrected, for the charge sources:
+        'inferred' -- the inferred charge only, without a TPP file
+        'both' -- the inferred charge, or the TPP charge when the
+            envelope is inconclusive
+
+    The ScanSource of the PAVA scans must be listened to, so a batch
+    of scans is inferred ahead of the parser. The TPP scans of 'both'
+    may be a MatchedIndex, which is pointed at each scan in turn.
+
+    Arguments:
+        source -- 'inferred' or 'both'
+        tpp_path -- TPP file for 'both'
+        tpp_data -- loaded TPP scans, or None to load them
+        batch -- scans inferred per batch
+    '''
+
+    def __init__(self, source='inferred', tpp_path=None, tpp_data=None,
+                 batch=BATCH):
+        super(InferredCharges, self).__init__()
+
+        if source not in SOURCES[1:]:
+            raise ValueError("Unknown inferred charge source: {0}".format(
+                source))
+        self.source = source
+        self.batch = batch
+        self.owned = False
+        if source == 'both' and tpp_data is None:
+            tpp_data = ScanIndex.load(tpp_path)
+            self.owned = True
+        self.tpp_data = tpp_data if source == 'both' else None
+        # the followed TPP scans, ie, a MatchedIndex
+        self._follow = getattr(self.tpp_data, 'before_scan', None)
+        # PAVA scan offset -> inferred charge, for the current batch
+        self.charges = {}
+        self.current = None
+        self.inferred = 0
+
+    def get(self, num, default=None):
+        '''Returns a TppScan with the charge for the current scan'''
+
+        tpp_scan = None
+        if self.tpp_data is not None:
+            tpp_scan = self.tpp_data.get(num)
+        charge = self.charges.get(self.current)
+        if not charge:
+            return default if tpp_scan is None else tpp_scan
+        if tpp_scan is None:
+            return TppScan(num, None, NAN, NAN, charge, NAN)
+        return tpp_scan._replace(charge=charge)
+
+    def before_scan(self, offset):
+        '''Points the charges at the PAVA scan being corrected'''
+
+        self.current = offset
+        if self._follow is not None:
+            self._follow(offset)
+
+    def read_ahead(self, batch):
+        '''Infers the charges of a batch of scans ahead of the parser'''
+
+        self.infer(batch)
+
+    def infer(self, batch):
+        '''
+        Infers the charges of a batch of PAVA scans, given as their
+        (start, end) offsets within a buffer, the buffer, a view of it,
+        and its offset within the file.
+        '''
+
+        precursors = []
+        mzs = []
+        intensities = []
+        for start, end, buf, _, _ in batch:
+            match = PAVA.match(buf, start)
+            precursors.append(float(match.group(PAVA.groups['mz'])))
+            mz, intensity = decode_peaks(buf, match.end(),
+                                         end - len(END_SUB))
+            mzs.append(mz)
+            intensities.append(intensity)
+
+        charges = infer_charges(precursors, mzs, intensities)
+        self.charges = dict(zip((i[4] + i[0] for i in batch),
+                                charges.tolist()))
+        self.inferred += int(np.count_nonzero(charges))
+
+    @property
+    def counters(self):
+        '''Inferred charge count, and the counters of the TPP scans'''
+
+        counters = dict(getattr(self.tpp_data, 'counters', {}))
+        counters['inferred'] = self.inferred
+        return counters
+
+    def close(self):
+        '''Closes the TPP index, if it was loaded for the charges'''
+
+        if self.owned:
+            self.tpp_data.close()
@@ -0,0 +1,236 @@
+'''Checkpoints and atomic outputs for resuming interrupted corrections'''
+
+# load modules/submodules
+import hashlib
+import io
+import json
+import os
+
+from .compression import open_file
+from .scans import ENCODING
+
+
+# CONSTANTS
+# ---------
+
+SUFFIX = '.ckpt'
+TEMP_SUFFIX = '.tmp'
+VERSION = 1
+# input bytes between checkpoints
+INTERVAL = 64 << 20
+# leading bytes of each input hashed into the fingerprint
+FINGERPRINT_SIZE = 1 << 16
+
+
+# HELPERS
+# -------
+
+
+def temp_path(path):
+    '''Returns the temporary path an output is written to'''
+
+    return path + TEMP_SUFFIX
+
+
+def checkpoint_path(path):
+    '''Returns the checkpoint sidecar path for an output'''
+
+    return path + SUFFIX
+
+
+def replace_file(src, dst):
+    '''Atomically renames src to dst, where the platform allows'''
+
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def fingerprint(paths):
+    '''
+    Hashes the size, mtime and leading bytes of each input, which
+    detects a replaced or re-exported input without reading the full
+    file.
+    '''
+
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        key = '{0}:{1!r}\n'.format(stat.st_size, stat.st_mtime)
+        digest.update(key.encode('ascii'))
+        with open(path, 'rb') as fileobj:
+            digest.update(fileobj.read(FINGERPRINT_SIZE))
+    return digest.hexdigest()
+
+
+def _sync(fileobj):
+    '''Flushes fileobj through to the disk, where it has a descriptor'''
+
+    fileobj.flush()
+    try:
+        os.fsync(fileobj.fileno())
+    except (AttributeError, IOError, OSError, io.UnsupportedOperation):
+        pass
+
+
+# CHECKPOINT
+# ----------
+
+
+class Checkpoint(object):
+    '''
+    Periodically records the progress of a correction next to its
+    output (`out.txt.ckpt`): the input byte offset of the next scan,
+    the byte offset of each output file, the counters, and a
+    fingerprint of the inputs. The state is only resumed from while
+    the inputs are unchanged.
+
+    Arguments:
+        path -- final output path
+        inputs -- input paths to fingerprint
+        interval -- input bytes between checkpoints
+    '''
+
+    def __init__(self, path, inputs, interval=INTERVAL):
+        super(Checkpoint, self).__init__()
+
+        self.path = path
+        self.interval = interval
+        self.inputs = fingerprint(inputs)
+        # saved state resumed from, or None for a fresh start
+        self.state = None
+        self.files = {}
+        self.counters = {}
+        self._last = 0
+
+    @property
+    def offset(self):
+        '''Input offset to resume from'''
+
+        if self.state is None:
+            return 0
+        return self.state['input']
+
+    def load(self):
+        '''Loads the saved state, or None if missing or stale'''
+
+        try:
+            with open(checkpoint_path(self.path)) as fileobj:
+                state = json.load(fileobj)
+            size = os.path.getsize(temp_path(self.path))
+        except (IOError, OSError, ValueError):
+            return None
+
+        if state.get('version') != VERSION or state['inputs'] != self.inputs:
+            return None
+        if size < state['files'].get('out', 0):
+            # the temporary output lost data
+            return None
+        self.state = state
+        return state
+
+    # ------------------
+    #      PROGRESS
+    # ------------------
+
+    def open(self, files):
+        '''
+        Tracks the named output files, truncating them back to the
+        saved state when resuming, or else to empty.
+        '''
+
+        self.files = files
+        self.rewind()
+
+    def track(self, name, fileobj):
+        '''
+        Tracks another output file, truncating it back to the saved
+        state when resuming, or else to empty.
+        '''
+
+        self.files[name] = fileobj
+        self._truncate(name, fileobj)
+
+    def attach(self, counters):
+        '''Tracks the counters, restoring the saved ones'''
+
+        self.counters = counters
+        if self.state is not None:
+            counters.update(self.state['counters'])
+
+    def rewind(self):
+        '''Truncates the output files back to the resumed state'''
+
+        for name, fileobj in self.files.items():
+            self._truncate(name, fileobj)
+        self._last = self.offset
+
+    def _truncate(self, name, fileobj):
+        '''Truncates the named output file back to the resumed state'''
+
+        offset = 0
+        if self.state is not None:
+            offset = self.state['files'].get(name, 0)
+        fileobj.truncate(offset)
+        fileobj.seek(0, os.SEEK_END)
+
+    def update(self, offset):
+        '''Saves a checkpoint once `interval` input bytes were read'''
+
+        if offset - self._last >= self.interval:
+            self.save(offset)
+
+    def save(self, offset):
+        '''Saves the state, with every scan before offset written'''
+
+        files = {}
+        for name, fileobj in self.files.items():
+            _sync(fileobj)
+            files[name] = fileobj.tell()
+        state = {
+            'version': VERSION,
+            'inputs': self.inputs,
+            'input': offset,
+            'files': files,
+            'counters': dict(self.counters),
+        }
+        path = checkpoint_path(self.path)
+        with open(path + TEMP_SUFFIX, 'w') as fileobj:
+            json.dump(state, fileobj)
+        replace_file(path + TEMP_SUFFIX, path)
+        self._last = offset
+
+    def remove(self):
+        '''Removes the checkpoint once the output is complete'''
+
+        path = checkpoint_path(self.path)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# OUTPUT
+# ------
+
+
+def open_output(path, checkpoint=None):
+    '''
+    Opens the temporary file for the output path, compressed by the
+    extension of path. The temporary file is reopened in place when
+    resuming from the checkpoint.
+    '''
+
+    temp = temp_path(path)
+    if checkpoint is not None and checkpoint.state is not None:
+        return io.open(temp, 'r+', encoding=ENCODING, newline='')
+    return open_file(temp, 'w', encoding=ENCODING, newline='', name=path)
+
+
+def commit_output(path, checkpoint=None):
+    '''Moves the complete temporary output to path'''
+
+    replace_file(temp_path(path), path)
+    if checkpoint is not None:
+        checkpoint.remove()
@@ -0,0 +1,554 @@
+'''Near-duplicate spectrum clustering across MGF files, by MinHash LSH'''
+
+from __future__ import division
+
+# load modules/submodules
+import mmap
+import os
+import tempfile
+
+import numpy as np
+
+from .checkpoint import replace_file, temp_path
+from .compression import open_file
+from .dialects import sniff_file
+from .reader import decode_peaks
+from .scans import ENCODING, END_SUB, ScanSplitter
+
+
+# CONSTANTS
+# ---------
+
+# precursor m/z tolerance, in ppm, of spectra in one cluster
+PPM_TOLERANCE = 10.0
+# cosine similarity of the binned vectors to join two spectra
+SIMILARITY = 0.7
+# m/z bin width of the sparse vectors and hashed peaks
+BIN_WIDTH = 1.0005
+# most intense peaks hashed, and kept in the binned vectors
+HASH_PEAKS = 20
+VECTOR_PEAKS = 50
+# MinHash functions, and rows of each LSH band
+HASHES = 16
+ROWS = 1
+SEED = 0
+# fragment m/z tolerance for merging consensus peaks, and the fraction
+# of the cluster a consensus peak must be found in
+FRAGMENT_TOLERANCE = 0.02
+PEAK_FRACTION = 0.5
+# spectra clustered per precursor block, which bounds the memory
+BLOCK = 8192
+MODES = ('representative', 'consensus')
+# Mersenne prime modulus of the hash functions
+PRIME = (1 << 31) - 1
+TABLE_SUFFIX = '.spectra'
+REPORT_COLUMNS = ['Cluster', 'Size', 'File', 'Scan', 'm/z', 'Charge',
+                  'Representative']
+COUNTERS = ['spectra', 'clusters', 'merged']
+# stored charge of the scans without a CHARGE line, which are only
+# clustered with each other, rather than with the 1+ scans
+MISSING_CHARGE = 0
+
+# one row per input scan, written to disk during the first pass
+DTYPE = np.dtype([
+    ('file', '<i4'),
+    ('num', '<i4'),
+    ('mz', '<f8'),
+    ('charge', 'i1'),
+    ('start', '<i8'),
+    ('peaks', '<i8'),
+    ('end', '<i8'),
+])
+
+
+# HELPERS
+# -------
+
+
+def _expand(starts, sizes):
+    '''Returns the owner and position of every item of the given ranges'''
+
+    owners = np.repeat(np.arange(len(sizes)), sizes)
+    offsets = np.cumsum(sizes) - sizes
+    positions = np.repeat(starts - offsets, sizes) + np.arange(len(owners))
+    return owners, positions
+
+
+def _ranked(mzs, intensities):
+    '''
+    Flattens the peak lists of a block, ordered by spectrum and
+    descending intensity, and returns the owners, m/z, intensities
+    and the intensity rank of each peak within its spectrum.
+    '''
+
+    sizes = [len(i) for i in mzs]
+    owners = np.repeat(np.arange(len(mzs)), sizes)
+    mz = np.concatenate(mzs) if sizes else np.empty(0)
+    intensity = np.concatenate(intensities) if sizes else np.empty(0)
+    order = np.lexsort((-intensity, owners))
+    owners = owners[order]
+    rank = np.arange(len(owners)) - np.searchsorted(owners, owners)
+    return owners, mz[order], intensity[order], rank
+
+
+def _links(keys, charges, precursors, tolerance):
+    '''
+    Returns the (i, j) spectra sharing a bucket key and charge, linking
+    each spectrum to the next one of its bucket by precursor m/z, if
+    within the tolerance.
+    '''
+
+    order = np.lexsort((precursors, keys, charges))
+    keys = keys[order]
+    charges = charges[order]
+    precursors = precursors[order]
+    same = ((keys[1:] == keys[:-1]) & (charges[1:] == charges[:-1]) &
+            (precursors[1:] - precursors[:-1] <= tolerance[order][1:]))
+    return order[:-1][same], order[1:][same]
+
+
+def _components(count, left, right):
+    '''Labels the connected components of the edges, by lowest member'''
+
+    labels = np.arange(count)
+    while len(left):
+        lowest = np.minimum(labels[left], labels[right])
+        before = labels.copy()
+        np.minimum.at(labels, left, lowest)
+        np.minimum.at(labels, right, lowest)
+        # point every label at its root
+        labels = labels[labels]
+        if np.array_equal(labels, before):
+            break
+    return labels
+
+
+# CLUSTERING
+# ----------
+
+
+class Clustering(object):
+    '''
+    Settings for clustering the near-duplicate spectra of an
+    experiment, ie, the same precursor fragmented across fractions
+    and technical replicates.
+
+    Arguments:
+        ppm -- precursor m/z tolerance, in ppm
+        similarity -- cosine of the binned vectors to join two spectra
+        mode -- emit the 'representative' or the 'consensus' spectrum
+            of each cluster
+        width -- m/z bin width of the vectors and hashed peaks
+        hashes -- MinHash functions, a multiple of rows
+        rows -- hash rows per LSH band
+        seed -- seed of the hash functions
+        report -- file object for the cluster of every spectrum, or
+            None
+    '''
+
+    def __init__(self, ppm=PPM_TOLERANCE, similarity=SIMILARITY,
+                 mode='representative', width=BIN_WIDTH, hashes=HASHES,
+                 rows=ROWS, seed=SEED, report=None):
+        super(Clustering, self).__init__()
+
+        if ppm <= 0 or width <= 0:
+            raise ValueError("Clustering tolerances must be positive")
+        if not 0 < similarity <= 1:
+            raise ValueError("Cosine similarity must be within (0, 1]")
+        if mode not in MODES:
+            raise ValueError("Unknown cluster output: {0}".format(mode))
+        if rows < 1 or hashes < rows or hashes % rows:
+            raise ValueError("MinHash functions must be a multiple of the "
+                             "band rows")
+        self.ppm = ppm
+        self.similarity = similarity
+        self.mode = mode
+        self.width = width
+        self.rows = rows
+        self.report = report
+        # (a * bin + b) % PRIME
+        state = np.random.RandomState(seed)
+        self.a = state.randint(1, PRIME, size=hashes).astype(np.int64)
+        self.b = state.randint(0, PRIME, size=hashes).astype(np.int64)
+
+    def tolerance(self, mz):
+        '''Returns the precursor tolerance at mz, in m/z'''
+
+        return mz * self.ppm * 1e-6
+
+
+def cluster_block(precursors, charges, mzs, intensities, clustering):
+    '''
+    Clusters a block of spectra, sorted by charge and precursor m/z,
+    and returns the cluster label of each spectrum,
+    the lowest index within its cluster, and the summed intensity of
+    each spectrum.
+
+    Each spectrum is hashed into a MinHash signature of the bins of its
+    most intense peaks, and the signature split into LSH bands. The
+    spectra sharing a band within the precursor tolerance are
+    candidates, joined if the cosine of their binned, square-root
+    scaled vectors reaches the similarity.
+
+    Arguments:
+        precursors -- precursor m/z of each spectrum
+        charges -- charge of each spectrum
+        mzs, intensities -- peak arrays of each spectrum
+        clustering -- Clustering settings
+    '''
+
+    precursors = np.asarray(precursors, dtype=np.float64)
+    charges = np.asarray(charges)
+    count = len(precursors)
+    owners, mz, intensity, rank = _ranked(mzs, intensities)
+    totals = np.bincount(owners, intensity, minlength=count)
+    bins = np.floor(mz / clustering.width).astype(np.int64)
+
+    # MinHash signatures over the hashed peak bins
+    hashed = rank < HASH_PEAKS
+    values = ((bins[hashed, None] * clustering.a + clustering.b) % PRIME)
+    signatures = np.full((count, len(clustering.a)), PRIME, dtype=np.int64)
+    np.minimum.at(signatures, owners[hashed], values)
+    # spectra without peaks never share a bucket
+    empty = np.bincount(owners, minlength=count) == 0
+    signatures[empty] = -1 - np.arange(count)[empty, None]
+
+    # candidate pairs from each band
+    tolerance = clustering.tolerance(precursors)
+    left = []
+    right = []
+    for band in range(0, signatures.shape[1], clustering.rows):
+        keys = np.zeros(count, dtype=np.int64)
+        for column in range(band, band + clustering.rows):
+            # wraps for more than 2 rows, colliding only more often
+            keys = keys * PRIME + signatures[:, column]
+        pairs = _links(keys, charges, precursors, tolerance)
+        left.append(pairs[0])
+        right.append(pairs[1])
+    left = np.concatenate(left)
+    right = np.concatenate(right)
+    if len(left):
+        pairs = np.unique(np.minimum(left, right) * count +
+                          np.maximum(left, right))
+        left, right = pairs // count, pairs % count
+
+    # binned vectors, unit length, as sorted (spectrum, bin) keys
+    kept = rank < VECTOR_PEAKS
+    span = int(bins[kept].max()) + 1 if kept.any() else 1
+    keys, inverse = np.unique(owners[kept] * span + bins[kept],
+                              return_inverse=True)
+    weights = np.bincount(inverse.ravel(), np.sqrt(intensity[kept]))
+    vector_owners = keys // span
+    norms = np.sqrt(np.bincount(vector_owners, weights ** 2,
+                                minlength=count))
+    weights = weights / np.where(norms, norms, 1)[vector_owners]
+    starts = np.searchsorted(vector_owners, np.arange(count))
+    sizes = np.bincount(vector_owners, minlength=count)
+
+    # cosine of every candidate pair, by its shared bins
+    cosines = np.zeros(len(left))
+    if len(left):
+        pair, first = _expand(starts[left], sizes[left])
+        other, second = _expand(starts[right], sizes[right])
+        _, a, b = np.intersect1d(
+            pair * span + keys[first] % span,
+            other * span + keys[second] % span,
+            assume_unique=True, return_indices=True)
+        cosines = np.bincount(pair[a], weights[first[a]] * weights[second[b]],
+                              minlength=len(left))
+    joined = cosines >= clustering.similarity
+    labels = _components(count, left[joined], right[joined])
+    return labels, totals
+
+
+def consensus_peaks(mzs, intensities, tolerance=FRAGMENT_TOLERANCE,
+                    fraction=PEAK_FRACTION):
+    '''
+    Merges the peak lists of a cluster into a consensus peak list,
+    grouping the pooled peaks within the fragment tolerance of their
+    neighbours. A group found in at least `fraction` of the spectra
+    becomes a peak at its intensity-weighted m/z, with the mean
+    intensity across the cluster.
+    '''
+
+    mz = np.concatenate(mzs)
+    intensity = np.concatenate(intensities)
+    order = np.argsort(mz, kind='mergesort')
+    mz = mz[order]
+    intensity = intensity[order]
+    groups = np.concatenate([[0], np.cumsum(np.diff(mz) > tolerance)])
+    found = np.bincount(groups)
+    total = np.bincount(groups, intensity)
+    center = np.bincount(groups, mz * intensity) / np.where(total, total, 1)
+    keep = found >= max(fraction * len(mzs), 1)
+    return center[keep], total[keep] / len(mzs)
+
+
+# CLUSTERER
+# ---------
+
+
+class SpectrumClusterer(object):
+    '''
+    Clusters the near-duplicate spectra across many MGF files of one
+    dialect, and writes one spectrum per cluster.
+
+    The scans of every file are indexed in a first pass to a table on
+    disk, one row per scan, at charge 0 without a CHARGE line, so they
+    form their own group. The table is then sorted by charge and
+    precursor m/z, and clustered in blocks of nearby precursors,
+    decoding only the peak lists of the current block, so the memory
+    is bounded by the block size and the sort order. Clusters touching
+    the end of a block full to its size are carried into the next.
+    Every input stays mapped for the run. Compressed inputs cannot be
+    mapped, so their scans are copied out of the decompressed stream
+    while indexing, to an anonymous spill file beside the table, which
+    is mapped instead, and costs their decompressed size in disk space.
+
+    Arguments:
+        paths -- MGF files
+        clustering -- Clustering settings
+        block -- spectra clustered per block
+    '''
+
+    def __init__(self, paths, clustering, block=BLOCK):
+        super(SpectrumClusterer, self).__init__()
+
+        self.paths = paths
+        self.clustering = clustering
+        self.block = block
+        self.dialect = None
+        for path in paths:
+            dialect = sniff_file(path)
+            if dialect is None:
+                raise ValueError("Unrecognized MGF dialect: {0}".format(
+                    path))
+            if self.dialect not in (None, dialect):
+                raise ValueError("Cannot cluster {0} with {1} files".format(
+                    dialect.name, self.dialect.name))
+            self.dialect = dialect
+        self.splitters = []
+        # mapped file of each input, by file id
+        self.maps = []
+        self.spill = None
+        self.spill_map = None
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._peaks = None
+
+    # ------------------
+    #       INDEX
+    # ------------------
+
+    def index(self, table_path):
+        '''Writes a DTYPE row for every scan to table_path'''
+
+        count = 0
+        spilled = 0
+        with open(table_path, 'wb') as fileobj:
+            for file_id, path in enumerate(self.paths):
+                splitter = ScanSplitter(path)
+                self.splitters.append(splitter)
+                streamed = splitter.compression is not None
+                if streamed and self.spill is None:
+                    self.spill = tempfile.TemporaryFile(
+                        dir=os.path.dirname(os.path.abspath(table_path)))
+                rows = []
+                for start, end in splitter:
+                    match = self.dialect.match(splitter.map, start)
+                    header = self.dialect.header(match, MISSING_CHARGE)
+                    # offsets into the mapped file, or the spill file
+                    shift = 0
+                    if streamed:
+                        shift = spilled - start
+                        self.spill.write(splitter.view[start:end])
+                        spilled += end - start
+                    rows.append((file_id, header.num, header.mz,
+                                 header.charge, start + shift,
+                                 match.end() + shift, end + shift))
+                    if len(rows) >= self.block:
+                        np.array(rows, dtype=DTYPE).tofile(fileobj)
+                        count += len(rows)
+                        rows = []
+                np.array(rows, dtype=DTYPE).tofile(fileobj)
+                count += len(rows)
+
+        self.spill_map = b''
+        if spilled:
+            self.spill.flush()
+            self.spill_map = mmap.mmap(self.spill.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+        self.maps = [self.spill_map if i.compression is not None else i.map
+                     for i in self.splitters]
+        return count
+
+    # ------------------
+    #     CLUSTERING
+    # ------------------
+
+    def run(self, out, table_path):
+        '''Clusters the indexed scans, writing each cluster to out'''
+
+        count = self.index(table_path)
+        self.counters['spectra'] = count
+        if not count:
+            return
+        table = np.memmap(table_path, dtype=DTYPE, mode='r', shape=(count,))
+        order = np.lexsort((table['mz'], table['charge']))
+        precursors = table['mz'][order]
+        charges = table['charge'][order]
+        # runs of one charge without a gap beyond the tolerance
+        gaps = ((charges[1:] != charges[:-1]) |
+                (np.diff(precursors) >
+                 self.clustering.tolerance(precursors[1:])))
+        breaks = np.append(np.flatnonzero(gaps) + 1, count)
+
+        carry = np.empty(0, dtype=np.int64)
+        lower = 0
+        while lower < count or len(carry):
+            # whole runs up to the block size, or a cut into a long run
+            limit = lower + self.block - len(carry)
+            stop = breaks[np.searchsorted(breaks, lower, 'right')]
+            index = np.searchsorted(breaks, limit, 'right')
+            upper = breaks[index - 1] if index else lower
+            if upper <= lower:
+                upper = min(stop, limit)
+            positions = np.concatenate([carry, np.arange(lower, upper)])
+            rows = table[order[positions]]
+            labels, totals = self._cluster(rows)
+
+            done = np.ones(len(positions), dtype=bool)
+            if upper < stop and len(carry) < self.block // 2:
+                # clusters within the tolerance of the next scan may
+                # grow in the next block
+                tail = (precursors[upper] - precursors[positions] <=
+                        self.clustering.tolerance(precursors[upper]))
+                done = ~np.isin(labels, labels[tail])
+            self._write(out, rows, labels, totals, np.flatnonzero(done))
+            carry = positions[~done]
+            lower = upper
+        del table
+
+    def _cluster(self, rows):
+        '''Decodes the peak lists of the rows, and clusters them'''
+
+        mzs = []
+        intensities = []
+        for row in rows.tolist():
+            buf = self.maps[row[0]]
+            mz, intensity = decode_peaks(buf, row[5], row[6] - len(END_SUB))
+            mzs.append(mz)
+            intensities.append(intensity)
+        self._peaks = mzs, intensities
+        return cluster_block(rows['mz'], rows['charge'], mzs, intensities,
+                             self.clustering)
+
+    # ------------------
+    #       OUTPUT
+    # ------------------
+
+    def _write(self, out, rows, labels, totals, indexes):
+        '''
+        Writes the representative or consensus spectrum of each cluster
+        of the rows at indexes within the block.
+        '''
+
+        # most intense member first, within each cluster
+        indexes = indexes[np.lexsort((-totals[indexes], labels[indexes]))]
+        labels = labels[indexes]
+        first = np.ones(len(labels), dtype=bool)
+        first[1:] = labels[1:] != labels[:-1]
+        starts = np.flatnonzero(first)
+        ends = np.append(starts[1:], len(labels))
+        mzs, intensities = self._peaks
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            members = indexes[start:end]
+            self.counters['clusters'] += 1
+            self.counters['merged'] += len(members) - 1
+            head = rows[members[0]].tolist()
+            buf = self.maps[head[0]]
+            if self.clustering.mode == 'consensus' and len(members) > 1:
+                mz, intensity = consensus_peaks(
+                    [mzs[i] for i in members.tolist()],
+                    [intensities[i] for i in members.tolist()])
+                # the line terminator of the header
+                newline = ('\r\n' if buf[head[5]-2:head[5]] == b'\r\n'
+                           else '\n')
+                peaks = ''.join('{0:.4f} {1:.1f}{2}'.format(i, j, newline)
+                                for i, j in zip(mz.tolist(),
+                                                intensity.tolist()))
+                text = (buf[head[4]:head[5]].decode(ENCODING) + peaks +
+                        END_SUB.decode(ENCODING))
+            else:
+                text = buf[head[4]:head[6]].decode(ENCODING)
+            out.write(text + '\n\n')
+            self._report(rows[members])
+
+    def _report(self, rows):
+        '''Writes a report line for each spectrum of a cluster'''
+
+        report = self.clustering.report
+        if report is None:
+            return
+        for index, row in enumerate(rows.tolist()):
+            line = [self.counters['clusters'], len(rows),
+                    os.path.basename(self.paths[row[0]]), row[1], row[2],
+                    row[3], 'yes' if not index else '']
+            report.write('\t'.join(str(i) for i in line) + '\n')
+
+    def write_counters(self, report):
+        '''Writes the cluster counts at the end of the report'''
+
+        report.write('Spectra: {0}\n'.format(self.counters['spectra']))
+        report.write('Clusters: {0}\n'.format(self.counters['clusters']))
+        report.write('Merged: {0}\n'.format(self.counters['merged']))
+
+    def close(self):
+        '''Closes the mapped MGF files, and the spill file'''
+
+        self.maps = []
+        splitters, self.splitters = self.splitters, []
+        for splitter in splitters:
+            splitter.close()
+        if isinstance(self.spill_map, mmap.mmap):
+            self.spill_map.close()
+        self.spill_map = None
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+
+# API
+# ---
+
+
+def cluster_spectra(paths, out_path, clustering, block=BLOCK):
+    '''
+    Clusters the near-duplicate spectra across MGF files of the same
+    dialect, and writes one spectrum per cluster to out_path, returning
+    the counters.
+
+    Arguments:
+        paths -- MGF files, optionally compressed
+        out_path -- output file, compressed by its extension
+        clustering -- Clustering settings and report
+        block -- spectra clustered per block
+    '''
+
+    report = clustering.report
+    if report is not None:
+        report.write('\t'.join(REPORT_COLUMNS) + '\n')
+    table_path = temp_path(out_path + TABLE_SUFFIX)
+    clusterer = SpectrumClusterer(paths, clustering, block)
+    out = open_file(temp_path(out_path), 'w', encoding=ENCODING, newline='',
+                    name=out_path)
+    try:
+        clusterer.run(out, table_path)
+    finally:
+        out.close()
+        clusterer.close()
+        if os.path.exists(table_path):
+            os.remove(table_path)
+    replace_file(temp_path(out_path), out_path)
+    if report is not None:
+        clusterer.write_counters(report)
+    return clusterer.counters
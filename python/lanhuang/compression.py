@@ -0,0 +1,370 @@
+'''Transparent gzip, bzip2 and xz file I/O, detected by magic bytes'''
+
+# load modules/submodules
+import bz2
+import gzip
+import io
+import multiprocessing
+import os
+import struct
+import zlib
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    import lzma
+except ImportError:
+    # Python 2, without backports.lzma
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from .pipeline import ThreadedWriter
+
+
+# CONSTANTS
+# ---------
+
+GZIP = 'gzip'
+BZIP2 = 'bzip2'
+XZ = 'xz'
+
+MAGIC = (
+    (GZIP, b'\x1f\x8b'),
+    (BZIP2, b'BZh'),
+    (XZ, b'\xfd7zXZ\x00'),
+)
+MAGIC_SIZE = max(len(i) for _, i in MAGIC)
+
+EXTENSIONS = {
+    '.gz': GZIP,
+    '.bgz': GZIP,
+    '.bz2': BZIP2,
+    '.xz': XZ,
+}
+
+# gzip member with FEXTRA set, as written by bgzip and samtools
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+BGZF_SUBFIELD = b'BC'
+SHORT = struct.Struct('<H')
+# decompress gzip members, with the header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+COMPRESS_LEVEL = 6
+READ_CHUNK = 1 << 20
+# compressed bytes of BGZF members inflated at once
+BGZF_WINDOW = 4 << 20
+
+
+# DETECTION
+# ---------
+
+
+def detect(path):
+    '''Returns the compression of path from its magic bytes, or None'''
+
+    with open(path, 'rb') as fileobj:
+        head = fileobj.read(MAGIC_SIZE)
+    for kind, magic in MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def from_extension(path):
+    '''Returns the compression implied by the extension of path, or None'''
+
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def strip_extension(path):
+    '''Removes a compression extension from path, ie, "a.mgf.gz" -> "a.mgf"'''
+
+    if from_extension(path) is not None:
+        return os.path.splitext(path)[0]
+    return path
+
+
+def _check(kind):
+    if kind == XZ and lzma is None:
+        raise IOError("xz files require the lzma module, or "
+                      "backports.lzma on Python 2")
+
+
+# READING
+# -------
+
+
+def _stream(path, kind):
+    '''Opens a streaming binary reader over the decompressed file'''
+
+    _check(kind)
+    if kind == GZIP:
+        # reads every concatenated member
+        return gzip.GzipFile(path, 'rb')
+    elif kind == BZIP2:
+        return bz2.BZ2File(path, 'rb')
+    return lzma.LZMAFile(path, 'rb')
+
+
+def bgzf_members(data, partial=False):
+    '''
+    Returns the (start, end) offsets of each member of BGZF-compressed
+    data, from the block size stored in each member header, or None if
+    any member lacks it, as in plain multi-member gzip.
+
+    With `partial`, data may end within a member, ie, a window read
+    from the file, and only the complete members are returned.
+    '''
+
+    members = []
+    offset = 0
+    while offset < len(data):
+        if partial and offset + 12 > len(data):
+            break
+        if data[offset:offset+4] != BGZF_MAGIC:
+            return None
+        # XLEN, then the subfields, follow the 10-byte member header
+        extra = offset + 12
+        extra_end = extra + SHORT.unpack_from(data, offset + 10)[0]
+        if partial and extra_end > len(data):
+            break
+        size = None
+        while extra + 4 <= extra_end:
+            length = SHORT.unpack_from(data, extra + 2)[0]
+            if data[extra:extra+2] == BGZF_SUBFIELD and length == 2:
+                size = SHORT.unpack_from(data, extra + 4)[0] + 1
+            extra += 4 + length
+        if size is None:
+            return None
+        if partial and offset + size > len(data):
+            break
+        members.append((offset, offset + size))
+        offset += size
+
+    return members
+
+
+def _inflate(member):
+    return zlib.decompress(member, GZIP_WBITS)
+
+
+def _bgzf_chunks(fileobj, jobs=None):
+    '''
+    Yields the inflated members of a BGZF file, reading one window of
+    BGZF_WINDOW compressed bytes at a time, and inflating the members
+    of each window in parallel threads, since zlib releases the GIL.
+    '''
+
+    pool = ThreadPool(jobs or multiprocessing.cpu_count())
+    try:
+        pending = b''
+        while True:
+            data = fileobj.read(BGZF_WINDOW)
+            if not data:
+                break
+            data = pending + data
+            members = bgzf_members(data, partial=True)
+            if members is None:
+                raise IOError("Malformed BGZF member in {0}".format(
+                    fileobj.name))
+            view = memoryview(data)
+            chunks = pool.map(_inflate, [view[i:j] for i, j in members])
+            pending = data[members[-1][1]:] if members else data
+            view.release()
+            for chunk in chunks:
+                yield chunk
+        if pending:
+            raise IOError("Truncated BGZF file: {0}".format(fileobj.name))
+    finally:
+        pool.close()
+
+
+def decompressed_chunks(path, kind=None, jobs=None):
+    '''
+    Yields the decompressed contents of path in bounded chunks, of
+    READ_CHUNK bytes, or one inflated BGZF member. Only BGZF members,
+    which store their compressed size, are inflated in parallel, and
+    every other file, including plain multi-member gzip, is
+    decompressed in a single streaming pass.
+    '''
+
+    if kind is None:
+        kind = detect(path)
+    if kind is None:
+        with open(path, 'rb') as fileobj:
+            for chunk in iter(lambda: fileobj.read(READ_CHUNK), b''):
+                yield chunk
+        return
+
+    if kind == GZIP:
+        with open(path, 'rb') as fileobj:
+            head = fileobj.read(BGZF_WINDOW)
+            members = (head.startswith(BGZF_MAGIC) and
+                       bgzf_members(head, partial=True))
+            if members:
+                fileobj.seek(0)
+                for chunk in _bgzf_chunks(fileobj, jobs):
+                    yield chunk
+                return
+
+    with _stream(path, kind) as fileobj:
+        for chunk in iter(lambda: fileobj.read(READ_CHUNK), b''):
+            yield chunk
+
+
+def decompress(path, kind=None, jobs=None):
+    '''
+    Returns the decompressed contents of path, which are held in memory
+    whole. Iterate decompressed_chunks() to bound the memory for large
+    files.
+    '''
+
+    return b''.join(decompressed_chunks(path, kind, jobs))
+
+
+# WRITING
+# -------
+
+
+def _compressor(kind, level=COMPRESS_LEVEL):
+    '''Returns a new streaming compressor object'''
+
+    _check(kind)
+    if kind == GZIP:
+        return zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    elif kind == BZIP2:
+        return bz2.BZ2Compressor(max(level, 1))
+    return lzma.LZMACompressor(preset=level)
+
+
+class CompressedFile(object):
+    '''
+    Synchronous compressing writer over a binary file. Only rewinding
+    to the start of the file is supported, which restarts the stream.
+
+    Arguments:
+        path -- output path
+        kind -- GZIP, BZIP2 or XZ
+    '''
+
+    def __init__(self, path, kind):
+        super(CompressedFile, self).__init__()
+
+        self.kind = kind
+        self.fileobj = open(path, 'wb')
+        self.compressor = _compressor(kind)
+
+    def write(self, data):
+        self.fileobj.write(self.compressor.compress(data))
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if offset or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("can only rewind compressed output")
+        self.fileobj.seek(0)
+        self.fileobj.truncate()
+        self.compressor = _compressor(self.kind)
+        return 0
+
+    def truncate(self, size=None):
+        if size:
+            raise io.UnsupportedOperation("can only truncate compressed "
+                                          "output at the start")
+        return 0
+
+    def close(self):
+        try:
+            self.fileobj.write(self.compressor.flush())
+        finally:
+            self.fileobj.close()
+
+
+class CompressedWriter(io.BufferedIOBase):
+    '''
+    Binary file object which compresses in a background thread, through
+    a ThreadedWriter over a CompressedFile, so the caller only pays for
+    the copy into the write queue. zlib, bz2 and lzma all release the
+    GIL while compressing.
+
+    Arguments:
+        path -- output path
+        kind -- GZIP, BZIP2 or XZ
+    '''
+
+    def __init__(self, path, kind):
+        super(CompressedWriter, self).__init__()
+
+        self.writer = ThreadedWriter(CompressedFile(path, kind))
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.writer.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self.position = self.writer.seek(offset, whence)
+        return self.position
+
+    def truncate(self, size=None):
+        return self.writer.truncate(size)
+
+    def close(self):
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            try:
+                writer.close()
+            finally:
+                super(CompressedWriter, self).close()
+
+
+# OPEN
+# ----
+
+
+def open_file(path, mode='r', encoding=None, newline=None, name=None):
+    '''
+    Drop-in replacement for open() and io.open(). Reads are decompressed
+    as they stream, by the magic bytes of the file, and writes are
+    compressed in a background thread by the extension of path, ie,
+    ".gz", ".bz2" or ".xz". Uncompressed files are opened as usual.
+
+    `name` replaces path for the write extension, ie, the final path
+    of a temporary output.
+    '''
+
+    if 'r' in mode:
+        kind = detect(path)
+    else:
+        kind = from_extension(name or path)
+
+    if kind is None:
+        if encoding is None and newline is None:
+            return open(path, mode)
+        return io.open(path, mode, encoding=encoding, newline=newline)
+
+    if 'r' in mode:
+        fileobj = _stream(path, kind)
+    else:
+        fileobj = CompressedWriter(path, kind)
+    if 'b' in mode:
+        return fileobj
+    return io.TextIOWrapper(fileobj, encoding=encoding, newline=newline)
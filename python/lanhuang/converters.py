@@ -0,0 +1,175 @@
+'''Converter from any registered MGF dialect to the PAVA format'''
+
+from __future__ import division
+
+# load modules/submodules
+from .cache import SpectrumCache
+from .dialects import DIALECTS, Header, sniff_file
+from .output import Output
+from .reader import decode_peaks
+from .scans import ENCODING, END_SUB, ScanSource
+
+
+# HELPERS
+# -------
+
+
+def minutes(seconds):
+    '''Formats the retention time in minutes'''
+
+    return str(round(seconds / 60, 3))
+
+
+# CONVERTERS
+# ----------
+
+
+class ParseMgf(object):
+    '''
+    Rewrites each scan of an MGF extraction with a PAVA-like header,
+    which Protein Prospector recognizes. The header fields are taken
+    from the compiled pattern of the registered dialect, so any
+    dialect, ie, RV, PD or TPP, converts through the same parser.
+
+    Arguments:
+        scans -- ScanSource of the MGF file
+        out -- Output, or ScanWriter, for the converted scans
+        dialect -- Dialect, or registered dialect name, of the file
+        peak_filter -- PeakFilter reducing each peak list, or None
+    '''
+
+    _title_format = 'BEGIN IONS\nTITLE=Scan {} (rt={}) [{}]\n'
+    _pep_mass_format = 'PEPMASS={} {}\n'
+    _charge_format = 'CHARGE={}+\n'
+
+    _end = END_SUB.decode(ENCODING)
+
+    def __init__(self, scans, out, dialect, peak_filter=None):
+        super(ParseMgf, self).__init__()
+
+        self.scans = scans
+        self.data = out
+        self.peak_filter = peak_filter
+        self.dialect = DIALECTS.get(dialect, dialect)
+        self._fields = [self.dialect.groups[i] for i in Header._fields]
+
+    def run(self, cache=None):
+        '''On start. Iterates over the mapped scans, which are split
+        from the file in a single linear pass, or over the cached
+        spectra, without parsing the headers.
+        '''
+
+        if cache is None:
+            for start, end in self.scans:
+                self.parser(start, end)
+        else:
+            for spectrum, charge in zip(cache, cache.charges()):
+                self.cached_parser(spectrum, cache, charge)
+
+    # ------------------
+    #        MAIN
+    # ------------------
+
+    def parser(self, start, end):
+        '''Processes the scan and then writes it to file'''
+
+        buf = self.scans.map
+        match = self.dialect.match(buf, start)
+        # num, raw, rt, mz, intensity, charge
+        num, raw, rt, mz, intensity, charge = (
+            None if i is None else i.decode(ENCODING)
+            for i in map(match.group, self._fields))
+        rt = minutes(float(rt) * self.dialect.rt_scale)
+        if self.peak_filter is None:
+            peaks = buf[match.end():end].decode(ENCODING)
+        else:
+            stop = end - len(END_SUB)
+            block = buf[match.end():stop].decode(ENCODING)
+            mzs, intensities = decode_peaks(buf, match.end(), stop)
+            peaks = self.filter_peaks(block, mzs, intensities, float(mz))
+        self.write_new_scan(num, rt, raw, mz, intensity, charge, peaks)
+
+    def cached_parser(self, spectrum, cache, charge):
+        '''
+        Writes the cached spectrum, copying only its peak text, with
+        the stored charge, so a missing CHARGE line stays missing.
+        '''
+
+        header = spectrum.header
+        rt = minutes(header.rt)
+        # NaN, ie, a missing intensity, is truthy
+        intensity = '' if header.intensity != header.intensity else (
+            header.intensity)
+        if self.peak_filter is None:
+            peaks = cache.text(spectrum.peaks, spectrum.end)
+        else:
+            block = cache.text(spectrum.peaks, spectrum.end - len(END_SUB))
+            peaks = self.filter_peaks(block, spectrum.mz, spectrum.intensity,
+                                      header.mz)
+        self.write_new_scan(header.num, rt, header.raw, header.mz,
+                            intensity, charge, peaks)
+
+    # ------------------
+    #        UTILS
+    # ------------------
+
+    def filter_peaks(self, block, mzs, intensities, precursor):
+        '''Returns the reduced peak list, ending with "END IONS"'''
+
+        block = self.peak_filter.apply(block, mzs, intensities, precursor)
+        return block + self._end
+
+    def write_new_scan(self, num, rt, raw, mz, intensity, charge, peaks):
+        '''Writes the new scan string to file, omitting the missing
+        intensity and CHARGE line, which PAVA reads as 1+.
+        '''
+
+        scan = [self._title_format.format(num, rt, raw),
+                self._pep_mass_format.format(mz, intensity or '')]
+        if charge:
+            scan.append(self._charge_format.format(charge))
+        scan.extend([peaks, '\n\n'])
+        self.data.write(''.join(scan))
+
+
+# API
+# ---
+
+
+def convert_mgf(path, out_path, dialect=None, cache=False, pipeline=False,
+                resume=False, sharding=None, peak_filter=None):
+    '''
+    Converts an MGF extraction to the PAVA-like format.
+
+    Arguments:
+        path -- input file, optionally compressed
+        out_path -- output file, compressed by its extension
+        dialect -- registered dialect of the input, ie, 'RV' or 'PD',
+            or None to sniff it from the leading scans
+        cache -- read the scans through a columnar cache
+        pipeline -- read ahead and write behind in background threads
+        resume -- continue from the last checkpoint of an interrupted
+            conversion, for uncompressed outputs without the cache
+        sharding -- Sharding to split the output into shards and a
+            manifest, or None
+        peak_filter -- PeakFilter reducing each peak list in the same
+            pass, or None
+    '''
+
+    if dialect is None:
+        dialect = sniff_file(path)
+        if dialect is None:
+            raise ValueError("Unrecognized MGF dialect: {0}".format(path))
+    dialect = DIALECTS.get(dialect, dialect)
+    # the cached spectra are converted without a checkpoint
+    inputs = None if cache else [path]
+    with Output(out_path, inputs, resume, pipeline, sharding) as out:
+        with ScanSource(path, out.offset, prefetch=pipeline) as scans:
+            out.open(scans)
+            mgf_cls = ParseMgf(scans, out, dialect, peak_filter)
+            if cache:
+                spectra = SpectrumCache.load(path, dialect.name)
+                mgf_cls.run(spectra)
+                spectra.close()
+            else:
+                mgf_cls.run()
@@ -0,0 +1,315 @@
+'''Sequence coverage of proteins from Protein Prospector reports'''
+
+from __future__ import print_function
+
+# load modules/submodules
+import os
+import sys
+
+import numpy as np
+
+from .compression import open_file
+
+
+# CONSTANTS
+# ---------
+
+PROTEIN_COLUMN = 'Acc #'
+PEPTIDE_COLUMN = 'DB Peptide'
+
+
+# UTILS
+# -----
+
+
+def find_all(value, sub):
+    """Find all occurrences within a string"""
+
+    start = 0
+    while True:
+        start = value.find(sub, start)
+        if start == -1:
+            return
+        yield start
+        start += len(sub)
+
+
+def uniquer(seq, idfun=None):
+    '''
+    Converts a sequence to a unique list while keeping order.
+    Recipe modified from:
+    https://code.activestate.com/recipes/52560-remove-duplicates-from-a-sequence/
+    :
+        >>> uniquer(range(4) + range(-2, 4))
+        [0, 1, 2, 3, -2, -1]
+    '''
+
+    if idfun is None:
+        # pylint: disable=E0102
+        def idfun(var):
+            return var
+    seen = {}
+    result = []
+    for item in seq:
+        marker = idfun(item)
+        # in old Python versions:
+        # if seen.has_key(marker)
+        # but in new ones:
+        if marker in seen:
+            continue
+        seen[marker] = 1
+        result.append(item)
+    return result
+
+
+def load_docx():
+    '''Imports python-docx, which is only needed in docx mode'''
+
+    try:
+        import docx
+        import docx.enum.style
+        import docx.shared
+    except ImportError:
+        raise ImportError("check_coverage in docx mode requires"
+                          "a python-docx installation, which can"
+                          "be installed via pip.")
+    return docx
+
+
+# COVERAGE
+# --------
+
+
+def protein_coverage(dataframe, protein, sequence):
+    '''Returns the protein coverage for a given UniProt ID bait and
+    sequence.
+    '''
+
+    # init return
+    sequence = ''.join(sequence[1:])
+    data = {k: False for k in range(len(sequence))}
+    cuts = {k: False for k in range(len(sequence))}
+    # grab sequences
+    indexes, = np.where(dataframe[PROTEIN_COLUMN] == protein)
+    sequences = set(dataframe[PEPTIDE_COLUMN][indexes].tolist())
+    # iterate over sequences
+    for seq in sequences:
+        positions = list(find_all(sequence, seq))
+        for position in positions:
+            for index in range(len(seq)):
+                key = index + position
+                data[key] = True
+            # now need to add for the last one
+            # used loop
+            cuts[key] = True
+    return data, cuts
+
+
+def get_coverage(dataframes, protein, sequence):
+    '''Iterativelt returns the protein coverage for each df within
+    dataframes.
+    '''
+
+    # init return
+    coverage_list = []
+    cut_list = []
+    for dataframe in dataframes:
+        coverage, cuts = protein_coverage(dataframe, protein, sequence)
+        coverage_list.append(coverage)
+        cut_list.append(cuts)
+    return coverage_list, cut_list
+
+
+def read_report(path):
+    '''Reads a Protein Prospector report into a Pandas dataframe'''
+
+    # pandas is slow to import, only load it once needed
+    import pandas as pd
+
+    with open_file(path, 'r') as fileobj:
+        try:
+            dataframe = pd.read_csv(fileobj, header=2, sep='\t',
+                                    engine='python')
+        except StopIteration:
+            raise AssertionError
+    # check if needed information available
+    assert PROTEIN_COLUMN in dataframe.columns
+    assert PEPTIDE_COLUMN in dataframe.columns
+    return dataframe
+
+
+# WRITER
+# ------
+
+
+class Writer(object):
+    '''Custom implementation of a console/text/docx Writer'''
+
+    paragraph = None
+
+    def __init__(self, mode, out):
+        super(Writer, self).__init__()
+
+        self.mode = mode
+        if self.mode == 'text':
+            path = self._get_path(out)
+            if os.path.exists(os.path.dirname(path)):
+                self.file = open(path, 'w')
+        elif self.mode == 'console':
+            self.file = sys.stdout
+        elif self.mode == 'docx':
+            path = self._get_path(out)
+            if os.path.exists(os.path.dirname(path)):
+                self.path = path
+                self.file = load_docx().Document()
+                self._add_styles()
+
+    # ------------------
+    #        MAIN
+    # ------------------
+
+    def start_sequence(self, sequence):
+        '''Starts the lines for a new protein'''
+
+        if self.mode in ['text', 'console']:
+            print('-------------------------', file=self.file)
+            print(sequence[0], file=self.file)
+            print(file=self.file)
+        elif self.mode == 'docx':
+            self.file.add_heading('-------------------------\n', 1)
+            self.paragraph = self.file.add_paragraph(sequence[0] + '\n')
+            self.paragraph.style = self.file.styles['Normal']
+
+    def write_sequence_line(self, sequence, index, indent=15):
+        '''Writes a sequence line with indentation to file'''
+
+        # grab offset to add to file
+        offset = str(len(''.join(sequence[1:index]))) + ': '
+        offset_length = len(offset)
+        # init line
+        line = ' '*(indent-offset_length)
+        line += offset
+        line += sequence[index]
+        if self.mode in ['text', 'console']:
+            print(line, file=self.file)
+        elif self.mode == 'docx':
+            self.paragraph.add_run(line + '\n')
+
+    def write_blank_line(self):
+        '''Write blank line to file'''
+
+        if self.mode in ['text', 'console']:
+            print(file=self.file)
+        elif self.mode == 'docx':
+            self.paragraph.add_run('\n')
+
+    def write_condition(self, header, coverage, cuts, sequence, index):
+        '''Writes the condition with coverage to file'''
+
+        output = self.process_condition(header, coverage, cuts,
+                                        sequence, index)
+        if self.mode in ['text', 'console']:
+            print(output, file=self.file)
+        elif self.mode == 'docx':
+            self.paragraph.add_run('\n')
+
+    def close_sequence(self):
+        '''Closes the lines for a protein'''
+
+        if self.mode in ['text', 'console']:
+            print('-------------------------', file=self.file)
+            print(file=self.file)
+        elif self.mode == 'docx':
+            self.file.add_heading('-------------------------\n', 1)
+
+    # ------------------
+    #       UTILS
+    # ------------------
+
+    @staticmethod
+    def get_header(condition, total=12):
+        '''Grabs a 35 character header from the given condition'''
+
+        length = min([len(condition), total])
+        header = condition[:total]
+        header = ''.join([header, ' : '])
+        header = ''.join([header, ' '*(total-length)])
+        return header
+
+    def close(self):
+        '''Closes the writeable object'''
+
+        if self.mode == 'text' and hasattr(self, "file"):
+            self.file.close()
+        elif self.mode == 'docx' and hasattr(self, "file"):
+            self.file.save(self.path)
+
+    def process_condition(self, header, coverage, cuts, sequence, index):
+        '''
+        Processes the header to give the conditions coverage of the
+        sequence.
+        '''
+
+        # grab parameter lengths to determine range
+        length = len(sequence[index])
+        offset = len(''.join(sequence[1:index]))
+        # iteratively add null string or +
+        if self.mode == 'docx':
+            self.paragraph.add_run(header)
+        keys = range(offset, offset+length)
+        for key in keys:
+            value = coverage[key]
+            cut = cuts[key]
+            # add 'o' if cutsite, '+' if not, ' ' if blank
+            if value and cut and self.mode in ['text', 'console']:
+                header += 'o'
+            elif value and not cut and self.mode in ['text', 'console']:
+                header += '+'
+            elif self.mode in ['text', 'console']:
+                header += ' '
+            # docx settings
+            elif value and cut and self.mode == 'docx':
+                self.paragraph.add_run('o', style='Red')
+            elif value and not cut and self.mode == 'docx':
+                self.paragraph.add_run('+', style='Black')
+            else:
+                self.paragraph.add_run(' ')
+        return header
+
+    def _add_styles(self):
+        '''Sets the docx styles'''
+
+        from docx.enum.style import WD_STYLE_TYPE
+        from docx.shared import Pt, RGBColor
+
+        # create normal style
+        style = self.file.styles['Normal']
+        font = style.font
+        font.name = 'Courier New'
+        font.size = Pt(8)
+        # create red style
+        style = self.file.styles.add_style('Red', WD_STYLE_TYPE.CHARACTER)
+        font = style.font
+        font.color.rgb = RGBColor(0xFF, 0x0, 0x0)
+        font.name = 'Courier New'
+        font.size = Pt(8)
+        # create black style
+        style = self.file.styles.add_style('Black', WD_STYLE_TYPE.CHARACTER)
+        font = style.font
+        font.color.rgb = RGBColor(0x0, 0x0, 0x0)
+        font.name = 'Courier New'
+        font.size = Pt(8)
+
+    def _get_path(self, out):
+        '''Returns the path for the outfile'''
+
+        relative = out[0] not in ['/', '~']
+        if relative:
+            path = os.path.join(os.getcwd(), out)
+        else:
+            path = out
+        if self.mode == 'text' and os.path.splitext(path)[1] != '.txt':
+            path = '.'.join([path, 'txt'])
+        if self.mode == 'docx' and os.path.splitext(path)[1] != '.docx':
+            path = '.'.join([path, 'docx'])
+        return path
@@ -0,0 +1,195 @@
+'''Header patterns for the MGF dialects used in the laboratory'''
+
+# load modules/submodules
+import re
+
+from collections import namedtuple, OrderedDict
+
+from .compression import open_file
+from .scans import ENCODING, END_SUB, START_SUB
+
+
+# CONSTANTS
+# ---------
+
+NAN = float('nan')
+# leading bytes read, and scans matched, to sniff the dialect of a file
+SNIFF_SIZE = 1 << 16
+SNIFF_SCANS = 5
+
+# OBJECTS
+# -------
+
+# rt is always in seconds, mz and intensity are for the precursor
+Header = namedtuple("Header", "num raw rt mz intensity charge")
+
+
+# DIALECTS
+# --------
+
+
+class Dialect(object):
+    '''
+    Compiled header pattern for one MGF dialect, with the group index
+    of each Header field within the pattern.
+
+    Arguments:
+        name -- dialect name, ie, 'TPP'
+        pattern -- bytes regex matching from "BEGIN IONS" to the last
+            header line, so the peak list starts at match.end()
+        groups -- dict of Header field -> group index
+        rt_scale -- factor to convert the retention time to seconds
+    '''
+
+    def __init__(self, name, pattern, groups, rt_scale=1):
+        super(Dialect, self).__init__()
+
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.groups = groups
+        self.rt_scale = rt_scale
+
+    def __repr__(self):
+        return 'Dialect({0!r})'.format(self.name)
+
+    def match(self, buf, start):
+        '''Matches the header of the scan at `start`, raising on failure'''
+
+        match = self.pattern.match(buf, start)
+        if match is None:
+            raise ValueError("Unrecognized {0} scan at byte {1}".format(
+                self.name, start))
+        return match
+
+    def header(self, match, default_charge=1):
+        '''
+        Converts the header match to typed Header fields, with
+        `default_charge` for a missing CHARGE line.
+        '''
+
+        num, raw, rt, mz, intensity, charge = (
+            match.group(self.groups[i]) for i in Header._fields)
+
+        return Header(
+            num=int(num),
+            raw=raw.decode(ENCODING),
+            rt=float(rt) * self.rt_scale if rt else NAN,
+            mz=float(mz),
+            intensity=float(intensity) if intensity else NAN,
+            # missing CHARGE lines are 1+
+            charge=int(charge) if charge else default_charge)
+
+    def parse(self, buf, start):
+        '''Returns the Header for the scan at `start`'''
+
+        return self.header(self.match(buf, start))
+
+
+TPP = Dialect('TPP', (
+    br'BEGIN IONS\r?\n'
+    br'TITLE=(.*)\.[0-9]+\.[0-9]+\.[0-9]* '
+    # one massively long line
+    br'File:\"(.*)\", NativeID:\"'
+    br'controllerType=[0-9]+ '
+    br'controllerNumber=[0-9]+ scan=([0-9]+)\"\r?\n'
+    # newline
+    br'RTINSECONDS=([0-9]*\.?[0-9]*)\r?\n'
+    br'PEPMASS=([0-9]+\.[0-9]+)'
+    br'(?: ([0-9]*\.[0-9]+))?\r?\n'
+    br'(CHARGE=([0-9]+)\+\r?\n)?'),
+    {'num': 3, 'raw': 2, 'rt': 4, 'mz': 5, 'intensity': 6, 'charge': 8})
+
+PAVA = Dialect('PAVA', (
+    br'BEGIN IONS\r?\n'
+    # In case of file header line, in _ms3cid files
+    br'(.*\r?\n)?'
+    # precursor in ms2
+    br'(?:MS2_SCAN_NUMBER= ([0-9]+)\r?\n)?'
+    br'TITLE=Scan ([0-9]+) '
+    br'\(rt=([0-9]*\.[0-9]+)\) \[(.*)\]\r?\n'
+    br'PEPMASS=([0-9]+\.?[0-9]*)\s+'
+    br'([0-9]*(\.?[0-9]*)?)\r?\n'
+    # Line could be missing if CHARGE=1+
+    br'(CHARGE=([0-9]+)\+\r?\n)?'),
+    {'num': 3, 'raw': 5, 'rt': 4, 'mz': 6, 'intensity': 7, 'charge': 10},
+    rt_scale=60)
+
+RV = Dialect('RV', (
+    br'BEGIN IONS\r?\n'
+    # ; scans: "228"
+    br'TITLE=File: \"(.*)\"; SpectrumID: \"\d*\"; scans: \"(\d*)\"\r?\n'
+    # newline
+    br'PEPMASS=([0-9]+\.[0-9]+)'
+    br'(?: ([0-9]*\.[0-9]+))?\r?\n'
+    br'(CHARGE=([0-9]+)\+\r?\n)?'
+    br'RTINSECONDS=([0-9]*\.?[0-9]*)\r?\n'
+    br'SCANS=\d*\r?\n'),
+    {'num': 2, 'raw': 1, 'rt': 7, 'mz': 3, 'intensity': 4, 'charge': 6})
+
+PD = Dialect('PD', (
+    br'(?:MASS=Monoisotopic\r?\n)?'
+    br'BEGIN IONS\r?\n'
+    br'TITLE=(.*) Spectrum([0-9]+) scans: ([0-9]+)\r?\n'
+    br'PEPMASS=([0-9]+\.[0-9]+) ([0-9]*\.?[0-9]*)\r?\n'
+    br'(?:CHARGE=([0-9]+)\+\r?\n)?'
+    br'RTINSECONDS=([0-9]+)\r?\n'
+    br'SCANS=([0-9]+)\r?\n'),
+    {'num': 3, 'raw': 1, 'rt': 7, 'mz': 4, 'intensity': 5, 'charge': 6})
+
+# REGISTRY
+# --------
+
+DIALECTS = OrderedDict((i.name, i) for i in (TPP, PAVA, RV, PD))
+
+
+def register(dialect, replace=False):
+    '''
+    Registers a new Dialect, so it is sniffed and converted like the
+    built-in dialects, and returns it.
+
+    Arguments:
+        dialect -- Dialect instance
+        replace -- replace a registered dialect with the same name
+    '''
+
+    if dialect.name in DIALECTS and not replace:
+        raise ValueError("Dialect {0!r} is already registered".format(
+            dialect.name))
+    DIALECTS[dialect.name] = dialect
+    return dialect
+
+
+def sniff_dialect(buf, scans=SNIFF_SCANS):
+    '''
+    Returns the first registered Dialect matching the header of each
+    of the leading `scans` scans within `buf`, the head of an MGF file,
+    or None. A final scan cut off by the end of `buf` is skipped
+    unless it is the only one.
+    '''
+
+    starts = []
+    position = buf.find(START_SUB)
+    while position != -1 and len(starts) < scans:
+        end = buf.find(END_SUB, position)
+        if end == -1 and starts:
+            # truncated by the end of the head
+            break
+        starts.append(position)
+        if end == -1:
+            break
+        position = buf.find(START_SUB, end)
+
+    if not starts:
+        return None
+    for dialect in DIALECTS.values():
+        if all(dialect.pattern.match(buf, i) for i in starts):
+            return dialect
+    return None
+
+
+def sniff_file(path, scans=SNIFF_SCANS):
+    '''Returns the Dialect of the MGF file at path, or None'''
+
+    # only the head is decompressed for compressed files
+    with open_file(path, 'rb') as fileobj:
+        return sniff_dialect(fileobj.read(SNIFF_SIZE), scans)
@@ -0,0 +1,271 @@
+'''Chainable scan fixers, applied to each PAVA scan in a single pass'''
+
+# load modules/submodules
+from . import fusion, pava
+from .header import tokenize_header
+from .join import MergeJoin, ScanOrderError
+from .rewrite import HeaderRewriter
+
+
+# FIXERS
+# ------
+
+
+class ScanFixer(object):
+    '''
+    Base class for a single correction to a PAVA scan, from the
+    matching TPP scan. Each fixer returns HeaderRewriter edits to one
+    header field, so the edits of a chain are rendered together.
+    '''
+
+    name = None
+
+    def __init__(self):
+        super(ScanFixer, self).__init__()
+
+        self.counters = {'changed': 0}
+
+    def begin(self):
+        '''Called once, before the first scan'''
+
+    def fix(self, header, num, tpp_scan):
+        '''
+        Returns the (start, end, bytes) edits correcting the scan.
+
+        Arguments:
+            header -- tokenized ScanHeader of the original scan
+            num -- PAVA scan number
+            tpp_scan -- matching TppScan, or None if missing
+        '''
+
+        raise NotImplementedError
+
+    def end(self):
+        '''Called once, after the last scan'''
+
+
+class ChargeFixer(ScanFixer):
+    '''
+    Raises mis-assigned charge states to the TPP charge, and writes
+    each differing charge to the summary, through the fix_pava.py
+    parser.
+    '''
+
+    name = 'charge'
+
+    def __init__(self, summary=None):
+        super(ChargeFixer, self).__init__()
+
+        self.summary = summary
+        self.parser = pava.ParseMgf(None, None, None, summary)
+        self.counters = self.parser.counters
+
+    def begin(self):
+        if self.summary is not None:
+            self.parser.write_header()
+
+    def fix(self, header, num, tpp_scan):
+        tpp_charge = None if tpp_scan is None else tpp_scan.charge
+        charge = header.charge
+        edits = self.parser.replace_charges(header, tpp_charge, charge)
+
+        # process summary
+        self.parser.adjust_counters(tpp_charge, charge)
+        if edits:
+            self.counters['changed'] += 1
+        if self.summary is not None:
+            self.parser.write_line(num, tpp_charge, charge)
+        return edits
+
+    def end(self):
+        if self.summary is not None:
+            self.parser.write_counters()
+
+
+class PrecursorFixer(ScanFixer):
+    '''
+    Replaces the precursor m/z and intensity with the TPP values,
+    through the fix_fusion.py parser.
+    '''
+
+    name = 'precursor'
+
+    def __init__(self):
+        super(PrecursorFixer, self).__init__()
+
+        self.parser = fusion.ParseMgf(None, None, None)
+
+    def fix(self, header, num, tpp_scan):
+        edits = self.parser.pep_mass_edits(header, tpp_scan)
+        if edits:
+            self.counters['changed'] += 1
+        return edits
+
+
+FIXERS = {i.name: i for i in (ChargeFixer, PrecursorFixer)}
+
+# CHAIN
+# -----
+
+
+class FixerChain(object):
+    '''
+    Applies a sequence of fixers to each scan in turn.
+
+    Arguments:
+        fixers -- ScanFixer instances, in the order to apply them
+    '''
+
+    def __init__(self, fixers):
+        super(FixerChain, self).__init__()
+
+        self.fixers = list(fixers)
+
+    @classmethod
+    def from_names(cls, names, summary=None):
+        '''Builds the chain from fixer names, ie, ['precursor', 'charge']'''
+
+        fixers = []
+        for name in names:
+            if name not in FIXERS:
+                raise ValueError("Unknown fixer: {0}".format(name))
+            if name == ChargeFixer.name:
+                fixers.append(ChargeFixer(summary))
+            else:
+                fixers.append(FIXERS[name]())
+        return cls(fixers)
+
+    def begin(self):
+        '''Starts each fixer'''
+
+        for fixer in self.fixers:
+            fixer.begin()
+
+    def fix(self, header, num, tpp_scan):
+        '''Returns the sorted edits of every fixer'''
+
+        edits = []
+        for fixer in self.fixers:
+            edits.extend(fixer.fix(header, num, tpp_scan))
+        edits.sort()
+        return edits
+
+    def end(self):
+        '''Finishes each fixer'''
+
+        for fixer in self.fixers:
+            fixer.end()
+
+    def attach(self, checkpoint):
+        '''
+        Tracks the counters of each fixer in the Checkpoint, or Output,
+        restoring the saved ones.
+        '''
+
+        counters = {i.name: i.counters for i in self.fixers}
+        checkpoint.attach(counters)
+        for fixer in self.fixers:
+            # restored in place, as the parsers share the dictionaries
+            fixer.counters.update(counters[fixer.name])
+            counters[fixer.name] = fixer.counters
+
+    @property
+    def counters(self):
+        '''Counters of each fixer, prefixed by the fixer name'''
+
+        counters = {}
+        for fixer in self.fixers:
+            for key, value in fixer.counters.items():
+                counters['{0} {1}'.format(fixer.name, key)] = value
+        return counters
+
+
+# DRIVER
+# ------
+
+
+class FixMgf(object):
+    '''
+    Streams the PAVA scans once, looks up the TPP scan for each, and
+    writes the scan after the edits of the fixer chain.
+
+    Arguments:
+        scans -- ScanSource of the PAVA scans
+        tpp_data -- ScanIndex or MergeJoin of the TPP scans
+        chain -- FixerChain to apply to each scan
+        out -- Output, or ScanWriter, for the fixed scans
+    '''
+
+    # renders the edits of any fixer
+    _rewriter = HeaderRewriter([])
+
+    def __init__(self, scans, tpp_data, chain, out):
+        super(FixMgf, self).__init__()
+
+        self.scans = scans
+        self.tpp_data = tpp_data
+        self.chain = chain
+        self.data = out
+
+    def run(self, begin=True):
+        '''On start. Fixes and writes each scan, in file order. The
+        fixers already began when resuming.
+        '''
+
+        if begin:
+            self.chain.begin()
+        for start, end in self.scans:
+            # tokenize the header only, never the peak list
+            header = tokenize_header(self.scans.map, start, end)
+            num = header.scan('PAVA')
+            edits = self.chain.fix(header, num, self.tpp_data.get(num))
+            self.data.write_scan(self._rewriter, header, end, edits)
+        self.chain.end()
+
+
+def _fix(scans, tpp_data, out, names, summary):
+    '''Runs the fixer chain, continuing from any checkpoint'''
+
+    chain = FixerChain.from_names(names, summary)
+    chain.attach(out)
+    FixMgf(scans, tpp_data, chain, out).run(not out.resumed)
+    return chain
+
+
+# API
+# ---
+
+
+def fix_mgf(scans, tpp_data, out, names, summary=None):
+    '''
+    Applies the named fixers, in order, to each PAVA scan from the
+    matching TPP scan in a single pass, writes the fixed scans, and
+    returns the counters of each fixer. A MergeJoin which finds the
+    TPP scans out of order restarts the fixers on the ScanIndex of the
+    TPP file.
+
+    Arguments:
+        scans -- ScanSource of the PAVA scans
+        tpp_data -- TPP scans by number, ie, a ScanIndex or MergeJoin
+        out -- Output, or ScanWriter, for the fixed scans
+        names -- fixer names, ie, ['precursor', 'charge']
+        summary -- file object for the charge state summary, or None
+    '''
+
+    if summary is not None:
+        out.track('summary', summary)
+    out.open(scans)
+    try:
+        chain = _fix(scans, tpp_data, out, names, summary)
+        if isinstance(tpp_data, MergeJoin):
+            # the TPP scans after the last PAVA scan must be in order too
+            tpp_data.finish()
+    except ScanOrderError:
+        # out of order, restart on the indexed path
+        out.rewind()
+        tpp_data = tpp_data.fallback()
+        try:
+            chain = _fix(scans, tpp_data, out, names, summary)
+        finally:
+            tpp_data.close()
+    return chain.counters
@@ -0,0 +1,261 @@
+'''Precursor correction of PAVA files from the matching TPP scans'''
+
+# load modules/submodules
+import functools
+import io
+import math
+import os
+import time
+
+from multiprocessing import cpu_count
+
+from .batch import (batch_directory, find_inputs, output_path, pair_inputs,
+                    run_batch, write_summary, SUMMARY_NAME)
+from .header import tokenize_header
+from .index import ScanIndex
+from .join import MergeJoin, ScanOrderError
+from .output import Output, ScanWriter
+from .parallel import map_shards, part_path, stitch
+from .rewrite import PEPMASS, PEPMASS_MZ, HeaderRewriter
+from .scans import ENCODING, ScanSource
+
+
+# CONSTANTS
+# ---------
+
+BATCH_FIELDS = ['changed']
+
+
+# PARSER
+# ------
+
+
+class ParseMgf(object):
+    '''Parses MGF file format using series of known subs (specific
+    to each version of MGF file) and stores data in dictionary.
+    MGF Format:
+        BEGIN IONS
+        scan=470
+        PEPMASS=473.456
+        ...
+        475.34\t1800
+        ...
+        END IONS
+    '''
+
+    _pep_mass = HeaderRewriter([PEPMASS_MZ])
+    _pep_intensity = HeaderRewriter([PEPMASS])
+
+    def __init__(self, scans, tpp_data, out):
+        super(ParseMgf, self).__init__()
+
+        # bind instance attributes
+        self.scans = scans
+        # read/write new string
+        self.parser = self.process_pava_scan
+        self.data = out
+        self.counters = {'scans': 0, 'changed': 0}
+        self.tpp_data = tpp_data
+
+    def run(self):
+        '''On start. Iterates over the scans of the source, which are
+        split from the file in a single linear pass.
+        '''
+
+        for start, end in self.scans:
+            self.parser(start, end)
+
+    # ------------------
+    #        MAIN
+    # ------------------
+
+    def process_pava_scan(self, start, end):
+        '''Processes a single scan and stores the data in self.data.
+        Stores the meta-data directly and then processes the scan
+        spectra via self.process_data(). Processes PAVA-like formats.
+
+        Arguments:
+            start, end -- byte offsets of the scan within the mapped file
+        '''
+
+        # tokenize the header only, never the peak list
+        header = tokenize_header(self.scans.map, start, end)
+        self.process_scan(header, end, header.scan('PAVA'))
+
+    def process_scan(self, header, end, num):
+        '''Replaces the pep_mass from the TPP data and writes the scan'''
+
+        edits = self.replace_pep_mass(header, num)
+        self.data.write_scan(self._pep_intensity, header, end, edits)
+
+    def replace_pep_mass(self, header, num):
+        '''Returns the edits replacing the pep_mass with the TPP one'''
+
+        # grab tpp data
+        edits = self.pep_mass_edits(header, self.tpp_data.get(num))
+        # process counters
+        self.counters['scans'] += 1
+        if edits:
+            self.counters['changed'] += 1
+        return edits
+
+    def pep_mass_edits(self, header, tpp_scan):
+        '''Returns the edits replacing the PEPMASS with the TPP values'''
+
+        if tpp_scan is None:
+            return []
+        rewriter = self._pep_intensity
+        # add in intensity value, NaN if missing
+        if math.isnan(tpp_scan.intensity):
+            rewriter = self._pep_mass
+        values = {'mz': tpp_scan.mz, 'intensity': tpp_scan.intensity}
+        return rewriter.edits(header, values)
+
+
+# WORKERS
+# -------
+
+_TPP_DATA = None
+
+
+def init_worker(tpp_path):
+    '''Loads the shared, read-only tpp scan index in each worker'''
+
+    global _TPP_DATA  # pylint: disable=global-statement
+    _TPP_DATA = ScanIndex.load(tpp_path)
+
+
+def correct_shard(pava_path, out_path, shard):
+    '''Corrects the pava scans within a byte range to a part file'''
+
+    index, (start, end) = shard
+    path = part_path(out_path, index)
+    with ScanSource(pava_path, start, end) as scans:
+        out = io.open(path, 'w', encoding=ENCODING, newline='')
+        with ScanWriter(out) as writer:
+            pava_cls = ParseMgf(scans, _TPP_DATA, writer)
+            pava_cls.run()
+    return path, pava_cls.counters
+
+
+def _correct(scans, tpp_data, out):
+    '''Corrects the pava scans, continuing from any checkpoint'''
+
+    pava_cls = ParseMgf(scans, tpp_data, out)
+    out.attach(pava_cls.counters)
+    pava_cls.run()
+    return pava_cls.counters
+
+
+# API
+# ---
+
+
+def fix_fusion(scans, tpp_data, out):
+    '''
+    Replaces the precursor m/z and intensity of the PAVA scans with
+    the TPP values, writes the corrected scans, and returns the
+    counters. A MergeJoin which finds the TPP scans out of order
+    restarts the correction on the ScanIndex of the TPP file.
+
+    Arguments:
+        scans -- ScanSource of the PAVA scans
+        tpp_data -- TPP scans by number, ie, a ScanIndex or MergeJoin,
+            or a MatchedIndex, which follows the source
+        out -- Output, or ScanWriter, for the corrected scans
+    '''
+
+    out.open(scans)
+    scans.listen(tpp_data)
+    try:
+        counters = _correct(scans, tpp_data, out)
+        if isinstance(tpp_data, MergeJoin):
+            # the TPP scans after the last PAVA scan must be in order too
+            tpp_data.finish()
+    except ScanOrderError:
+        # out of order, restart on the indexed path
+        out.rewind()
+        tpp_data = tpp_data.fallback()
+        try:
+            counters = _correct(scans, tpp_data, out)
+        finally:
+            tpp_data.close()
+    counters.update(getattr(tpp_data, 'counters', {}))
+    return counters
+
+
+def fix_fusion_jobs(tpp_path, pava_path, out, jobs):
+    '''
+    Corrects the PAVA file as fix_fusion() does, over byte-range shards
+    in parallel, each corrected against the ScanIndex of the TPP file,
+    and returns the counters.
+
+    Arguments:
+        tpp_path, pava_path -- input files, optionally compressed
+        out -- Output, without a checkpoint, for the corrected scans
+        jobs -- worker processes, each correcting a byte range
+    '''
+
+    # build the sidecar once, before the workers load it
+    ScanIndex.load(tpp_path).close()
+    worker = functools.partial(correct_shard, pava_path, out.path)
+    results = map_shards(pava_path, jobs, worker, init_worker, (tpp_path,))
+    # stitch the shards back in file order
+    totals = {'scans': 0, 'changed': 0}
+    for path, counters in results:
+        stitch([path], out.out)
+        for key, value in counters.items():
+            totals[key] += value
+    return totals
+
+
+# BATCH
+# -----
+
+
+def correct_pair(task, tpp_data=None):
+    '''Corrects one pava file from a batch, returning its stats'''
+
+    tpp_path, pava_path, out_path = task
+    start = time.time()
+    owned = tpp_data is None
+    if owned:
+        tpp_data = ScanIndex.load(tpp_path)
+    try:
+        with Output(out_path, [tpp_path, pava_path]) as out:
+            with ScanSource(pava_path) as scans:
+                counters = fix_fusion(scans, tpp_data, out)
+    finally:
+        if owned:
+            tpp_data.close()
+
+    stats = dict(counters, tpp=tpp_path, pava=pava_path)
+    stats['bytes'] = os.path.getsize(pava_path)
+    stats['seconds'] = time.time() - start
+    return stats
+
+
+def fix_fusion_batch(path, out_dir=None, jobs=None):
+    '''
+    Corrects every paired pava file in a directory or manifest, and
+    writes the batch summary. Returns the stats, or the error row, for
+    each pair.
+
+    Arguments:
+        path -- directory or manifest of TPP and PAVA files
+        out_dir -- output directory, or None for beside each PAVA file
+        jobs -- worker processes, one PAVA/TPP pair each
+    '''
+
+    start = time.time()
+    if out_dir and not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    pairs, unpaired, ambiguous = pair_inputs(find_inputs(path))
+    tasks = [(tpp, pava, output_path(pava, out_dir)) for tpp, pava in pairs]
+    results = run_batch(tasks, correct_pair, jobs or cpu_count())
+
+    directory = out_dir or batch_directory(path)
+    with open(os.path.join(directory, SUMMARY_NAME), 'w') as fileobj:
+        write_summary(fileobj, results, BATCH_FIELDS, unpaired,
+                      time.time() - start, ambiguous)
+    return results
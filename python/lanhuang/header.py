@@ -0,0 +1,169 @@
+'''Header-only scan tokenizer, which stops at the first peak line'''
+
+# load modules/submodules
+import re
+
+from .dialects import NAN, Header
+from .scans import ENCODING
+
+
+# CONSTANTS
+# ---------
+
+# "BEGIN IONS" and every line before a peak line or "END IONS"
+HEADER = re.compile(br'BEGIN IONS\r?\n((?:(?![0-9]|END IONS)[^\n]*\n)*)')
+# header line, as the key, "=" and value
+HEADER_LINE = re.compile(br'([^=\r\n]*)(=?)([^\r\n]*)\r?\n')
+FIELD = re.compile(br'^([^=\r\n]+)=([^\r\n]*)', re.M)
+
+# scan number, RAW file and retention time within each dialect's TITLE,
+# with the factor converting the retention time to seconds
+TITLES = {
+    'TPP': (re.compile(br'File:"(?P<raw>.*)", NativeID:".*'
+                       br'scan=(?P<num>[0-9]+)"'), 1),
+    'PAVA': (re.compile(br'Scan (?P<num>[0-9]+) \(rt=(?P<rt>[0-9]*\.[0-9]+)\)'
+                        br' \[(?P<raw>.*)\]'), 60),
+    'RV': (re.compile(br'File: "(?P<raw>.*)"; SpectrumID: "[0-9]*"; '
+                      br'scans: "(?P<num>[0-9]*)"'), 1),
+    'PD': (re.compile(br'(?P<raw>.*) Spectrum[0-9]+ scans: (?P<num>[0-9]+)'),
+           1),
+}
+
+
+# TOKENIZER
+# ---------
+
+
+class ScanHeader(object):
+    '''
+    Header lines of a single scan. Only the header is read, so the cost
+    is independent of the number of peaks.
+
+    Arguments:
+        buf -- bytes-like object or memory map of the source file
+        start -- offset of "BEGIN IONS"
+        lines_start -- offset of the first line after "BEGIN IONS"
+        peaks -- offset of the first peak line, or "END IONS"
+    '''
+
+    def __init__(self, buf, start, lines_start, peaks):
+        super(ScanHeader, self).__init__()
+
+        self.buf = buf
+        self.start = start
+        self.lines_start = lines_start
+        self.peaks = peaks
+        self.block = buf[lines_start:peaks]
+        self.fields = dict(FIELD.findall(self.block))
+
+    @property
+    def lines(self):
+        '''
+        List of (key, value start, value end, line end) offsets for each
+        header line, into the source buffer.
+        '''
+
+        offset = self.lines_start
+        return [(i.group(1), offset + i.end(2), offset + i.end(3),
+                 offset + i.end()) for i in HEADER_LINE.finditer(self.block)]
+
+    # ------------------
+    #       FIELDS
+    # ------------------
+
+    def __contains__(self, key):
+        return key in self.fields
+
+    def span(self, key):
+        '''
+        Returns the (start, end) offsets of the value for the first line
+        with the header key, into the source buffer, or None.
+        '''
+
+        prefix = key + b'='
+        if self.block.startswith(prefix):
+            index = 0
+        else:
+            index = self.block.find(b'\n' + prefix) + 1
+            if not index:
+                return None
+        value_start = index + len(prefix)
+        # the header block always ends with a newline
+        value_end = self.block.find(b'\n', value_start)
+        if self.block[value_end-1:value_end] == b'\r':
+            value_end -= 1
+        return self.lines_start + value_start, self.lines_start + value_end
+
+    def value(self, key, default=None):
+        '''Returns the raw bytes value for a header key, ie, b'CHARGE' '''
+
+        return self.fields.get(key, default)
+
+    @property
+    def title(self):
+        return self.value(b'TITLE', b'').decode(ENCODING)
+
+    @property
+    def mz(self):
+        return float(self.value(b'PEPMASS', b'').split()[0])
+
+    @property
+    def intensity(self):
+        values = self.value(b'PEPMASS', b'').split()
+        if len(values) < 2 or not values[1].strip(b'.'):
+            return NAN
+        return float(values[1])
+
+    @property
+    def charge(self):
+        # missing CHARGE lines are 1+
+        value = self.value(b'CHARGE')
+        if value is None:
+            return 1
+        return int(value.rstrip(b'+-'))
+
+    @property
+    def rt(self):
+        value = self.value(b'RTINSECONDS')
+        if not value:
+            return NAN
+        return float(value)
+
+    def _title(self, dialect):
+        '''Matches the TITLE of the dialect, raising on failure'''
+
+        match = TITLES[dialect][0].search(self.value(b'TITLE', b''))
+        if match is None:
+            raise ValueError("Unrecognized {0} scan at byte {1}".format(
+                dialect, self.start))
+        return match
+
+    def scan(self, dialect):
+        '''Returns the scan number, from the TITLE of the dialect'''
+
+        return int(self._title(dialect).group('num'))
+
+    def header(self, dialect):
+        '''Returns the typed Header, from the TITLE of the dialect'''
+
+        groups = self._title(dialect).groupdict()
+        rt = self.rt
+        if groups.get('rt'):
+            rt = float(groups['rt']) * TITLES[dialect][1]
+        return Header(int(groups['num']), groups['raw'].decode(ENCODING), rt,
+                      self.mz, self.intensity, self.charge)
+
+
+def tokenize_header(buf, start, end=None):
+    '''
+    Tokenizes the header of the scan at `start`, up to the first numeric
+    peak line or "END IONS", and returns a ScanHeader. Never reads past
+    the header, unlike a regex split of the full scan.
+    '''
+
+    if end is None:
+        end = len(buf)
+    match = HEADER.match(buf, start, end)
+    if match is None:
+        raise ValueError("Unrecognized scan at byte {0}".format(start))
+    return ScanHeader(buf, start, match.start(1), match.end())
@@ -0,0 +1,171 @@
+'''Persistent scan-offset index (sidecar file) for TPP MGF files'''
+
+# load modules/submodules
+import os
+import struct
+
+import numpy as np
+
+from .checkpoint import replace_file
+from .dialects import TPP
+from .scans import ScanSplitter
+from .store import DTYPE, TppScan, TppStore
+
+
+# CONSTANTS
+# ---------
+
+SUFFIX = '.idx'
+MAGIC = b'LHIDX'
+VERSION = 1
+
+# magic, version, indexed file size, indexed file mtime, record count,
+# followed by the packed store.DTYPE records
+HEADER = struct.Struct('<5sBqdq')
+
+
+# HELPERS
+# -------
+
+
+def sidecar_path(path):
+    '''Returns the index sidecar path for an MGF file'''
+
+    return path + SUFFIX
+
+
+def parse_tpp_scan(buf, start, base=0):
+    '''
+    Parses the TPP header for the scan beginning at `start` within
+    `buf` (a bytes-like object or memory map) and returns a TppScan.
+    Missing intensities are NaN and missing CHARGE lines are 1+.
+    `base` is the offset of buf within the file, ie, the window of a
+    compressed file, for the stored scan offset.
+    '''
+
+    header = TPP.parse(buf, start)
+    return TppScan(header.num, base + start, header.mz, header.intensity,
+                   header.charge, header.rt)
+
+
+# INDEX
+# -----
+
+
+class ScanIndex(object):
+    '''
+    Scan number -> TppScan lookup table for a TPP MGF file, backed by
+    a TppStore.
+
+    The store is persisted next to the MGF file (`file.mgf.idx`) and
+    is keyed to the MGF size and mtime, so the MGF file is only scanned
+    the first time it is indexed, or after it changes. Later loads
+    memory-map the sidecar records directly.
+    '''
+
+    def __init__(self, path, store):
+        super(ScanIndex, self).__init__()
+
+        self.path = path
+        self.store = store
+        self._splitter = None
+
+    @classmethod
+    def load(cls, path):
+        '''Loads the sidecar index for path, (re)building it if stale'''
+
+        stat = os.stat(path)
+        sidecar = sidecar_path(path)
+        store = cls._read(sidecar, stat)
+        if store is None:
+            store = cls._scan(path)
+            try:
+                cls._write(sidecar, stat, store)
+            except (IOError, OSError):
+                # read-only share, keep the index in memory only
+                pass
+
+        return cls(path, store)
+
+    # ------------------
+    #       LOOKUP
+    # ------------------
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, num):
+        return num in self.store
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def get(self, num, default=None):
+        '''Returns the TppScan for the scan number, or default'''
+
+        return self.store.get(num, default)
+
+    def text(self, num):
+        '''Returns the decoded scan text, read directly at its offset'''
+
+        if self._splitter is None:
+            self._splitter = ScanSplitter(self.path)
+        start, end = self._splitter.locate(self.store.get(num).offset)
+        return self._splitter.text(start, end)
+
+    def close(self):
+        '''Closes the memory map opened for text lookups'''
+
+        if self._splitter is not None:
+            self._splitter.close()
+            self._splitter = None
+
+    # ------------------
+    #         I/O
+    # ------------------
+
+    @staticmethod
+    def _scan(path):
+        '''Parses every scan header in the TPP file'''
+
+        with ScanSplitter(path) as splitter:
+            return TppStore.from_scans(
+                parse_tpp_scan(splitter.map, start, splitter.base)
+                for start, _ in splitter)
+
+    @staticmethod
+    def _read(sidecar, stat):
+        '''Maps the sidecar, returning None if missing or stale'''
+
+        try:
+            with open(sidecar, 'rb') as fileobj:
+                header = fileobj.read(HEADER.size)
+                length = os.fstat(fileobj.fileno()).st_size
+        except (IOError, OSError):
+            return None
+
+        if len(header) < HEADER.size:
+            return None
+        magic, version, size, mtime, count = HEADER.unpack(header)
+        if (magic != MAGIC or version != VERSION or size != stat.st_size or
+                mtime != stat.st_mtime):
+            return None
+        if length != HEADER.size + count * DTYPE.itemsize:
+            return None
+
+        if not count:
+            return TppStore(np.empty(0, dtype=DTYPE))
+        records = np.memmap(sidecar, dtype=DTYPE, mode='r',
+                            offset=HEADER.size, shape=(count,))
+        return TppStore(records)
+
+    @staticmethod
+    def _write(sidecar, stat, store):
+        '''Writes the records to a temporary file and moves it in place'''
+
+        temp = sidecar + '.tmp'
+        with open(temp, 'wb') as fileobj:
+            fileobj.write(HEADER.pack(MAGIC, VERSION, stat.st_size,
+                                      stat.st_mtime, len(store)))
+            store.records.tofile(fileobj)
+        replace_file(temp, sidecar)
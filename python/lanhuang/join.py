@@ -0,0 +1,130 @@
+'''Streaming merge-join of TPP scans against scan-ordered lookups'''
+
+# load modules/submodules
+from collections import OrderedDict
+
+from .index import ScanIndex, parse_tpp_scan
+from .scans import ScanSplitter
+
+
+# CONSTANTS
+# ---------
+
+WINDOW = 64
+
+
+# ERRORS
+# ------
+
+
+class ScanOrderError(ValueError):
+    '''Raised when the merge-joined scans are not in ascending order'''
+
+
+# JOIN
+# ----
+
+
+class MergeJoin(object):
+    '''
+    Drop-in replacement for ScanIndex.get() which walks the TPP file
+    alongside the caller. Since the TPP and PAVA files are extracted
+    from the same RAW file in scan order, only a small window of recent
+    TPP scans needs to be held in memory.
+
+    Raises ScanOrderError if the TPP scans are not ascending, or a scan
+    number is requested after it has left the window, so the caller can
+    fall back to the indexed path.
+    '''
+
+    def __init__(self, path, window=WINDOW):
+        super(MergeJoin, self).__init__()
+
+        self.path = path
+        self.splitter = ScanSplitter(path)
+        self.scans = self._iter_scans()
+        self.window = OrderedDict()
+        self.size = window
+        # highest scan number read, lowest still retrievable
+        self.last = None
+        self.floor = None
+        self.exhausted = False
+
+    def _iter_scans(self):
+        '''Yields each TppScan in file order'''
+
+        for start, _ in self.splitter:
+            yield parse_tpp_scan(self.splitter.map, start,
+                                 self.splitter.base)
+
+    # ------------------
+    #       LOOKUP
+    # ------------------
+
+    def get(self, num, default=None):
+        '''Returns the TppScan for the scan number, or default'''
+
+        if self.floor is not None and num < self.floor:
+            raise ScanOrderError("Scan {0} requested after leaving the "
+                                 "merge window".format(num))
+        while not self.exhausted and (self.last is None or self.last < num):
+            self._advance()
+
+        return self.window.get(num, default)
+
+    def _advance(self):
+        '''Reads the next TPP scan into the window'''
+
+        scan = next(self.scans, None)
+        if scan is None:
+            self.exhausted = True
+            return
+        if self.last is not None and scan.num <= self.last:
+            raise ScanOrderError("TPP scan {0} follows scan {1}".format(
+                scan.num, self.last))
+
+        self.last = scan.num
+        self.window[scan.num] = scan
+        if len(self.window) > self.size:
+            evicted, _ = self.window.popitem(last=False)
+            self.floor = evicted + 1
+
+    def finish(self):
+        '''
+        Reads the TPP scans past the last lookup, so scans out of order
+        after the last PAVA scan still raise ScanOrderError.
+        '''
+
+        while not self.exhausted:
+            self._advance()
+
+    def fallback(self):
+        '''
+        Closes the join, and returns the ScanIndex of the TPP file to
+        restart on once a ScanOrderError was raised.
+        '''
+
+        self.close()
+        return ScanIndex.load(self.path)
+
+    def close(self):
+        '''Closes the underlying scan splitter'''
+
+        self.scans.close()
+        self.splitter.close()
+
+
+# API
+# ---
+
+
+def open_lookup(path, stream=False):
+    '''
+    Returns the TPP scans of path by scan number: a MergeJoin walking
+    the file alongside scan-ordered PAVA scans if stream, or else the
+    ScanIndex of the file.
+    '''
+
+    if stream:
+        return MergeJoin(path)
+    return ScanIndex.load(path)
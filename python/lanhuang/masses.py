@@ -0,0 +1,325 @@
+'''Cross-file precursor mass index, for ppm-window queries over many MGFs'''
+
+# load modules/submodules
+import json
+import os
+import struct
+
+import numpy as np
+
+from .checkpoint import replace_file, temp_path
+from .dialects import DIALECTS, sniff_file
+from .scans import ScanSplitter
+
+
+# CONSTANTS
+# ---------
+
+PROTON = 1.007276467
+PPM_TOLERANCE = 10.0
+SUFFIX = '.mzidx'
+MAGIC = b'LHMZX'
+VERSION = 2
+# stored charge of the scans without a CHARGE line, whose neutral mass
+# is unknown, so they are stored at mass 0 and searched by m/z
+MISSING_CHARGE = 0
+
+# magic, version, record count, length of the JSON metadata, ie, the
+# file table and charges, followed by it and the packed DTYPE records
+HEADER = struct.Struct('<5sBqq')
+
+# sorted by neutral precursor mass, rt in seconds
+DTYPE = np.dtype([
+    ('mass', '<f8'),
+    ('mz', '<f8'),
+    ('charge', 'i1'),
+    ('rt', '<f4'),
+    ('file', '<i4'),
+    ('scan', '<i4'),
+    ('offset', '<i8'),
+])
+COLUMNS = ['Query', 'File', 'Scan', 'm/z', 'Charge', 'Mass', 'RT (s)', 'ppm']
+
+
+# HELPERS
+# -------
+
+
+def neutral_mass(mz, charge):
+    '''Returns the neutral mass of a precursor m/z at a charge'''
+
+    return (np.asarray(mz, dtype=np.float64) - PROTON) * charge
+
+
+def _file_entry(path, root):
+    '''Returns the file table entry, with the path relative to root'''
+
+    stat = os.stat(path)
+    dialect = sniff_file(path)
+    if dialect is None:
+        raise ValueError("Unrecognized MGF dialect: {0}".format(path))
+    return {
+        'path': os.path.relpath(os.path.abspath(path), root),
+        'dialect': dialect.name,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+    }
+
+
+def _records(path, file_id, dialect):
+    '''Parses the precursor of every scan of an MGF file'''
+
+    rows = []
+    with ScanSplitter(path) as splitter:
+        for start, _ in splitter:
+            match = dialect.match(splitter.map, start)
+            header = dialect.header(match, MISSING_CHARGE)
+            rows.append((header.mz, header.charge, header.rt, file_id,
+                         header.num, splitter.base + start))
+    records = np.zeros(len(rows), dtype=DTYPE)
+    if rows:
+        columns = list(zip(*rows))
+        for name, column in zip(DTYPE.names[1:], columns):
+            records[name] = column
+        records['mass'] = neutral_mass(records['mz'], records['charge'])
+    return records
+
+
+# INDEX
+# -----
+
+
+class MassIndex(object):
+    '''
+    Precursor records of every scan across many MGF files, ie, the
+    corrected PAVA or TPP files of an experiment, sorted by neutral
+    mass, so the scans within a ppm window of a mass are found with
+    two binary searches, and their text read directly at the offset.
+    The scans without a CHARGE line lead the records, at mass 0, in
+    m/z order, and are searched at every indexed charge.
+
+    The index is a single file: a header, JSON metadata with the
+    indexed files, keyed to their size and mtime, and the DTYPE
+    records, which are memory-mapped on load. The file paths are
+    relative to the index, so an experiment directory can be moved
+    along with it.
+    '''
+
+    def __init__(self, path, meta, records):
+        super(MassIndex, self).__init__()
+
+        self.path = path
+        self.meta = meta
+        self.files = meta['files']
+        # every indexed charge, searched for m/z queries at any charge
+        self.charges = meta['charges'] or [1]
+        self.records = records
+        # contiguous copy, so a binary search never copies the column
+        self.masses = np.ascontiguousarray(records['mass'])
+        self.chargeless = meta['chargeless']
+        self.chargeless_mzs = np.ascontiguousarray(
+            records['mz'][:self.chargeless])
+        self._splitters = {}
+
+    @classmethod
+    def build(cls, paths, path):
+        '''
+        Indexes the MGF files at paths, writing the index to path.
+        Raises ValueError if the files hold no spectra.
+        '''
+
+        root = os.path.dirname(os.path.abspath(path))
+        files = []
+        records = []
+        for file_id, mgf in enumerate(paths):
+            entry = _file_entry(mgf, root)
+            files.append(entry)
+            records.append(_records(mgf, file_id,
+                                    DIALECTS[entry['dialect']]))
+        records = (np.concatenate(records) if records else
+                   np.empty(0, dtype=DTYPE))
+        if not len(records):
+            raise ValueError("No spectra found to index")
+        records = records[np.argsort(records['mass'], kind='mergesort')]
+        missing = records['charge'] == MISSING_CHARGE
+        chargeless = int(np.count_nonzero(missing))
+        lead = records[:chargeless]
+        records[:chargeless] = lead[np.argsort(lead['mz'], kind='mergesort')]
+        meta = {
+            'files': files,
+            'charges': np.unique(records['charge'][~missing]).tolist(),
+            'chargeless': chargeless,
+        }
+        cls._write(path, meta, records)
+
+        return cls(path, meta, records)
+
+    @classmethod
+    def load(cls, path, check=True):
+        '''
+        Loads the index at path. Raises ValueError if an indexed file
+        changed since, unless `check` is False.
+        '''
+
+        with open(path, 'rb') as fileobj:
+            header = fileobj.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError("Truncated mass index: {0}".format(path))
+            magic, version, count, length = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError("Not a mass index: {0}".format(path))
+            if version != VERSION:
+                raise ValueError("Outdated mass index, rebuild the index: "
+                                 "{0}".format(path))
+            meta = json.loads(fileobj.read(length).decode('utf-8'))
+
+        index = cls(path, meta, cls._map(path, count, HEADER.size + length))
+        if check:
+            for file_id, entry in enumerate(index.files):
+                stat = os.stat(index.file_path(file_id))
+                if (stat.st_size != entry['size'] or
+                        stat.st_mtime != entry['mtime']):
+                    raise ValueError("Indexed file changed, rebuild the "
+                                     "index: {0}".format(entry['path']))
+        return index
+
+    # ------------------
+    #       LOOKUP
+    # ------------------
+
+    def __len__(self):
+        return len(self.records)
+
+    def file_path(self, file_id):
+        '''Returns the path of an indexed file'''
+
+        root = os.path.dirname(os.path.abspath(self.path))
+        return os.path.join(root, self.files[file_id]['path'])
+
+    def window(self, mass, ppm=PPM_TOLERANCE):
+        '''Returns the (lower, upper) rows within ppm of the mass'''
+
+        tolerance = mass * ppm * 1e-6
+        lower = int(self.masses.searchsorted(mass - tolerance, 'left'))
+        upper = int(self.masses.searchsorted(mass + tolerance, 'right'))
+        return lower, upper
+
+    def chargeless_at(self, mass, charge, ppm=PPM_TOLERANCE):
+        '''
+        Returns copies of the records without a CHARGE line within ppm
+        of the neutral mass at the charge, with their mass at it.
+        '''
+
+        # the precursor m/z window of the mass window at the charge
+        mz = mass / charge + PROTON
+        tolerance = mass / charge * ppm * 1e-6
+        lower = int(self.chargeless_mzs.searchsorted(mz - tolerance, 'left'))
+        upper = int(self.chargeless_mzs.searchsorted(mz + tolerance,
+                                                     'right'))
+        records = np.array(self.records[lower:upper])
+        records['mass'] = neutral_mass(records['mz'], charge)
+        return records
+
+    def query_mass(self, mass, ppm=PPM_TOLERANCE, charge=None):
+        '''
+        Returns the records within ppm of the neutral mass, optionally
+        at one charge, in mass order. The records without a CHARGE line
+        are tested at the charge, or at every indexed charge, once
+        each, with their mass at it.
+        '''
+
+        lower, upper = self.window(mass, ppm)
+        records = self.records[max(lower, self.chargeless):upper]
+        if charge is not None:
+            records = records[records['charge'] == charge]
+        if not self.chargeless:
+            return records
+        charges = self.charges if charge is None else [charge]
+        found = [records] + [self.chargeless_at(mass, i, ppm)
+                             for i in charges]
+        records = np.concatenate(found)
+        return records[np.argsort(records['mass'], kind='mergesort')]
+
+    def query(self, mz, charge=None, ppm=PPM_TOLERANCE):
+        '''
+        Returns the records within ppm of the precursor m/z at the
+        charge, or at any charge if None, in mass order.
+        '''
+
+        if charge is not None:
+            return self.query_mass(neutral_mass(mz, charge), ppm, charge)
+        # the same m/z is a different neutral mass at each charge
+        found = [self.query_mass(neutral_mass(mz, i), ppm, i)
+                 for i in self.charges]
+        records = np.concatenate(found) if found else self.records[:0]
+        return records[np.argsort(records['mass'], kind='mergesort')]
+
+    def text(self, record):
+        '''Returns the decoded scan text, read directly at its offset'''
+
+        file_id = int(record['file'])
+        splitter = self._splitters.get(file_id)
+        if splitter is None:
+            splitter = ScanSplitter(self.file_path(file_id))
+            self._splitters[file_id] = splitter
+        start, end = splitter.locate(int(record['offset']))
+        return splitter.text(start, end)
+
+    def write(self, records, fileobj, mz=None, mass=None, text=False):
+        '''
+        Writes a table row for each record found, with the query and
+        the error in ppm from the queried neutral mass, or the queried
+        m/z at the charge of the record, followed by its scan text if
+        `text`.
+        '''
+
+        for record in records:
+            charge = int(record['charge'])
+            if charge == MISSING_CHARGE:
+                # the charge the record was tested at
+                charge = int(round(float(record['mass']) /
+                                   (float(record['mz']) - PROTON)))
+            target = mass
+            if target is None:
+                target = float(neutral_mass(mz, charge))
+            error = (float(record['mass']) - target) / target * 1e6
+            row = [mz if mass is None else mass,
+                   self.files[int(record['file'])]['path'],
+                   int(record['scan']), float(record['mz']),
+                   int(record['charge']), round(float(record['mass']), 5),
+                   round(float(record['rt']), 3), round(error, 3)]
+            fileobj.write('\t'.join(str(i) for i in row) + '\n')
+            if text:
+                fileobj.write(self.text(record) + '\n\n')
+
+    def close(self):
+        '''Closes the memory maps opened for text lookups'''
+
+        splitters, self._splitters = self._splitters, {}
+        for splitter in splitters.values():
+            splitter.close()
+
+    # ------------------
+    #         I/O
+    # ------------------
+
+    @staticmethod
+    def _map(path, count, offset):
+        '''Memory-maps the records of the index, read-only'''
+
+        if not count:
+            return np.empty(0, dtype=DTYPE)
+        return np.memmap(path, dtype=DTYPE, mode='r', offset=offset,
+                         shape=(count,))
+
+    @staticmethod
+    def _write(path, meta, records):
+        '''Writes the index to a temporary file and moves it in place'''
+
+        table = json.dumps(meta).encode('utf-8')
+        with open(temp_path(path), 'wb') as fileobj:
+            fileobj.write(HEADER.pack(MAGIC, VERSION, len(records),
+                                      len(table)))
+            fileobj.write(table)
+            records.tofile(fileobj)
+        replace_file(temp_path(path), path)
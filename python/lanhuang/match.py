@@ -0,0 +1,280 @@
+'''Tolerance matching of PAVA scans to TPP scans by RT and precursor m/z'''
+
+from __future__ import division
+
+# load modules/submodules
+import numpy as np
+
+from .batch import sniff
+from .dialects import PAVA
+from .index import ScanIndex
+from .store import TppScan
+
+
+# CONSTANTS
+# ---------
+
+# seconds, the PAVA titles round the retention time to 0.06 s
+RT_TOLERANCE = 1.0
+PPM_TOLERANCE = 10.0
+# PAVA scans matched per vectorised search
+BATCH = 1 << 16
+REPORT_COLUMNS = ['Scan', 'RAW', 'RT', 'm/z', 'Status', 'TPP Scan',
+                  'Candidates']
+COUNTERS = ['matched', 'renumbered', 'unmatched', 'ambiguous', 'other_raw']
+
+
+# HELPERS
+# -------
+
+
+def _raw_name(raw):
+    '''Normalizes a RAW file name, without any Windows or POSIX path'''
+
+    return raw.replace('\\', '/').rsplit('/', 1)[-1].lower()
+
+
+# MATCHER
+# -------
+
+
+class Matching(object):
+    '''
+    Tolerances for joining PAVA scans to TPP scans by retention time
+    and precursor m/z, rather than by scan number.
+
+    Arguments:
+        rt -- retention time tolerance, in seconds
+        ppm -- precursor m/z tolerance, in ppm, which is skipped for
+            PAVA scans without a precursor m/z
+        report -- file object for the unmatched and ambiguous scans,
+            or None
+    '''
+
+    def __init__(self, rt=RT_TOLERANCE, ppm=PPM_TOLERANCE, report=None):
+        super(Matching, self).__init__()
+
+        if rt <= 0 or ppm <= 0:
+            raise ValueError("Matching tolerances must be positive")
+        self.rt = rt
+        self.ppm = ppm
+        self.report = report
+
+
+class ScanMatcher(object):
+    '''
+    TPP scans sorted by retention time, matched to whole batches of
+    PAVA scans with vectorised binary searches. The RT window of each
+    PAVA scan is expanded into (scan, candidate) pairs, which are
+    filtered by the m/z window and ranked by the error relative to
+    each tolerance, breaking ties by the closest scan number.
+
+    Arguments:
+        store -- TppStore of the TPP scans
+        rt -- retention time tolerance, in seconds
+        ppm -- precursor m/z tolerance, in ppm
+    '''
+
+    def __init__(self, store, rt=RT_TOLERANCE, ppm=PPM_TOLERANCE):
+        super(ScanMatcher, self).__init__()
+
+        self.rt = rt
+        self.ppm = ppm
+        records = store.records
+        # store rows in retention time order
+        self.order = np.argsort(records['rt'], kind='mergesort')
+        self.rts = records['rt'][self.order].astype(np.float64)
+        self.mzs = records['mz'][self.order].astype(np.float64)
+        self.nums = records['scan'][self.order].astype(np.int64)
+
+    def match(self, nums, rts, mzs):
+        '''
+        Returns the store row of the nearest TPP scan for each PAVA
+        scan, or -1, and the number of candidates within tolerance.
+
+        Arguments:
+            nums -- PAVA scan numbers
+            rts -- PAVA retention times, in seconds
+            mzs -- PAVA precursor m/z, or 0 if missing
+        '''
+
+        nums = np.asarray(nums, dtype=np.int64)
+        rts = np.asarray(rts, dtype=np.float64)
+        mzs = np.asarray(mzs, dtype=np.float64)
+        count = len(nums)
+
+        lower = np.searchsorted(self.rts, rts - self.rt, 'left')
+        upper = np.searchsorted(self.rts, rts + self.rt, 'right')
+        sizes = upper - lower
+        # expand the RT window of each scan into (scan, candidate) pairs
+        owners = np.repeat(np.arange(count), sizes)
+        offsets = np.cumsum(sizes) - sizes
+        candidates = (np.repeat(lower - offsets, sizes) +
+                      np.arange(len(owners)))
+
+        error = np.abs(self.rts[candidates] - rts[owners]) / self.rt
+        precursor = mzs[owners]
+        known = precursor > 0
+        ppm = (np.abs(self.mzs[candidates] - precursor) /
+               np.where(known, precursor, 1) * 1e6)
+        within = ~known | (ppm <= self.ppm)
+        error += np.where(known, ppm / self.ppm, 0)
+        owners = owners[within]
+        candidates = candidates[within]
+        error = error[within]
+        hits = np.bincount(owners, minlength=count)
+
+        # nearest candidate first within each scan
+        gap = np.abs(self.nums[candidates] - nums[owners])
+        order = np.lexsort((gap, error, owners))
+        owners = owners[order]
+        candidates = candidates[order]
+        first = np.ones(len(owners), dtype=bool)
+        first[1:] = owners[1:] != owners[:-1]
+        rows = np.full(count, -1, dtype=np.int64)
+        rows[owners[first]] = self.order[candidates[first]]
+        return rows, hits
+
+
+# INDEX
+# -----
+
+
+class MatchedIndex(object):
+    '''
+    Drop-in replacement for ScanIndex.get() which returns the TPP
+    scan matched to the PAVA scan being corrected, by its byte offset,
+    so scan numbers that disagree, or repeat across the RAW files of a
+    mixed PAVA file, never join the wrong scans. The ScanSource of the
+    PAVA scans must be listened to.
+
+    Arguments:
+        index -- ScanIndex of the TPP file
+        owned -- close the index along with this one
+    '''
+
+    def __init__(self, index, owned=False):
+        super(MatchedIndex, self).__init__()
+
+        self.index = index
+        self.owned = owned
+        # PAVA scan offset -> store row
+        self.rows = {}
+        self.current = None
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def get(self, num, default=None):
+        '''Returns the TppScan matched to the current scan, or default'''
+
+        row = self.rows.get(self.current)
+        if row is None:
+            return default
+        return TppScan(*self.index.store.records[row].tolist())
+
+    def before_scan(self, offset):
+        '''Points the index at the PAVA scan being corrected'''
+
+        self.current = offset
+
+    def close(self):
+        '''Closes the TPP index, if it was loaded for the matches'''
+
+        if self.owned:
+            self.index.close()
+
+    # ------------------
+    #      MATCHING
+    # ------------------
+
+    def add(self, matcher, headers, raw=None, report=None):
+        '''
+        Matches a batch of (offset, Header) PAVA scans, skipping the
+        scans from a RAW file other than `raw`.
+        '''
+
+        starts = [i[0] for i in headers]
+        headers = [i[1] for i in headers]
+        rows, hits = matcher.match([i.num for i in headers],
+                                   [i.rt for i in headers],
+                                   [i.mz for i in headers])
+        nums = self.index.store.records['scan']
+        for start, header, row, count in zip(starts, headers, rows, hits):
+            if raw is not None and _raw_name(header.raw) != raw:
+                self._report(report, header, 'other RAW')
+                self.counters['other_raw'] += 1
+                continue
+            if row < 0:
+                self._report(report, header, 'unmatched')
+                self.counters['unmatched'] += 1
+                continue
+            self.rows[start] = int(row)
+            self.counters['matched'] += 1
+            if nums[row] != header.num:
+                self.counters['renumbered'] += 1
+            if count > 1:
+                self._report(report, header, 'ambiguous', nums[row], count)
+                self.counters['ambiguous'] += 1
+
+    @staticmethod
+    def _report(report, header, status, tpp_num=None, count=0):
+        '''Writes a report line for an unmatched or ambiguous scan'''
+
+        if report is None:
+            return
+        row = [header.num, header.raw, round(header.rt, 3), header.mz,
+               status, '' if tpp_num is None else tpp_num, count]
+        report.write('\t'.join(str(i) for i in row) + '\n')
+
+    def write_counters(self, report):
+        '''Writes the match counts at the end of the report'''
+
+        report.write('Matched: {0}\n'.format(self.counters['matched']))
+        report.write('Renumbered: {0}\n'.format(
+            self.counters['renumbered']))
+        report.write('Unmatched: {0}\n'.format(self.counters['unmatched']))
+        report.write('Ambiguous: {0}\n'.format(self.counters['ambiguous']))
+        report.write('Other RAW: {0}\n'.format(self.counters['other_raw']))
+
+
+# API
+# ---
+
+
+def match_scans(tpp_path, scans, matching, index=None, report=True):
+    '''
+    Matches every PAVA scan to the nearest TPP scan within the
+    tolerances, in batches, and returns the MatchedIndex. The PAVA
+    scans of other RAW files than the TPP file are left unmatched.
+
+    Arguments:
+        tpp_path -- TPP file
+        scans -- ScanSplitter over the PAVA file
+        matching -- Matching tolerances and report
+        index -- loaded ScanIndex for tpp_path, or None to load it
+        report -- write the matching report, which is already complete
+            when resuming from a checkpoint
+    '''
+
+    owned = index is None
+    if owned:
+        index = ScanIndex.load(tpp_path)
+    matches = MatchedIndex(index, owned)
+    matcher = ScanMatcher(matches.index.store, matching.rt, matching.ppm)
+    raw = sniff(tpp_path)[1]
+    if raw is not None:
+        raw = _raw_name(raw)
+    report = matching.report if report else None
+    if report is not None:
+        report.write('\t'.join(REPORT_COLUMNS) + '\n')
+
+    headers = []
+    for start, _ in scans:
+        headers.append((scans.base + start, PAVA.parse(scans.map, start)))
+        if len(headers) >= BATCH:
+            matches.add(matcher, headers, raw, report)
+            headers = []
+    if headers:
+        matches.add(matcher, headers, raw, report)
+    if report is not None:
+        matches.write_counters(report)
+    return matches
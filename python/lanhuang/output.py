@@ -0,0 +1,225 @@
+'''Checkpointed, threaded, sharded or spliced outputs of corrected scans'''
+
+# load modules/submodules
+from .checkpoint import Checkpoint, commit_output, open_output
+from .compression import from_extension
+from .pipeline import ThreadedWriter
+from .scans import ENCODING
+from .shards import ShardedWriter
+from .splice import SpliceWriter
+
+
+# WRITER
+# ------
+
+
+class ScanWriter(object):
+    '''
+    Writes the corrected scans to a text file object, rendering each
+    scan after its header edits, or splicing the unchanged bytes of
+    the source scans straight to the underlying binary file.
+
+    Arguments:
+        fileobj -- text output file object
+        splice -- copy the unchanged source bytes, rather than
+            rendering the scans
+    '''
+
+    def __init__(self, fileobj, splice=False):
+        super(ScanWriter, self).__init__()
+
+        self.out = fileobj
+        self.splice = splice
+        self.splicer = None
+        # output files truncated on a rewind
+        self.files = {'out': fileobj}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def offset(self):
+        '''Input offset to resume from'''
+
+        return 0
+
+    @property
+    def resumed(self):
+        '''Whether the scans before `offset` are already written'''
+
+        return False
+
+    def open(self, scans):
+        '''Starts writing the corrected scans of the ScanSource'''
+
+        if self.splice:
+            # bytes are written below the text layer
+            self.out.flush()
+            self.splicer = SpliceWriter(scans, self.out.buffer)
+
+    def track(self, name, fileobj):
+        '''Tracks another output file, ie, a summary, for rewinds'''
+
+        self.files[name] = fileobj
+
+    def attach(self, counters):
+        '''Tracks the counters of the correction'''
+
+    # ------------------
+    #       WRITING
+    # ------------------
+
+    def write(self, text):
+        '''Writes the text of one or more complete scans'''
+
+        self.out.write(text)
+
+    def write_scan(self, rewriter, header, end, edits):
+        '''
+        Writes the scan up to end after the HeaderRewriter edits, and
+        the separator before the next scan.
+        '''
+
+        if self.splicer is not None:
+            rewriter.splice(self.splicer, header, end, edits)
+        else:
+            scan = rewriter.render(header, end, edits).decode(ENCODING)
+            self.out.write(''.join([scan, '\n\n']))
+
+    def rewind(self):
+        '''Truncates the output files, to restart the correction'''
+
+        for fileobj in self.files.values():
+            fileobj.seek(0)
+            fileobj.truncate()
+        if self.splicer is not None:
+            self.splicer = SpliceWriter(self.splicer.scans, self.out.buffer)
+
+    def flush(self):
+        '''
+        Writes any pending spliced bytes, which must be done before the
+        source is closed.
+        '''
+
+        if self.splicer is not None:
+            self.splicer.close()
+
+    def close(self):
+        '''Writes any spliced bytes and closes the output file'''
+
+        self.flush()
+        self.out.close()
+
+
+class Output(ScanWriter):
+    '''
+    Writes the corrected scans to a temporary file, which is moved to
+    `path` once the output is complete. A single pass to a plain,
+    unspliced output is checkpointed, so an interrupted correction can
+    resume from its checkpoint while the inputs are unchanged.
+
+    Arguments:
+        path -- output file, compressed by its extension
+        inputs -- input paths fingerprinted by the checkpoint, or None
+            to never checkpoint, ie, for parallel or cached corrections
+        resume -- continue from the last checkpoint
+        pipeline -- write behind the parser in a background thread
+        sharding -- Sharding to split the output into shards and a
+            manifest, or None
+        splice -- copy the unchanged source bytes straight to the output
+    '''
+
+    def __init__(self, path, inputs=None, resume=False, pipeline=False,
+                 sharding=None, splice=False):
+        if sharding is not None and splice:
+            raise ValueError("Sharded outputs are written without "
+                             "splicing")
+
+        self.path = path
+        self.sharding = sharding
+        self.checkpoint = None
+        if inputs is not None and not (sharding or splice or
+                                       from_extension(path)):
+            inputs = [i for i in inputs if i is not None]
+            self.checkpoint = Checkpoint(path, inputs)
+            if resume:
+                self.checkpoint.load()
+        if sharding is not None:
+            out = ShardedWriter(path, sharding, pipeline)
+        else:
+            out = open_output(path, self.checkpoint)
+            if pipeline and not splice:
+                out = ThreadedWriter(out)
+        super(Output, self).__init__(out, splice)
+
+        if self.checkpoint is not None:
+            self.checkpoint.open(self.files)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if exc_type is None:
+            self.commit()
+
+    @property
+    def offset(self):
+        if self.checkpoint is None:
+            return 0
+        return self.checkpoint.offset
+
+    @property
+    def resumed(self):
+        return self.checkpoint is not None and (
+            self.checkpoint.state is not None)
+
+    def open(self, scans):
+        '''
+        Starts writing the corrected scans of the ScanSource, from the
+        checkpoint, which is then saved as the scans are processed.
+        '''
+
+        if self.checkpoint is not None:
+            scans.start = self.offset
+            scans.listen(self)
+        if self.sharding is not None:
+            self.out.measure(scans.splitter)
+        super(Output, self).open(scans)
+
+    def track(self, name, fileobj):
+        '''
+        Tracks another output file, ie, a summary, which is truncated
+        back to the checkpoint when resuming.
+        '''
+
+        super(Output, self).track(name, fileobj)
+        if self.checkpoint is not None:
+            self.checkpoint.track(name, fileobj)
+
+    def attach(self, counters):
+        '''Tracks the counters, restoring those of the checkpoint'''
+
+        if self.checkpoint is not None:
+            self.checkpoint.attach(counters)
+
+    def after_scan(self, offset):
+        '''Saves a checkpoint once enough input was processed'''
+
+        self.checkpoint.update(offset)
+
+    def rewind(self):
+        '''Truncates the output files back to the checkpoint'''
+
+        if self.checkpoint is None:
+            super(Output, self).rewind()
+        else:
+            self.checkpoint.rewind()
+
+    def commit(self):
+        '''Moves the complete output, or its shards, into place'''
+
+        if self.sharding is not None:
+            self.out.commit()
+        else:
+            commit_output(self.path, self.checkpoint)
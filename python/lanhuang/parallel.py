@@ -0,0 +1,62 @@
+'''Multi-process processing of MGF files over byte-range shards'''
+
+# load modules/submodules
+import io
+import multiprocessing
+import os
+import shutil
+
+from .scans import ENCODING, ScanSplitter
+
+
+# HELPERS
+# -------
+
+
+def part_path(path, index):
+    '''Returns the temporary output path for a shard'''
+
+    return '{0}.part{1}'.format(path, index)
+
+
+# SHARDS
+# ------
+
+
+def map_shards(path, jobs, worker, initializer=None, initargs=()):
+    '''
+    Cuts `path` into `jobs` byte ranges aligned on "BEGIN IONS" and
+    maps `worker` over the (index, (start, end)) shards in a process
+    pool, returning the results in file order.
+
+    Arguments:
+        path -- MGF file to shard
+        jobs -- number of worker processes
+        worker -- picklable, module-level callable
+        initializer, initargs -- per-process setup, ie, loading the
+            read-only TPP scan data
+    '''
+
+    with ScanSplitter(path) as splitter:
+        shards = list(enumerate(splitter.ranges(jobs)))
+    if not shards:
+        return []
+
+    pool = multiprocessing.Pool(min(jobs, len(shards)), initializer,
+                                initargs)
+    try:
+        results = pool.map(worker, shards, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+
+def stitch(parts, fileobj):
+    '''Appends each shard output to fileobj in order, then removes it'''
+
+    for part in parts:
+        with io.open(part, 'r', encoding=ENCODING, newline='') as src:
+            shutil.copyfileobj(src, fileobj)
+        os.remove(part)
@@ -0,0 +1,355 @@
+'''Charge state correction of PAVA files from the matching TPP scans'''
+
+# load modules/submodules
+import functools
+import io
+import os
+import time
+
+from multiprocessing import cpu_count
+
+import six
+
+if six.PY2:
+    from cStringIO import StringIO
+else:
+    from io import StringIO
+
+from .batch import (batch_directory, find_inputs, output_path, pair_inputs,
+                    run_batch, write_summary, SUMMARY_NAME)
+from .compression import strip_extension
+from .header import tokenize_header
+from .index import ScanIndex
+from .join import MergeJoin, ScanOrderError
+from .output import Output, ScanWriter
+from .parallel import map_shards, part_path, stitch
+from .rewrite import CHARGE, HeaderRewriter
+from .scans import ENCODING, ScanSource
+
+
+# CONSTANTS
+# ---------
+
+SUMMARY_SUFFIX = '_charge_states.txt'
+BATCH_FIELDS = ['changed', 'TPP', 'PAVA']
+
+
+# PARSER
+# ------
+
+
+class ParseMgf(object):
+    '''Parses MGF file format using series of known subs (specific
+    to each version of MGF file) and stores data in dictionary.
+    MGF Format:
+        BEGIN IONS
+        scan=470
+        PEPMASS=473.456
+        ...
+        475.34\t1800
+        ...
+        END IONS
+    '''
+
+    _charges = HeaderRewriter([CHARGE])
+
+    def __init__(self, scans, tpp_data, out, summary):
+        super(ParseMgf, self).__init__()
+
+        # bind instance attributes
+        self.scans = scans
+        # read/write new string
+        self.parser = self.process_pava_scan
+        self.data = out
+        self.summary = summary
+        self.counters = dict.fromkeys(['TPP', 'PAVA', 'scans', 'changed'], 0)
+        self.tpp_data = tpp_data
+
+    def run(self, header=True):
+        '''On start. Iterates over the scans of the source, which are
+        split from the file in a single linear pass. The summary header
+        is already written when resuming.
+        '''
+
+        if header:
+            self.write_header()
+        self.correct()
+        self.write_counters()
+
+    def correct(self):
+        '''Corrects each scan, without the summary header or counts'''
+
+        for start, end in self.scans:
+            self.parser(start, end)
+
+    # ------------------
+    #        MAIN
+    # ------------------
+
+    def process_pava_scan(self, start, end):
+        '''Processes a single scan and stores the data in self.data.
+        Stores the meta-data directly and then processes the scan
+        spectra via self.process_data(). Processes PAVA-like formats.
+
+        Arguments:
+            start, end -- byte offsets of the scan within the mapped file
+        '''
+
+        # tokenize the header only, never the peak list
+        header = tokenize_header(self.scans.map, start, end)
+        self.process_scan(header, end, header.scan('PAVA'), header.charge)
+
+    def process_scan(self, header, end, num, charge):
+        '''Replaces the charge from the TPP data and writes the scan and
+        the summary line.
+        '''
+
+        tpp_scan = self.tpp_data.get(num)
+        tpp_charge = None if tpp_scan is None else tpp_scan.charge
+        # process changes
+        edits = self.replace_charges(header, tpp_charge, charge)
+        # write to file
+        self.write_scan(header, end, edits)
+        # process summary
+        self.adjust_counters(tpp_charge, charge)
+        if edits:
+            self.counters['changed'] += 1
+        self.write_line(num, tpp_charge, charge)
+
+    # ------------------
+    #        UTILS
+    # ------------------
+
+    def replace_charges(self, header, tpp_charge, charge):
+        '''
+        Returns the edits raising the CHARGE value to the TPP charge.
+        A missing CHARGE line is never replaced.
+        '''
+
+        if tpp_charge is not None and tpp_charge > charge:
+            return self._charges.edits(header, {'charge': tpp_charge})
+        return []
+
+    def write_scan(self, header, end, edits):
+        '''Writes the scan up to end, after the edits'''
+
+        self.data.write_scan(self._charges, header, end, edits)
+
+    def write_header(self):
+        '''Writes the comparative header to the summary'''
+
+        self.summary.write('Scan\tMGF\tPAVA\n')
+
+    def write_counters(self):
+        '''Writes the end of charges counts to the summary'''
+
+        tpp_count = 'TPP Scans Above 1: {0}\n'.format(self.counters['TPP'])
+        self.summary.write(tpp_count)
+        pava_count = 'PAVA Scans Above 1: {0}\n'.format(
+            self.counters['PAVA'])
+        self.summary.write(pava_count)
+
+    def adjust_counters(self, tpp_charge, pava_charge):
+        '''Toggles the counters depending on the charge states of
+        given scans.
+        '''
+
+        # add counters
+        self.counters['scans'] += 1
+        if tpp_charge != 1:
+            self.counters['TPP'] += 1
+        if pava_charge != 1:
+            self.counters['PAVA'] += 1
+
+    def write_line(self, num, tpp_charge, pava_charge):
+        '''Writes a line if the two charges differ'''
+
+        if tpp_charge != pava_charge:
+            out = '{0}\t{1}\t{2}\n'.format(num, tpp_charge, pava_charge)
+            self.summary.write(out)
+
+
+# WORKERS
+# -------
+
+_TPP_DATA = None
+
+
+def init_worker(tpp_path):
+    '''Loads the shared, read-only tpp scan index in each worker'''
+
+    global _TPP_DATA  # pylint: disable=global-statement
+    _TPP_DATA = ScanIndex.load(tpp_path)
+
+
+def correct_shard(pava_path, out_path, splice, shard):
+    '''Corrects the pava scans within a byte range to a part file'''
+
+    index, (start, end) = shard
+    path = part_path(out_path, index)
+    summary = StringIO()
+    with ScanSource(pava_path, start, end) as scans:
+        out = io.open(path, 'w', encoding=ENCODING, newline='')
+        with ScanWriter(out, splice) as writer:
+            writer.open(scans)
+            pava_cls = ParseMgf(scans, _TPP_DATA, writer, summary)
+            pava_cls.correct()
+    return path, summary.getvalue(), pava_cls.counters
+
+
+def _correct(scans, tpp_data, out, summary):
+    '''Corrects the pava scans, continuing from any checkpoint'''
+
+    pava_cls = ParseMgf(scans, tpp_data, out, summary)
+    out.attach(pava_cls.counters)
+    pava_cls.run(not out.resumed)
+    out.flush()
+    return pava_cls.counters
+
+
+# API
+# ---
+
+
+def fix_pava(scans, tpp_data, out, summary=None):
+    '''
+    Raises the mis-assigned charge states of the PAVA scans to the
+    TPP charge states, or to the charges inferred from the isotope
+    envelopes, writes the corrected scans, and returns the counters.
+    A MergeJoin which finds the TPP scans out of order restarts the
+    correction on the ScanIndex of the TPP file.
+
+    Arguments:
+        scans -- ScanSource of the PAVA scans
+        tpp_data -- TPP scans by number, ie, a ScanIndex or MergeJoin,
+            or a MatchedIndex or InferredCharges, which follow the
+            source
+        out -- Output, or ScanWriter, for the corrected scans
+        summary -- file object for the charge state summary, or None
+    '''
+
+    if summary is None:
+        summary = StringIO()
+    else:
+        out.track('summary', summary)
+    out.open(scans)
+    scans.listen(tpp_data)
+    try:
+        counters = _correct(scans, tpp_data, out, summary)
+        if isinstance(tpp_data, MergeJoin):
+            # the TPP scans after the last PAVA scan must be in order too
+            tpp_data.finish()
+    except ScanOrderError:
+        # out of order, restart on the indexed path
+        out.rewind()
+        tpp_data = tpp_data.fallback()
+        try:
+            counters = _correct(scans, tpp_data, out, summary)
+        finally:
+            tpp_data.close()
+    counters.update(getattr(tpp_data, 'counters', {}))
+    return counters
+
+
+def fix_pava_jobs(tpp_path, pava_path, out, jobs, summary=None):
+    '''
+    Corrects the PAVA file as fix_pava() does, over byte-range shards
+    in parallel, each corrected against the ScanIndex of the TPP file,
+    and returns the counters.
+
+    Arguments:
+        tpp_path, pava_path -- input files, optionally compressed
+        out -- Output, without a checkpoint, for the corrected scans
+        jobs -- worker processes, each correcting a byte range
+        summary -- file object for the charge state summary, or None
+    '''
+
+    if summary is None:
+        summary = StringIO()
+    # build the sidecar once, before the workers load it
+    ScanIndex.load(tpp_path).close()
+    worker = functools.partial(correct_shard, pava_path, out.path,
+                               out.splice)
+    results = map_shards(pava_path, jobs, worker, init_worker, (tpp_path,))
+    # stitch the shards back in file order
+    pava_cls = ParseMgf(None, None, out, summary)
+    pava_cls.write_header()
+    for path, text, counters in results:
+        stitch([path], out.out)
+        summary.write(text)
+        for key, value in counters.items():
+            pava_cls.counters[key] += value
+    pava_cls.write_counters()
+    return pava_cls.counters
+
+
+# BATCH
+# -----
+
+
+def batch_summary_path(pava_path, out_path):
+    '''Returns the charge state summary path beside the output'''
+
+    name = os.path.basename(strip_extension(pava_path))
+    name = os.path.splitext(name)[0]
+    return os.path.join(os.path.dirname(out_path), name + SUMMARY_SUFFIX)
+
+
+def correct_pair(task, tpp_data=None):
+    '''Corrects one pava file from a batch, returning its stats'''
+
+    tpp_path, pava_path, out_path, summary_path = task
+    start = time.time()
+    summary = None
+    if summary_path is not None:
+        summary = open(summary_path, 'w')
+    owned = tpp_data is None
+    if owned:
+        tpp_data = ScanIndex.load(tpp_path)
+    try:
+        with Output(out_path, [tpp_path, pava_path]) as out:
+            with ScanSource(pava_path) as scans:
+                counters = fix_pava(scans, tpp_data, out, summary)
+    finally:
+        if owned:
+            tpp_data.close()
+        if summary is not None:
+            summary.close()
+
+    stats = dict(counters, tpp=tpp_path, pava=pava_path)
+    stats['bytes'] = os.path.getsize(pava_path)
+    stats['seconds'] = time.time() - start
+    return stats
+
+
+def fix_pava_batch(path, out_dir=None, summary=False, jobs=None):
+    '''
+    Corrects every paired pava file in a directory or manifest, and
+    writes the batch summary. Returns the stats, or the error row, for
+    each pair.
+
+    Arguments:
+        path -- directory or manifest of TPP and PAVA files
+        out_dir -- output directory, or None for beside each PAVA file
+        summary -- write a charge state summary for each PAVA file
+        jobs -- worker processes, one PAVA/TPP pair each
+    '''
+
+    start = time.time()
+    if out_dir and not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    pairs, unpaired, ambiguous = pair_inputs(find_inputs(path))
+    tasks = []
+    for tpp, pava in pairs:
+        out_path = output_path(pava, out_dir)
+        summary_path = None
+        if summary:
+            summary_path = batch_summary_path(pava, out_path)
+        tasks.append((tpp, pava, out_path, summary_path))
+    results = run_batch(tasks, correct_pair, jobs or cpu_count())
+
+    directory = out_dir or batch_directory(path)
+    with open(os.path.join(directory, SUMMARY_NAME), 'w') as fileobj:
+        write_summary(fileobj, results, BATCH_FIELDS, unpaired,
+                      time.time() - start, ambiguous)
+    return results
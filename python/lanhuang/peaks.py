@@ -0,0 +1,138 @@
+'''Vectorised peak-list reduction, applied to each spectrum as it streams'''
+
+# load modules/submodules
+import numpy as np
+
+from .charges import NEUTRON
+
+
+# CONSTANTS
+# ---------
+
+# m/z width of the windows the most intense peaks are kept within
+TOP_WINDOW = 100.0
+# m/z tolerance and highest fragment charge for de-isotoping
+DEISOTOPE_TOLERANCE = 0.02
+DEISOTOPE_CHARGE = 2
+
+
+# FILTERS
+# -------
+
+
+def top_per_window(mz, intensity, top, window=TOP_WINDOW):
+    '''
+    Returns a mask of the `top` most intense peaks within each m/z
+    window of width `window`, ranked with a single sort of the
+    peaks by window and descending intensity.
+    '''
+
+    bins = np.floor(mz / window).astype(np.int64)
+    order = np.lexsort((-intensity, bins))
+    ordered = bins[order]
+    # rank of each peak within its window
+    rank = np.arange(len(order)) - np.searchsorted(ordered, ordered)
+    keep = np.zeros(len(mz), dtype=bool)
+    keep[order[rank < top]] = True
+    return keep
+
+
+def isotope_peaks(mz, intensity, tolerance=DEISOTOPE_TOLERANCE,
+                  max_charge=DEISOTOPE_CHARGE):
+    '''
+    Returns a mask of the peaks which are the heavier isotope of a
+    more intense peak, one neutron mass over a charge of
+    1..max_charge below them.
+    '''
+
+    isotopes = np.zeros(len(mz), dtype=bool)
+    if not len(mz):
+        return isotopes
+    order = np.argsort(mz, kind='mergesort')
+    ordered = mz[order]
+    heights = intensity[order]
+    # flags in m/z order, scattered back once
+    flags = np.zeros(len(mz), dtype=bool)
+    last = len(ordered) - 1
+    for charge in range(1, max_charge + 1):
+        targets = ordered - NEUTRON / charge
+        index = np.searchsorted(ordered, targets)
+        for neighbor in (np.minimum(index, last), np.maximum(index - 1, 0)):
+            flags |= ((np.abs(ordered[neighbor] - targets) <= tolerance) &
+                      (heights[neighbor] > heights))
+    isotopes[order] = flags
+    return isotopes
+
+
+class PeakFilter(object):
+    '''
+    Reduces the peak list of each spectrum to the informative peaks,
+    on the decoded NumPy arrays, and keeps the original text of each
+    retained peak line, in order. The stages are applied in turn:
+    precursor-window removal, a relative intensity floor,
+    de-isotoping, and the top N peaks per m/z window.
+
+    Arguments:
+        top -- peaks kept per m/z window, or None
+        window -- m/z width of the windows for `top`
+        floor -- fraction of the base peak intensity a peak must
+            reach, or None
+        precursor -- m/z half-width removed around the precursor, or
+            None
+        deisotope -- remove the heavier isotopes of each peak
+        tolerance -- m/z tolerance for de-isotoping
+    '''
+
+    def __init__(self, top=None, window=TOP_WINDOW, floor=None,
+                 precursor=None, deisotope=False,
+                 tolerance=DEISOTOPE_TOLERANCE):
+        super(PeakFilter, self).__init__()
+
+        if top is not None and top < 1:
+            raise ValueError("Peaks kept per window must be positive")
+        if window <= 0 or tolerance <= 0:
+            raise ValueError("Peak windows and tolerances must be positive")
+        if floor is not None and not 0 <= floor < 1:
+            raise ValueError("Intensity floor must be a fraction below 1")
+        self.top = top
+        self.window = window
+        self.floor = floor
+        self.precursor = precursor
+        self.deisotope = deisotope
+        self.tolerance = tolerance
+
+    def keep(self, mz, intensity, precursor=0):
+        '''Returns the ascending indexes of the kept peaks'''
+
+        index = np.arange(len(mz))
+        if self.precursor and precursor > 0:
+            index = index[np.abs(mz - precursor) > self.precursor]
+        if self.floor and len(index):
+            heights = intensity[index]
+            index = index[heights >= self.floor * heights.max()]
+        if self.deisotope:
+            index = index[~isotope_peaks(mz[index], intensity[index],
+                                         self.tolerance)]
+        if self.top is not None:
+            index = index[top_per_window(mz[index], intensity[index],
+                                         self.top, self.window)]
+        return index
+
+    def apply(self, block, mz, intensity, precursor=0):
+        '''
+        Returns the text of the kept peak lines within block, the
+        peak list of a spectrum decoded to mz and intensity, with the
+        line terminators of the block. The block is returned as is if
+        its lines do not match the peaks.
+        '''
+
+        lines = block.splitlines(True)
+        if len(lines) != len(mz):
+            lines = [i for i in lines if i.strip()]
+            if len(lines) != len(mz):
+                return block
+        index = self.keep(mz, intensity, precursor)
+        newline = '\r\n' if lines and lines[0].endswith('\r\n') else '\n'
+        # the last line may end the block without a terminator
+        return ''.join([lines[i] if lines[i].endswith('\n') else
+                        lines[i] + newline for i in index.tolist()])
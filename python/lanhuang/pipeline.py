@@ -0,0 +1,192 @@
+'''Threaded read-ahead and write-behind stages for the MGF converters'''
+
+# load modules/submodules
+import threading
+
+from six.moves import queue
+
+
+# CONSTANTS
+# ---------
+
+# bytes read ahead of the parser, and per read
+READ_AHEAD = 64 << 20
+READ_CHUNK = 4 << 20
+
+# characters joined per queued write, and queued writes
+WRITE_BATCH = 1 << 20
+WRITE_QUEUE = 8
+
+
+# READER
+# ------
+
+
+class ReadAhead(object):
+    '''
+    Reader thread which streams a file into the page cache ahead of
+    the parser, with at most `distance` bytes read ahead of the
+    parser position. The reads release the GIL, so the disk or
+    network share stays busy while Python parses, and the parser then
+    finds the mapped pages already resident.
+
+    Arguments:
+        path -- mapped file
+        start, end -- byte range to read
+        distance -- maximum read-ahead, in bytes
+    '''
+
+    def __init__(self, path, start, end, distance=READ_AHEAD):
+        super(ReadAhead, self).__init__()
+
+        self.path = path
+        self.start = start
+        self.end = end
+        self.distance = distance
+        self.position = start
+        self.condition = threading.Condition()
+        self.done = False
+        self.thread = threading.Thread(target=self._read_ahead)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def advance(self, position):
+        '''Moves the parser position, letting the reader move on'''
+
+        with self.condition:
+            self.position = position
+            self.condition.notify()
+
+    def stop(self):
+        '''Stops the reader thread'''
+
+        with self.condition:
+            self.done = True
+            self.condition.notify()
+        self.thread.join()
+
+    def _read_ahead(self):
+        '''Reads the file in chunks, bounded by the parser position'''
+
+        buf = bytearray(READ_CHUNK)
+        with open(self.path, 'rb', 0) as fileobj:
+            offset = self.start
+            fileobj.seek(offset)
+            while offset < self.end:
+                with self.condition:
+                    while (not self.done and
+                           offset >= self.position + self.distance):
+                        self.condition.wait()
+                    if self.done:
+                        return
+                read = fileobj.readinto(buf)
+                if not read:
+                    return
+                offset += read
+
+
+# WRITER
+# ------
+
+
+class ThreadedWriter(object):
+    '''
+    File-like writer which joins small writes into large batches and
+    hands them to a writer thread through a bounded queue, so output
+    I/O overlaps with parsing. Errors in the writer thread are raised
+    on the next write, flush or close.
+
+    Arguments:
+        fileobj -- output file object
+        batch -- characters or bytes joined per queued write
+        maxsize -- maximum queued batches
+    '''
+
+    def __init__(self, fileobj, batch=WRITE_BATCH, maxsize=WRITE_QUEUE):
+        super(ThreadedWriter, self).__init__()
+
+        self.fileobj = fileobj
+        self.batch = batch
+        self.pending = []
+        self.size = 0
+        self.error = None
+        self.queue = queue.Queue(maxsize)
+        self.thread = threading.Thread(target=self._write)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _write(self):
+        '''Writes each queued batch, until the None sentinel'''
+
+        while True:
+            data = self.queue.get()
+            try:
+                if data is None:
+                    return
+                if self.error is None:
+                    self.fileobj.write(data)
+            except Exception as error:  # pylint: disable=broad-except
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def _check(self):
+        '''Raises any error from the writer thread'''
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _queue(self):
+        '''Queues the pending writes as a single batch'''
+
+        if self.pending:
+            self.queue.put(self.pending[0][:0].join(self.pending))
+            self.pending = []
+            self.size = 0
+
+    def write(self, data):
+        '''Buffers data, queueing a batch once it is large enough'''
+
+        self._check()
+        self.pending.append(data)
+        self.size += len(data)
+        if self.size >= self.batch:
+            self._queue()
+
+    def flush(self):
+        '''Waits for every queued write, then flushes the file'''
+
+        self._queue()
+        self.queue.join()
+        self._check()
+        self.fileobj.flush()
+
+    def seek(self, *args):
+        self.flush()
+        return self.fileobj.seek(*args)
+
+    def truncate(self, *args):
+        self.flush()
+        return self.fileobj.truncate(*args)
+
+    def tell(self):
+        self.flush()
+        return self.fileobj.tell()
+
+    def fileno(self):
+        return self.fileobj.fileno()
+
+    def close(self):
+        '''Drains the queue, stops the writer thread and closes the file'''
+
+        if self.thread is None:
+            return
+        self._queue()
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        try:
+            self._check()
+        finally:
+            self.fileobj.close()
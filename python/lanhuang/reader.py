@@ -0,0 +1,100 @@
+'''Spectrum reader decoding MGF peak lists to NumPy arrays'''
+
+# load modules/submodules
+from collections import namedtuple
+
+import numpy as np
+
+from .dialects import DIALECTS
+from .scans import END_SUB, ScanSplitter
+
+
+# OBJECTS
+# -------
+
+# start, peaks and end are byte offsets of the scan, its peak list and
+# the end of "END IONS" in the source file
+Spectrum = namedtuple("Spectrum", "header mz intensity start peaks end")
+
+
+# PEAKS
+# -----
+
+
+def decode_peaks(buf, start, end):
+    '''
+    Decodes the "m/z intensity" peak lines within buf[start:end] into
+    m/z and intensity float64 arrays, with a single vectorised
+    conversion for the whole block. Any columns past the intensity,
+    such as fragment charges, are dropped.
+    '''
+
+    block = bytes(buf[start:end]).strip()
+    first = block.split(b'\n', 1)[0]
+    columns = len(first.split())
+    if not columns:
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty
+
+    try:
+        values = np.fromstring(block, dtype=np.float64, sep=' ')
+    except ValueError:
+        # non-numeric columns, ie, "1+" fragment charges
+        values = None
+    # older NumPy stops at the first non-numeric token with a warning,
+    # so the values must also fill every line
+    if values is None or values.size != columns * (block.count(b'\n') + 1):
+        # ragged or blank peak lines, fall back to converting line by line
+        lines = (i.split()[:2] for i in block.splitlines() if i.strip())
+        values = np.array(list(lines), dtype=np.float64)
+        columns = 2
+    values = values.reshape(-1, columns)
+
+    return values[:, 0].copy(), values[:, 1].copy()
+
+
+# READER
+# ------
+
+
+class MgfReader(object):
+    '''
+    Iterates over an MGF file, yielding a Spectrum with the typed
+    header fields and the decoded peak arrays for each scan. Uses the
+    same scan splitter and header patterns as the ParseMgf classes.
+
+    Arguments:
+        path -- MGF file path
+        dialect -- Dialect or dialect name, ie, 'PAVA'
+        default_charge -- charge of the scans without a CHARGE line
+    '''
+
+    def __init__(self, path, dialect, default_charge=1):
+        super(MgfReader, self).__init__()
+
+        self.splitter = ScanSplitter(path)
+        self.dialect = DIALECTS.get(dialect, dialect)
+        self.default_charge = default_charge
+
+    def __iter__(self):
+        for start, end in self.splitter:
+            buf = self.splitter.map
+            match = self.dialect.match(buf, start)
+            peaks = match.end()
+            mz, intensity = decode_peaks(buf, peaks, end - len(END_SUB))
+            header = self.dialect.header(match, self.default_charge)
+            # offsets within the file, for a compressed file too
+            base = self.splitter.base
+            yield Spectrum(header, mz, intensity, base + start,
+                           base + peaks, base + end)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''Closes the underlying scan splitter'''
+
+        self.splitter.close()
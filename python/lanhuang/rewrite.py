@@ -0,0 +1,116 @@
+'''Precompiled header-rewrite engine, editing tokenized header fields'''
+
+# load modules/submodules
+import re
+
+from .scans import ENCODING
+from .splice import SEPARATOR
+
+
+# TEMPLATES
+# ---------
+
+
+class FieldTemplate(object):
+    '''
+    Compiled replacement for the value of one header field.
+
+    Arguments:
+        key -- header key, ie, b'PEPMASS'
+        template -- str.format template for the new value, from the
+            rewrite values, ie, '{mz}\\t{intensity}'
+        pattern -- bytes regex matched at the start of the old value;
+            only the matched prefix is replaced, and the field is left
+            as is when it does not match
+    '''
+
+    def __init__(self, key, template, pattern=br'[^\r\n]*'):
+        super(FieldTemplate, self).__init__()
+
+        self.key = key
+        self.template = template
+        self.pattern = re.compile(pattern)
+
+    def __repr__(self):
+        return 'FieldTemplate({0!r}, {1!r})'.format(self.key, self.template)
+
+    def render(self, values):
+        '''Formats the new value as bytes'''
+
+        return self.template.format(**values).encode(ENCODING)
+
+
+PEPMASS = FieldTemplate(b'PEPMASS', '{mz}\t{intensity}',
+                        br'[0-9]*\.?[0-9]*\t[0-9]*\.?[0-9]*')
+PEPMASS_MZ = FieldTemplate(b'PEPMASS', '{mz}', br'[0-9]*\.?[0-9]*')
+CHARGE = FieldTemplate(b'CHARGE', '{charge}+', br'[0-9]+\+')
+TITLE = FieldTemplate(b'TITLE', 'Scan {num} (rt={minutes}) [{raw}]')
+RTINSECONDS = FieldTemplate(b'RTINSECONDS', '{rt}', br'[0-9]*\.?[0-9]*')
+
+
+# REWRITER
+# --------
+
+
+class HeaderRewriter(object):
+    '''
+    Rewrites fields of a tokenized ScanHeader by position, leaving the
+    rest of the scan untouched, rather than building a regex for each
+    scan and substituting over the full scan text. The edits() are
+    applied to bytes with render(), or to a SpliceWriter with splice().
+
+    Arguments:
+        templates -- FieldTemplate for each field to rewrite
+    '''
+
+    def __init__(self, templates):
+        super(HeaderRewriter, self).__init__()
+
+        self.templates = list(templates)
+
+    def edits(self, header, values):
+        '''
+        Returns the sorted (start, end, bytes) edits to the source
+        buffer, skipping fields which are missing, do not match, or
+        are unchanged.
+        '''
+
+        edits = []
+        buf = header.buf
+        for template in self.templates:
+            span = header.span(template.key)
+            if span is None:
+                continue
+            match = template.pattern.match(buf, span[0], span[1])
+            if match is None:
+                continue
+            data = template.render(values)
+            if data != buf[span[0]:match.end()]:
+                edits.append((span[0], match.end(), data))
+        edits.sort()
+        return edits
+
+    def render(self, header, end, edits):
+        '''Returns the scan bytes up to end, after the edits'''
+
+        pieces = []
+        position = header.start
+        for start, stop, data in edits:
+            pieces.append(header.buf[position:start])
+            pieces.append(data)
+            position = stop
+        pieces.append(header.buf[position:end])
+        return b''.join(pieces)
+
+    def splice(self, writer, header, end, edits, separator=SEPARATOR):
+        '''
+        Writes the scan after the edits, and the separator, to a
+        SpliceWriter, copying the unchanged byte ranges.
+        '''
+
+        position = header.start
+        for start, stop, data in edits:
+            writer.copy(position, start)
+            writer.write(data)
+            position = stop
+        writer.copy_scan(position, end, separator)
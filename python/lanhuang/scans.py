@@ -0,0 +1,499 @@
+'''Memory-mapped scan splitting for MGF and MGF-like files'''
+
+# load modules/submodules
+import mmap
+import os
+
+from .compression import decompressed_chunks, detect
+from .pipeline import READ_AHEAD, ReadAhead
+
+
+# CONSTANTS
+# ---------
+
+START_SUB = b'BEGIN IONS'
+END_SUB = b'END IONS'
+
+# latin-1 maps every byte to a code point, so decoded scans always
+# round-trip back to the original bytes on write
+ENCODING = 'latin-1'
+
+# input bytes searched per call when counting the scans or lines
+COUNT_CHUNK = 16 << 20
+
+
+# HELPERS
+# -------
+
+
+def count_sub(buf, sub, size=COUNT_CHUNK):
+    '''
+    Counts the occurrences of sub in a mapped file, searching it in
+    chunks so no more than `size` bytes are copied at once.
+    '''
+
+    count = 0
+    # a match starting in the chunk may end past it
+    overlap = len(sub) - 1
+    for start in range(0, len(buf), size):
+        count += buf[start:start + size + overlap].count(sub)
+    return count
+
+
+# SPLITTER
+# --------
+
+
+class ScanSplitter(object):
+    '''
+    Memory-maps an MGF file and yields the (start, end) byte offsets
+    of each "BEGIN IONS"..."END IONS" block. The search always
+    resumes from the end of the previous scan, so splitting is linear
+    in the file size and never copies the file contents.
+
+    Iteration can be bounded to the scans starting within a byte
+    range, such as one of the shards returned by ranges().
+
+    Compressed files, detected by their magic bytes, cannot be mapped,
+    and are split as they are decompressed instead, over a window of
+    the decompressed contents which slides forward one chunk at a
+    time, carrying any partial scan into the next chunk. `map` and
+    `view` then hold the current window, so the yielded offsets are
+    within the window, and only valid until the next scan is
+    requested. `base` is the offset of the window within the
+    decompressed contents, and always 0 for a mapped file, so
+    `base + start` is the offset of a scan within the file, as are
+    the iteration bounds and the offsets passed to locate().
+    '''
+
+    _start_sub = START_SUB
+    _end_sub = END_SUB
+
+    def __init__(self, path, start=0, end=None):
+        super(ScanSplitter, self).__init__()
+
+        self.path = path
+        self.start = start
+        self.end = end
+        self.compression = detect(path)
+        self.base = 0
+        self.fileobj = None
+        self._chunks = None
+        self._size = None
+        if self.compression is None:
+            self.fileobj = open(path, 'rb')
+            self._size = os.fstat(self.fileobj.fileno()).st_size
+        if self._size:
+            self.map = mmap.mmap(self.fileobj.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        else:
+            # cannot map an empty file, and nothing is decompressed yet
+            self.map = b''
+        self.view = memoryview(self.map)
+
+    def __iter__(self):
+        '''Yields the (start, end) offsets of each complete scan'''
+
+        if self.compression is None:
+            return self._split_map()
+        return self._split_stream()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def size(self):
+        '''
+        Size of the file, or of its decompressed contents, which are
+        decompressed once to measure them.
+        '''
+
+        if self._size is None:
+            self._size = sum(len(i) for i in decompressed_chunks(
+                self.path, self.compression))
+        return self._size
+
+    # ------------------
+    #      SPLITTING
+    # ------------------
+
+    def _split_map(self):
+        '''Yields the scans of the mapped file'''
+
+        position = self.start
+        while True:
+            start = self.map.find(self._start_sub, position)
+            if start == -1 or (self.end is not None and start >= self.end):
+                return
+            end = self.map.find(self._end_sub, start)
+            if end == -1:
+                # truncated final scan
+                return
+            position = end + len(self._end_sub)
+            yield start, position
+
+    def _split_stream(self):
+        '''Yields the scans of the sliding decompressed window'''
+
+        self._rewind()
+        position = 0
+        while True:
+            start = self.map.find(self._start_sub, position)
+            if start == -1:
+                # the window may end within a "BEGIN IONS" line
+                keep = max(position,
+                           len(self.map) - len(self._start_sub) + 1)
+                if not self._slide(keep):
+                    return
+                position = 0
+                continue
+            if self.end is not None and self.base + start >= self.end:
+                return
+            end = self.map.find(self._end_sub, start)
+            if end == -1:
+                # carry the partial scan into the next chunk
+                if not self._slide(start):
+                    # truncated final scan
+                    return
+                position = 0
+                continue
+            position = end + len(self._end_sub)
+            if self.base + start >= self.start:
+                yield start, position
+
+    def _rewind(self):
+        '''Restarts the decompressed window at the start of the file'''
+
+        self._chunks = decompressed_chunks(self.path, self.compression)
+        self.base = 0
+        self.map = b''
+        self.view = memoryview(self.map)
+
+    def _slide(self, keep):
+        '''
+        Drops the window before `keep` and appends the next chunk,
+        returning False at the end of the file.
+        '''
+
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self.base += keep
+        self.map = self.map[keep:] + chunk
+        self.view = memoryview(self.map)
+        return True
+
+    # ------------------
+    #       SHARDS
+    # ------------------
+
+    def ranges(self, count):
+        '''
+        Cuts the file into at most `count` (start, end) byte ranges of
+        roughly equal size, each aligned on a "BEGIN IONS" line. The
+        scans of a compressed file are split once to find the bounds.
+        '''
+
+        size = self.size
+        targets = [size * index // count for index in range(count)]
+        bounds = []
+        if self.compression is None:
+            for target in targets:
+                position = self.map.find(self._start_sub, target)
+                if position == -1:
+                    break
+                if not bounds or position > bounds[-1]:
+                    bounds.append(position)
+        else:
+            start, end, self.start, self.end = self.start, self.end, 0, None
+            try:
+                for position, _ in self:
+                    position += self.base
+                    while targets and targets[0] <= position:
+                        targets.pop(0)
+                        if not bounds or position > bounds[-1]:
+                            bounds.append(position)
+                    if not targets:
+                        break
+            finally:
+                self.start, self.end = start, end
+        bounds.append(size)
+
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def count(self, sub):
+        '''
+        Counts the occurrences of sub in the file, or in its
+        decompressed contents, searching them in bounded chunks.
+        '''
+
+        if self.compression is None:
+            return count_sub(self.map, sub)
+        count = 0
+        tail = b''
+        # a match may span two chunks
+        overlap = len(sub) - 1
+        for chunk in decompressed_chunks(self.path, self.compression):
+            data = tail + chunk
+            count += data.count(sub)
+            tail = data[len(data) - overlap:] if overlap else b''
+        return count
+
+    # ------------------
+    #       ACCESS
+    # ------------------
+
+    def locate(self, start, end=None):
+        '''
+        Returns the (start, end) offsets within `map` of the bytes from
+        start to end within the file, or of the whole scan beginning
+        at start if end is None. A compressed file is decompressed
+        forward to the offsets, and again from its beginning for an
+        offset before the window, so lookups are cheapest in file
+        order.
+        '''
+
+        if self.compression is None:
+            if end is None:
+                end = self.map.find(self._end_sub, start) + len(self._end_sub)
+            return start, end
+
+        if self._chunks is None or start < self.base:
+            self._rewind()
+        while True:
+            offset = start - self.base
+            if end is None:
+                stop = self.map.find(self._end_sub, offset)
+                if stop != -1:
+                    return offset, stop + len(self._end_sub)
+            elif end - self.base <= len(self.map):
+                return offset, end - self.base
+            if not self._slide(min(offset, len(self.map))):
+                raise ValueError("Offset {0} is past the end of {1}".format(
+                    start, self.path))
+
+    def scan(self, start, end):
+        '''Returns a zero-copy memoryview over the scan bytes'''
+
+        return self.view[start:end]
+
+    def text(self, start, end):
+        '''Returns the decoded scan string'''
+
+        return self.map[start:end].decode(ENCODING)
+
+    def close(self):
+        '''Releases the view and the underlying map and file'''
+
+        self.view.release()
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        if self.fileobj is not None:
+            self.fileobj.close()
+
+
+# SOURCE
+# ------
+
+
+class ScanSource(object):
+    '''
+    Scans processed by a corrector, split from the file by a
+    ScanSplitter, or located from the spectra of its SpectrumCache.
+    Yields the (start, end) offsets of each scan within `map`, and
+    tells each listener of the scan being processed, through whichever
+    of these methods the listener has:
+        before_scan(offset) -- before the scan, with its file offset
+        after_scan(offset) -- once the scan is processed, with the
+            file offset past it
+        read_ahead(batch) -- before a batch of `listener.batch` scans
+            is yielded, with the (start, end, map, view, base) of each
+
+    `map`, `view` and `base` hold the window of a compressed file the
+    scan being processed was split from, even after the splitter has
+    read ahead past it.
+
+    Arguments:
+        path -- input file, optionally compressed
+        start, end -- file offsets bounding the scan starts, ie, from
+            a checkpoint or a shard
+        prefetch -- read a mapped file ahead of the parser in a thread
+        cache -- SpectrumCache of the file, closed along with the
+            source, or None to split the file
+    '''
+
+    def __init__(self, path, start=0, end=None, prefetch=False,
+                 cache=None):
+        super(ScanSource, self).__init__()
+
+        self.splitter = ScanSplitter(path, start, end)
+        self.prefetch = prefetch
+        self.cache = cache
+        self.map = self.splitter.map
+        self.view = self.splitter.view
+        self.base = 0
+        self._before = []
+        self._after = []
+        self._ahead = None
+
+    def __iter__(self):
+        '''Yields the (start, end) offsets of each scan'''
+
+        scans = self._scans()
+        if self._ahead is not None:
+            scans = self._batches(scans)
+        if self._before or self._after:
+            scans = self._follow(scans)
+        return scans
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def path(self):
+        '''Path of the input file'''
+
+        return self.splitter.path
+
+    @property
+    def start(self):
+        '''File offset of the first scan'''
+
+        return self.splitter.start
+
+    @start.setter
+    def start(self, value):
+        self.splitter.start = value
+
+    @property
+    def compression(self):
+        '''Compression of the input file, or None'''
+
+        return self.splitter.compression
+
+    @property
+    def fileobj(self):
+        '''Mapped input file, or None for a compressed file'''
+
+        return self.splitter.fileobj
+
+    def listen(self, listener):
+        '''Tells the listener of each scan, through its methods'''
+
+        hooks = [(self._before, 'before_scan'), (self._after, 'after_scan')]
+        for listeners, name in hooks:
+            hook = getattr(listener, name, None)
+            if hook is not None and hook not in listeners:
+                listeners.append(hook)
+        if hasattr(listener, 'read_ahead'):
+            if self._ahead is not None and self._ahead is not listener:
+                raise ValueError("Only one listener can read ahead")
+            self._ahead = listener
+
+    # ------------------
+    #      SPLITTING
+    # ------------------
+
+    def _scans(self):
+        '''Returns the scans, holding the window of each'''
+
+        if self.cache is not None:
+            return self._cached()
+        if self.splitter.compression is not None:
+            return self._windows()
+        if self.prefetch:
+            return self._prefetch()
+        return iter(self.splitter)
+
+    def _cached(self):
+        '''Yields the scans of the cached spectra within the bounds'''
+
+        splitter = self.splitter
+        for spectrum in self.cache:
+            if spectrum.start < splitter.start or (
+                    splitter.end is not None and
+                    spectrum.start >= splitter.end):
+                continue
+            start, end = splitter.locate(spectrum.start, spectrum.end)
+            self._hold()
+            yield start, end
+
+    def _windows(self):
+        '''Yields the scans of the sliding decompressed window'''
+
+        for start, end in self.splitter:
+            self._hold()
+            yield start, end
+
+    def _hold(self):
+        '''Holds the current window of the splitter'''
+
+        self.map = self.splitter.map
+        self.view = self.splitter.view
+        self.base = self.splitter.base
+
+    def _prefetch(self):
+        '''Yields the scans of the mapped file, reading ahead of them'''
+
+        splitter = self.splitter
+        end = splitter.size
+        if splitter.end is not None:
+            end = min(end, splitter.end + READ_AHEAD)
+        reader = ReadAhead(splitter.path, splitter.start, end)
+        try:
+            for start, end in splitter:
+                reader.advance(end)
+                yield start, end
+        finally:
+            reader.stop()
+
+    def _follow(self, scans):
+        '''Yields the scans, telling the listeners of each'''
+
+        before = self._before
+        after = self._after
+        for start, end in scans:
+            for hook in before:
+                hook(self.base + start)
+            yield start, end
+            # the caller processed the scan before resuming iteration
+            for hook in after:
+                hook(self.base + end)
+
+    def _batches(self, scans):
+        '''Yields the scans once each batch of them is read ahead'''
+
+        size = self._ahead.batch
+        batch = []
+        for start, end in scans:
+            batch.append((start, end, self.map, self.view, self.base))
+            if len(batch) >= size:
+                for scan in self._flush(batch):
+                    yield scan
+                batch = []
+        for scan in self._flush(batch):
+            yield scan
+
+    def _flush(self, batch):
+        '''Reads the batch ahead, then yields each of its scans'''
+
+        if batch:
+            self._ahead.read_ahead(batch)
+        for start, end, buf, view, base in batch:
+            self.map = buf
+            self.view = view
+            self.base = base
+            yield start, end
+
+    def close(self):
+        '''Closes the splitter and any cache'''
+
+        if self.cache is not None:
+            self.cache.close()
+        self.splitter.close()
@@ -0,0 +1,311 @@
+'''Sharded PAVA output, split during the correction or conversion pass'''
+
+# load modules/submodules
+import bisect
+import os
+import re
+
+from .checkpoint import replace_file, temp_path
+from .compression import open_file, strip_extension
+from .pipeline import ThreadedWriter
+from .scans import ENCODING, START_SUB
+
+
+# CONSTANTS
+# ---------
+
+# shards balanced by a running total
+BALANCED = ('scans', 'peaks', 'bytes')
+# shards cut at header value boundaries
+RANGES = ('rt', 'mz')
+MODES = BALANCED + RANGES
+MANIFEST_SUFFIX = '_manifest.txt'
+MANIFEST_COLUMNS = ['Shard', 'File', 'Scans', 'First Scan', 'Last Scan',
+                    'Peaks', 'Bytes', 'From', 'To', 'Min RT', 'Max RT',
+                    'Min m/z', 'Max m/z']
+TITLE = re.compile(r'^TITLE=Scan ([0-9]+) \(rt=([^)]*)\)', re.M)
+PEPMASS = re.compile(r'^PEPMASS=([^\s]*)', re.M)
+
+
+# HELPERS
+# -------
+
+
+def shard_path(path, index, count):
+    '''Returns the path of shard `index`, ie, "a.txt" -> "a_shard01.txt"'''
+
+    root, ext = os.path.splitext(strip_extension(path))
+    width = max(2, len(str(count)))
+    name = '{0}_shard{1:0{2}d}{3}'.format(root, index + 1, width, ext)
+    return name + path[len(strip_extension(path)):]
+
+
+def manifest_path(path):
+    '''Returns the manifest path for the sharded output path'''
+
+    return os.path.splitext(strip_extension(path))[0] + MANIFEST_SUFFIX
+
+
+def parse_cuts(text):
+    '''Parses comma-separated cut values, ie, "20,40,60"'''
+
+    return [float(i) for i in text.split(',') if i.strip()]
+
+
+def _float(value):
+    '''Parses a header value, or None if missing or malformed'''
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _peaks(scan):
+    '''Counts the peak lines of a written scan'''
+
+    # header lines are the only ones with an "="
+    header = scan.find('\n', scan.rfind('=')) + 1
+    # less the END IONS line and the blank separator
+    return max(scan.count('\n', header) - 2, 0)
+
+
+# SHARDING
+# --------
+
+
+class Sharding(object):
+    '''
+    How an output is split into shards: `count` shards balanced by
+    the scan count, the peak count or the byte size, or shards cut at
+    the retention times (min) or precursor m/z values in `cuts`.
+
+    Arguments:
+        count -- number of balanced shards, ignored for cuts
+        by -- 'scans', 'peaks', 'bytes', 'rt' or 'mz'
+        cuts -- ascending boundaries for 'rt' or 'mz'
+    '''
+
+    def __init__(self, count=None, by='scans', cuts=None):
+        super(Sharding, self).__init__()
+
+        if by not in MODES:
+            raise ValueError("Unknown shard mode: {0}".format(by))
+        if by in RANGES:
+            if not cuts:
+                raise ValueError("Sharding by {0} needs the cut "
+                                 "values".format(by))
+            cuts = sorted(float(i) for i in cuts)
+            count = len(cuts) + 1
+        elif not count or count < 1:
+            raise ValueError("Sharding by {0} needs a positive shard "
+                             "count".format(by))
+        self.count = count
+        self.by = by
+        self.cuts = cuts
+
+    def total(self, scans):
+        '''
+        Estimates the balanced total from the input ScanSplitter, as
+        the scans, lines or bytes of the file, with a fast search over
+        the file before the scans are parsed.
+        '''
+
+        if self.by == 'scans':
+            return scans.count(START_SUB)
+        elif self.by == 'peaks':
+            # the peak lists dominate the line count
+            return scans.count(b'\n')
+        elif self.by == 'bytes':
+            return scans.size
+        return None
+
+    def bounds(self, index):
+        '''Returns the (from, to) cut values of a shard'''
+
+        if self.cuts is None:
+            return None, None
+        lower = self.cuts[index - 1] if index else None
+        upper = self.cuts[index] if index < len(self.cuts) else None
+        return lower, upper
+
+
+class ShardStats(object):
+    '''Running totals and header value ranges of one shard'''
+
+    def __init__(self):
+        super(ShardStats, self).__init__()
+
+        self.scans = 0
+        self.peaks = 0
+        self.bytes = 0
+        self.first = None
+        self.last = None
+        self.rt = [None, None]
+        self.mz = [None, None]
+
+    def add(self, scan, num, rt, mz):
+        '''Adds a written scan to the totals'''
+
+        self.scans += 1
+        self.peaks += _peaks(scan)
+        self.bytes += len(scan)
+        if self.first is None:
+            self.first = num
+        self.last = num
+        for span, value in ((self.rt, rt), (self.mz, mz)):
+            if value is None:
+                continue
+            if span[0] is None or value < span[0]:
+                span[0] = value
+            if span[1] is None or value > span[1]:
+                span[1] = value
+
+
+# WRITER
+# ------
+
+
+class ShardedWriter(object):
+    '''
+    File-like output which routes each written scan to one of several
+    shard files, in the same pass that corrects or converts the scans,
+    and writes a tab-delimited manifest mapping each shard back to its
+    scan numbers, retention times and precursor m/z values.
+
+    Balanced shards hold contiguous runs of the input, advancing to
+    the next shard once a shard's share of the estimated total is
+    written. Cut shards hold every scan within their range, in input
+    order. Each write must be exactly one scan, as the parsers write.
+
+    Shards are written to temporary files and only moved into place,
+    along with the manifest, by commit().
+
+    Arguments:
+        path -- output path the shard paths are derived from
+        sharding -- Sharding of the output
+        pipeline -- write each shard behind in a background thread
+    '''
+
+    def __init__(self, path, sharding, pipeline=False):
+        super(ShardedWriter, self).__init__()
+
+        self.path = path
+        self.sharding = sharding
+        self.paths = [shard_path(path, i, sharding.count)
+                      for i in range(sharding.count)]
+        self.files = []
+        for shard in self.paths:
+            fileobj = open_file(temp_path(shard), 'w', encoding=ENCODING,
+                                newline='', name=shard)
+            if pipeline:
+                fileobj = ThreadedWriter(fileobj)
+            self.files.append(fileobj)
+        self.total = None
+        self._reset()
+
+    def _reset(self):
+        self.stats = [ShardStats() for _ in self.paths]
+        self.filled = 0
+        self.index = 0
+
+    def measure(self, scans):
+        '''Estimates the balanced total from the input ScanSplitter'''
+
+        self.total = self.sharding.total(scans)
+
+    # ------------------
+    #       WRITING
+    # ------------------
+
+    def write(self, scan):
+        '''Writes the scan to its shard'''
+
+        match = TITLE.search(scan)
+        num = rt = None
+        if match is not None:
+            num = match.group(1)
+            rt = _float(match.group(2))
+        match = PEPMASS.search(scan)
+        mz = None if match is None else _float(match.group(1))
+
+        index = self._route(scan, rt, mz)
+        self.files[index].write(scan)
+        self.stats[index].add(scan, num, rt, mz)
+
+    def _route(self, scan, rt, mz):
+        '''Returns the shard index for the scan'''
+
+        sharding = self.sharding
+        if sharding.by in RANGES:
+            value = rt if sharding.by == 'rt' else mz
+            if value is None:
+                # unparsable headers sort below every cut
+                return 0
+            return bisect.bisect_right(sharding.cuts, value)
+
+        if sharding.by == 'scans':
+            weight = 1
+        elif sharding.by == 'peaks':
+            weight = scan.count('\n')
+        else:
+            weight = len(scan)
+        if self.total:
+            # place the scan by its midpoint in the running total
+            share = (self.filled + weight / 2.) * sharding.count / self.total
+            # shards stay contiguous, even if the estimate was low
+            self.index = max(self.index, min(int(share), sharding.count - 1))
+        self.filled += weight
+        return self.index
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if offset or whence != os.SEEK_SET:
+            raise IOError("can only rewind sharded output")
+        for fileobj in self.files:
+            fileobj.seek(0)
+            fileobj.truncate()
+        self._reset()
+        return 0
+
+    def truncate(self, size=None):
+        if size:
+            raise IOError("can only truncate sharded output at the start")
+        return 0
+
+    def flush(self):
+        for fileobj in self.files:
+            fileobj.flush()
+
+    def close(self):
+        '''Closes every shard file, without committing them'''
+
+        files, self.files = self.files, []
+        for fileobj in files:
+            fileobj.close()
+
+    # ------------------
+    #      MANIFEST
+    # ------------------
+
+    def commit(self):
+        '''Moves the complete shards into place and writes the manifest'''
+
+        for shard in self.paths:
+            replace_file(temp_path(shard), shard)
+        path = manifest_path(self.path)
+        with open(temp_path(path), 'w') as fileobj:
+            self.write_manifest(fileobj)
+        replace_file(temp_path(path), path)
+
+    def write_manifest(self, fileobj):
+        '''Writes the manifest table, one row per shard'''
+
+        fileobj.write('\t'.join(MANIFEST_COLUMNS) + '\n')
+        for index, (shard, stats) in enumerate(zip(self.paths, self.stats)):
+            row = [index + 1, os.path.basename(shard), stats.scans,
+                   stats.first, stats.last, stats.peaks, stats.bytes]
+            row.extend(self.sharding.bounds(index))
+            row.extend(stats.rt + stats.mz)
+            fileobj.write('\t'.join('' if i is None else str(i)
+                                    for i in row) + '\n')
+
@@ -0,0 +1,135 @@
+'''Zero-copy writer splicing unchanged byte ranges from a mapped file'''
+
+# load modules/submodules
+import os
+
+
+# CONSTANTS
+# ---------
+
+# runs at least this long are copied in the kernel, where possible
+KERNEL_COPY = 1 << 16
+SEPARATOR = b'\n\n'
+
+
+# HELPERS
+# -------
+
+
+def _kernel_copy(src, dst, offset, count):
+    '''
+    Copies up to count bytes from offset in the src fd to the current
+    position of the dst fd without passing through user space, and
+    returns the number of bytes copied, which is 0 if the platform
+    does not support it.
+    '''
+
+    copied = 0
+    while copied < count:
+        size = count - copied
+        try:
+            if hasattr(os, 'copy_file_range'):
+                written = os.copy_file_range(src, dst, size, offset + copied)
+            elif hasattr(os, 'sendfile'):
+                written = os.sendfile(dst, src, offset + copied, size)
+            else:
+                break
+        except OSError:
+            # ie, cross-filesystem copies on older kernels
+            break
+        if not written:
+            break
+        copied += written
+    return copied
+
+
+# WRITER
+# ------
+
+
+class SpliceWriter(object):
+    '''
+    Writes output assembled from byte ranges of a ScanSplitter's mapped
+    file and freshly generated bytes. Adjacent ranges are coalesced, so
+    a run of unchanged scans becomes a single copy: a kernel copy via
+    copy_file_range or sendfile for long runs, or a write of a
+    memoryview into the mapped file otherwise. The ranges of a
+    compressed file are written as soon as they are copied, from the
+    current window of its decompressed contents.
+
+    Arguments:
+        scans -- ScanSplitter over the source file
+        fileobj -- binary output file object
+    '''
+
+    def __init__(self, scans, fileobj):
+        super(SpliceWriter, self).__init__()
+
+        self.scans = scans
+        self.fileobj = fileobj
+        self.run_start = None
+        self.run_end = None
+
+    def copy(self, start, end):
+        '''Appends the source bytes from start to end'''
+
+        if start == end:
+            return
+        if self.scans.compression is not None:
+            # the decompressed window slides on past the scan
+            self.flush()
+            self.fileobj.write(self.scans.view[start:end])
+        elif self.run_end == start:
+            self.run_end = end
+        else:
+            self.flush()
+            self.run_start = start
+            self.run_end = end
+
+    def write(self, data):
+        '''Appends freshly generated bytes'''
+
+        self.flush()
+        self.fileobj.write(data)
+
+    def copy_scan(self, start, end, separator=SEPARATOR):
+        '''
+        Appends the source bytes from start to end and the separator,
+        copying the separator too when it follows in the source, so
+        consecutive scans coalesce into one run.
+        '''
+
+        stop = end + len(separator)
+        if self.scans.map[end:stop] == separator:
+            self.copy(start, stop)
+        else:
+            self.copy(start, end)
+            self.write(separator)
+
+    def flush(self):
+        '''Writes the pending run of source bytes'''
+
+        if self.run_start is None:
+            return
+        start, end = self.run_start, self.run_end
+        self.run_start = self.run_end = None
+
+        # the kernel can only copy from an uncompressed source
+        if end - start >= KERNEL_COPY and self.scans.compression is None:
+            self.fileobj.flush()
+            try:
+                dst = self.fileobj.fileno()
+            except (AttributeError, IOError, ValueError):
+                # in-memory output
+                dst = None
+            if dst is not None:
+                src = self.scans.fileobj.fileno()
+                start += _kernel_copy(src, dst, start, end - start)
+        if start < end:
+            self.fileobj.write(self.scans.view[start:end])
+
+    def close(self):
+        '''Writes any pending bytes and flushes the output'''
+
+        self.flush()
+        self.fileobj.flush()
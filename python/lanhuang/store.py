@@ -0,0 +1,107 @@
+'''Compact NumPy store for TPP precursor metadata'''
+
+# load modules/submodules
+from collections import namedtuple
+
+import numpy as np
+
+
+# CONSTANTS
+# ---------
+
+# packed, so a record is 33 bytes and matches the index sidecar layout
+DTYPE = np.dtype([
+    ('scan', '<i4'),
+    ('offset', '<i8'),
+    ('mz', '<f8'),
+    ('intensity', '<f8'),
+    ('charge', 'i1'),
+    ('rt', '<f4'),
+])
+
+# OBJECTS
+# -------
+
+TppScan = namedtuple("TppScan", "num offset mz intensity charge rt")
+
+
+# STORE
+# -----
+
+
+class TppStore(object):
+    '''
+    TPP scans held in a structured array sorted by scan number, with
+    lookups by binary search rather than a dict of dicts. The array
+    may be a read-only memory map over the index sidecar, in which case
+    worker processes share the same pages.
+    '''
+
+    def __init__(self, records):
+        super(TppStore, self).__init__()
+
+        self.records = records
+        # contiguous copy of the packed column, so a binary search never
+        # converts or copies the scan numbers per lookup
+        self.scans = np.ascontiguousarray(records['scan'])
+        self._scan_type = self.scans.dtype.type
+
+    @classmethod
+    def from_scans(cls, scans):
+        '''Builds the store from an iterable of TppScan, where the last
+        scan wins for a duplicated scan number.
+        '''
+
+        records = np.array([tuple(i) for i in scans], dtype=DTYPE)
+        order = np.argsort(records['scan'], kind='mergesort')
+        records = records[order]
+        if len(records):
+            # keep the last of each run of equal scan numbers
+            nums = records['scan']
+            records = records[np.append(nums[1:] != nums[:-1], True)]
+
+        return cls(records)
+
+    # ------------------
+    #       LOOKUP
+    # ------------------
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, num):
+        return self.position(num) is not None
+
+    def __iter__(self):
+        return iter(self.scans.tolist())
+
+    def position(self, num):
+        '''Returns the row for the scan number, or None if missing'''
+
+        index = int(self.scans.searchsorted(self._scan_type(num)))
+        if index < len(self.scans) and self.scans[index] == num:
+            return index
+        return None
+
+    def positions(self, nums):
+        '''
+        Vectorised lookup of many scan numbers, returning the rows and
+        a boolean mask of the scan numbers found.
+        '''
+
+        nums = np.asarray(nums, dtype=self.scans.dtype)
+        index = np.searchsorted(self.scans, nums)
+        index = np.minimum(index, max(len(self.scans) - 1, 0))
+        if len(self.scans):
+            found = self.scans[index] == nums
+        else:
+            found = np.zeros(len(nums), dtype=bool)
+        return index, found
+
+    def get(self, num, default=None):
+        '''Returns the TppScan for the scan number, or default'''
+
+        index = self.position(num)
+        if index is None:
+            return default
+        return TppScan(*self.records[index].tolist())
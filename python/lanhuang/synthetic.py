@@ -0,0 +1,136 @@
+'''Deterministic synthetic MGF files, for benchmarks of the scan parsers'''
+
+# load modules/submodules
+import io
+import os
+import random
+
+from .scans import ENCODING
+
+
+# CONSTANTS
+# ---------
+
+RAW = 'synthetic01.raw'
+FIRST_SCAN = 100
+
+# header templates, matching the dialect patterns in lanhuang.dialects
+TPP_TITLE = ('TITLE={stem}.{num}.{num}.{charge} File:"{raw}", '
+             'NativeID:"controllerType=0 controllerNumber=1 scan={num}"')
+PAVA_FILTER = ('SCAN_FILTER=ITMS + c NSI r d Full ms3 {mz:.2f}@cid35.00 '
+               '[120.00-2000.00]')
+PAVA_TITLE = 'TITLE=Scan {num} (rt={minutes:.3f}) [{raw}]'
+RV_TITLE = ('TITLE=File: "I:\\Synthetic\\{raw}"; SpectrumID: "{index}"; '
+            'scans: "{num}"')
+PD_TITLE = 'TITLE={stem} Spectrum{index} scans: {num}'
+
+
+# SCANS
+# -----
+
+
+def synthetic_scans(scans, peaks, missing_charge=0.25, seed=0,
+                    missing_intensity=0):
+    '''
+    Yields (index, num, rt, mz, intensity, charge, peak list) for each
+    synthetic scan, where charge is None for a missing CHARGE line, and
+    intensity None for a missing precursor intensity.
+    The same arguments always yield the same scans, so files of every
+    dialect describe the same precursors.
+
+    Arguments:
+        scans -- number of scans
+        peaks -- peaks per scan
+        missing_charge -- fraction of scans without a CHARGE line
+        seed -- random seed
+        missing_intensity -- fraction of scans without a precursor
+            intensity
+    '''
+
+    rng = random.Random(seed)
+    for index in range(scans):
+        num = FIRST_SCAN + 2 * index
+        rt = 60 + index * 0.5
+        mz = round(rng.uniform(300, 1500), 5)
+        intensity = round(rng.uniform(1e3, 1e7), 4)
+        charge = rng.choice((1, 2, 3, 4))
+        if rng.random() < missing_charge:
+            charge = None
+        # only drawn if set, so the default scans never change
+        if missing_intensity and rng.random() < missing_intensity:
+            intensity = None
+        peak_list = sorted((round(rng.uniform(100, 2000), 4),
+                            round(rng.uniform(1, 1e5), 1))
+                           for _ in range(peaks))
+        yield index, num, rt, mz, intensity, charge, peak_list
+
+
+# FORMATTING
+# ----------
+
+
+def _header(dialect, index, num, rt, mz, intensity, charge, ms3):
+    '''Returns the header lines for one scan in the given dialect'''
+
+    stem = os.path.splitext(RAW)[0]
+    charge_line = [] if charge is None else ['CHARGE={0}+'.format(charge)]
+    # PAVA and PD keep the separator before a missing intensity
+    value = '' if intensity is None else intensity
+    pepmass = 'PEPMASS={0} {1}'.format(mz, value).rstrip()
+    if dialect == 'TPP':
+        return ([TPP_TITLE.format(stem=stem, num=num, charge=charge or 1,
+                                  raw=RAW),
+                 'RTINSECONDS={0}'.format(rt), pepmass] + charge_line)
+    elif dialect == 'PAVA':
+        lines = []
+        if ms3:
+            lines += [PAVA_FILTER.format(mz=mz),
+                      'MS2_SCAN_NUMBER= {0}'.format(num - 1)]
+        lines += [PAVA_TITLE.format(num=num, minutes=rt / 60, raw=RAW),
+                  'PEPMASS={0}\t{1}'.format(mz, value)]
+        return lines + charge_line
+    elif dialect == 'RV':
+        return ([RV_TITLE.format(raw=RAW, index=index, num=num),
+                 pepmass] + charge_line +
+                ['RTINSECONDS={0}'.format(int(rt)),
+                 'SCANS={0}'.format(num)])
+    elif dialect == 'PD':
+        return ([PD_TITLE.format(stem=stem, index=index, num=num),
+                 'PEPMASS={0} {1}'.format(mz, value)] + charge_line +
+                ['RTINSECONDS={0}'.format(int(rt)),
+                 'SCANS={0}'.format(num)])
+    raise ValueError("Unknown dialect: {0}".format(dialect))
+
+
+def write_mgf(path, dialect, scans=1000, peaks=100, crlf=False,
+              missing_charge=0.25, ms3=False, seed=0, missing_intensity=0):
+    '''
+    Writes a synthetic MGF file in one of the TPP, PAVA, RV or PD
+    dialects, and returns the path.
+
+    Arguments:
+        crlf -- use Windows line endings
+        ms3 -- add the SCAN_FILTER and MS2_SCAN_NUMBER lines of PAVA
+            _ms3cid files
+        scans, peaks, missing_charge, seed, missing_intensity -- see
+            synthetic_scans()
+    '''
+
+    newline = '\r\n' if crlf else '\n'
+    with io.open(path, 'w', encoding=ENCODING, newline='') as fileobj:
+        if dialect == 'PD':
+            fileobj.write(u'MASS=Monoisotopic' + newline)
+        for scan in synthetic_scans(scans, peaks, missing_charge, seed,
+                                    missing_intensity):
+            index, num, rt, mz, intensity, charge, peak_list = scan
+            lines = ['BEGIN IONS']
+            lines += _header(dialect, index, num, rt, mz, intensity,
+                             charge, ms3)
+            lines += ['{0} {1}'.format(*i) for i in peak_list]
+            lines.append('END IONS')
+            # blank line between scans, except in TPP files
+            if dialect != 'TPP':
+                lines.append('')
+            fileobj.write(u''.join(i + newline for i in lines))
+
+    return path
@@ -0,0 +1,353 @@
+'''Watch-folder correction of TPP/PAVA files as they are exported'''
+
+# load modules/submodules
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import zlib
+
+from collections import OrderedDict
+
+import six
+
+from . import fusion, pava
+from .batch import find_inputs, output_path, sniff, write_columns, write_stats
+from .dialects import PAVA, TPP
+from .index import ScanIndex
+
+
+# CONSTANTS
+# ---------
+
+# seconds between directory polls
+INTERVAL = 2.0
+# seconds a file must be unchanged before it is considered written
+SETTLE = 2.0
+# TPP scan indexes kept loaded in each worker
+CACHE_SIZE = 4
+# batch worker and summary counters for each correction
+MODES = {
+    'pava': (pava.correct_pair, pava.BATCH_FIELDS),
+    'fusion': (fusion.correct_pair, fusion.BATCH_FIELDS),
+}
+
+
+# CACHE
+# -----
+
+
+class TppCache(object):
+    '''
+    Bounded, least-recently used cache of loaded TPP scan indexes,
+    keyed by path. An entry is reloaded once the TPP file changes
+    size or mtime, and the oldest entry is dropped past `size`.
+
+    Arguments:
+        size -- maximum number of TPP files kept loaded
+    '''
+
+    def __init__(self, size=CACHE_SIZE):
+        super(TppCache, self).__init__()
+
+        self.size = size
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, path):
+        return path in self._items
+
+    def get(self, path):
+        '''Returns the ScanIndex for path, loading it if needed'''
+
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime)
+        item = self._items.pop(path, None)
+        if item is not None and item[0] != key:
+            # rewritten since it was loaded
+            item[1].close()
+            item = None
+        if item is None:
+            item = (key, ScanIndex.load(path))
+        # move to the most recently used end
+        self._items[path] = item
+        while len(self._items) > self.size:
+            _, (_, index) = self._items.popitem(last=False)
+            index.close()
+        return item[1]
+
+    def close(self):
+        '''Closes and drops every cached index'''
+
+        for _, index in self._items.values():
+            index.close()
+        self._items.clear()
+
+
+# WORKERS
+# -------
+
+_CACHE = None
+
+
+def init_worker(size):
+    '''Creates the per-process TPP cache, leaving interrupts to the
+    watcher, which finishes the queued corrections on shutdown.
+    '''
+
+    global _CACHE  # pylint: disable=global-statement
+    _CACHE = TppCache(size)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def correct_task(task):
+    '''Corrects one pava file, reusing the cached TPP scans'''
+
+    mode, pair = task
+    worker = MODES[mode][0]
+    return worker(pair, _CACHE.get(pair[0]))
+
+
+# WATCHER
+# -------
+
+
+class FolderWatcher(object):
+    '''
+    Polls a directory by stat, returning each file once its size and
+    mtime have been unchanged for `settle` seconds, so files still
+    being copied onto the share are never read. A file is returned
+    again if it is later rewritten.
+
+    Arguments:
+        directory -- directory to poll
+        settle -- seconds a file must be unchanged
+    '''
+
+    def __init__(self, directory, settle=SETTLE):
+        super(FolderWatcher, self).__init__()
+
+        self.directory = directory
+        self.settle = settle
+        # path -> ((size, mtime), first seen), until settled
+        self._pending = {}
+        # path -> (size, mtime) when it was returned
+        self._done = {}
+
+    def poll(self, now=None):
+        '''Returns the newly settled files, in name order'''
+
+        if now is None:
+            now = time.time()
+        ready = []
+        pending = {}
+        for path in find_inputs(self.directory):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # removed since it was listed
+                continue
+            key = (stat.st_size, stat.st_mtime)
+            if self._done.get(path) == key:
+                continue
+            seen = self._pending.get(path)
+            if seen is None or seen[0] != key:
+                pending[path] = (key, now)
+            elif stat.st_size and now - seen[1] >= self.settle:
+                self._done[path] = key
+                ready.append(path)
+            else:
+                pending[path] = seen
+        # forget files removed before settling
+        self._pending = pending
+        return ready
+
+
+class FilePairer(object):
+    '''
+    Pairs each PAVA file with the TPP file extracted from the same RAW
+    file as they arrive, in either order. A PAVA file waits until its
+    TPP file arrives, and several PAVA variants may share a TPP file.
+    '''
+
+    def __init__(self):
+        super(FilePairer, self).__init__()
+
+        # RAW name -> TPP path
+        self.tpp = {}
+        # RAW name -> PAVA paths waiting on their TPP file
+        self.waiting = {}
+        self.unpaired = []
+
+    def add(self, path):
+        '''Returns the (raw, tpp, pava) triples ready for correction'''
+
+        dialect, raw = sniff(path)
+        if dialect == TPP.name:
+            self.tpp[raw] = path
+            return [(raw, path, i) for i in self.waiting.pop(raw, [])]
+        elif dialect == PAVA.name:
+            if raw in self.tpp:
+                return [(raw, self.tpp[raw], path)]
+            waiting = self.waiting.setdefault(raw, [])
+            if path not in waiting:
+                waiting.append(path)
+        elif path not in self.unpaired:
+            self.unpaired.append(path)
+        return []
+
+
+# SERVICE
+# -------
+
+
+class WatchFolder(object):
+    '''
+    Long-running correction service for a directory which receives
+    TPP and PAVA exports over the day. Settled files are paired by
+    RAW name and queued to a pool of workers, and a summary row is
+    logged as each correction finishes.
+
+    Every PAVA file from the same RAW file is sent to the same worker,
+    whose bounded LRU of TPP scan indexes keeps the scans loaded for
+    the next PAVA variant.
+
+    Arguments:
+        directory -- directory receiving the TPP and PAVA files
+        mode -- 'pava' for charge states or 'fusion' for precursors
+        out_dir -- output directory, or None for beside each PAVA file
+        summary -- write a charge state summary for each PAVA file
+        jobs -- worker processes
+        settle -- seconds a file must be unchanged before it is read
+        cache_size -- TPP scan indexes kept loaded in each worker
+        log -- file object for the summary rows, or None for stdout
+    '''
+
+    def __init__(self, directory, mode='pava', out_dir=None, summary=False,
+                 jobs=None, settle=SETTLE, cache_size=CACHE_SIZE,
+                 log=None):
+        super(WatchFolder, self).__init__()
+
+        self.mode = mode
+        self.out_dir = out_dir
+        self.summary = summary
+        self.fields = MODES[mode][1]
+        self.log = sys.stdout if log is None else log
+        self.watcher = FolderWatcher(directory, settle)
+        self.pairer = FilePairer()
+        self.results = []
+        # (pava path, AsyncResult) for each queued correction
+        self.running = []
+
+        if out_dir and not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        jobs = jobs or multiprocessing.cpu_count()
+        self.pools = [multiprocessing.Pool(1, init_worker, (cache_size,))
+                      for _ in range(jobs)]
+
+    def run(self, interval=INTERVAL, polls=None):
+        '''
+        Polls the directory every `interval` seconds, `polls` times or
+        until interrupted, then waits on the queued corrections.
+        Returns the stats for each corrected file.
+        '''
+
+        write_columns(self.log, self.fields)
+        count = 0
+        try:
+            while polls is None or count < polls:
+                self.step()
+                count += 1
+                if polls is None or count < polls:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+        return self.results
+
+    def step(self):
+        '''Queues the newly paired files and logs finished ones'''
+
+        for path in self.watcher.poll():
+            try:
+                pairs = self.pairer.add(path)
+            except (IOError, OSError) as error:
+                self._write('Unreadable: {0}: {1}\n'.format(path, error))
+                continue
+            for raw, tpp_path, pava_path in pairs:
+                self.submit(raw, tpp_path, pava_path)
+        self.collect()
+
+    def submit(self, raw, tpp_path, pava_path):
+        '''Queues the correction on the worker for the RAW file'''
+
+        out_path = output_path(pava_path, self.out_dir)
+        if self.mode == 'pava':
+            summary_path = None
+            if self.summary:
+                summary_path = pava.batch_summary_path(pava_path, out_path)
+            pair = (tpp_path, pava_path, out_path, summary_path)
+        else:
+            pair = (tpp_path, pava_path, out_path)
+
+        if isinstance(raw, six.text_type):
+            raw = raw.encode('utf-8')
+        pool = self.pools[(zlib.crc32(raw) & 0xffffffff) % len(self.pools)]
+        result = pool.apply_async(correct_task, ((self.mode, pair),))
+        self.running.append((pava_path, result))
+
+    def collect(self, wait=False):
+        '''Logs the finished corrections, or all of them if `wait`'''
+
+        running = []
+        for path, result in self.running:
+            if not wait and not result.ready():
+                running.append((path, result))
+                continue
+            try:
+                stats = result.get()
+            except Exception as error:  # pylint: disable=broad-except
+                self._write('Failed: {0}: {1}\n'.format(path, error))
+            else:
+                self.results.append(stats)
+                write_stats(self.log, stats, self.fields)
+                self.log.flush()
+        self.running = running
+
+    def close(self):
+        '''Waits on the queued corrections and stops the workers'''
+
+        for pool in self.pools:
+            pool.close()
+        self.collect(wait=True)
+        for pool in self.pools:
+            pool.join()
+
+    def _write(self, line):
+        '''Writes an unbuffered line to the log'''
+
+        self.log.write(line)
+        self.log.flush()
+
+
+# API
+# ---
+
+
+def watch_folder(directory, mode='pava', out_dir=None, summary=False,
+                 jobs=None, interval=INTERVAL, settle=SETTLE,
+                 cache_size=CACHE_SIZE, log=None, polls=None):
+    '''
+    Watches a directory, correcting each PAVA file against the TPP
+    file from the same RAW file as both finish writing. Runs until
+    interrupted, or for `polls` polls, and returns the stats for each
+    corrected file. See WatchFolder for the arguments.
+    '''
+
+    service = WatchFolder(directory, mode, out_dir, summary, jobs, settle,
+                          cache_size, log)
+    return service.run(interval, polls)
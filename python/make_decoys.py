@@ -25,6 +25,7 @@ __email__ = "ahuszagh@gmail.com"
 # This script aims reads a given FASTA file, and then generates target
 # decoys in either MS/MS mode (reversed) or Peptide Mass Fingerprinting
 # mode (shuffled, based on the hash of the sequence).
+# Either FASTA file may be gzip, bzip2 or xz-compressed.
 
 # Ex.:
 # python make_decoys.py --fasta P46406.fasta --out P46406_decoys.fasta
@@ -34,6 +35,9 @@ import argparse
 import os
 import random
 
+# load objects/functions
+from lanhuang.compression import open_file
+
 # ARGUMENTS
 PARSER = argparse.ArgumentParser()
 PARSER.add_argument('-f', "--fasta", type=str, help="FASTA file",
@@ -42,19 +46,23 @@ PARSER.add_argument('-o', "--out", type=str, help="Output file",
                     default="out.fasta")
 PARSER.add_argument('-m', "--mode", type=str, help="Decoy mode",
                     choices=['msms', 'pmf'], default="msms")
-ARGS = PARSER.parse_args()
 
 
 class ParseFasta(object):
     '''
     Parses the given FASTA file in a generator method, yielding
     each new sequence and header to produce a new decoy
+
+    Arguments:
+        fileobj -- FASTA file object
+        mode -- 'msms' for reversed or 'pmf' for shuffled decoys
     '''
 
-    def __init__(self, fileobj):
+    def __init__(self, fileobj, mode='msms'):
         super(ParseFasta, self).__init__()
 
         self.fileobj = fileobj
+        self.mode = mode
 
     def __iter__(self):
         '''Yields the header and processed sequences by entry'''
@@ -111,9 +119,9 @@ class ParseFasta(object):
         length = len(sequence[0])
         sequence = ''.join(sequence)
 
-        if ARGS.mode == 'msms':
+        if self.mode == 'msms':
             sequence = sequence[::-1]
-        elif ARGS.mode == 'pmf':
+        elif self.mode == 'pmf':
             sequence = self.shuffle_sequence(sequence, seed=True)
         sequence_list = []
         for index in range(0, len(sequence), length):
@@ -142,8 +150,8 @@ class ParseFasta(object):
 class Writer(ParseFasta):
     '''Writes the new FASTA sequence information to file'''
 
-    def __init__(self, fasta, outfile):
-        super(Writer, self).__init__(fasta)
+    def __init__(self, fasta, outfile, mode='msms'):
+        super(Writer, self).__init__(fasta, mode)
 
         self.outfile = outfile
 
@@ -157,12 +165,13 @@ class Writer(ParseFasta):
             print(sequence, file=self.outfile)
 
 
-def main():
+def main(argv=None):
     '''On script execution'''
 
-    with open(ARGS.fasta) as fasta:
-        with open(ARGS.out, 'w') as out:
-            Writer(fasta, out)
+    args = PARSER.parse_args(argv)
+    with open_file(args.fasta) as fasta:
+        with open_file(args.out, 'w') as out:
+            Writer(fasta, out, args.mode)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+'''
+Copyright (C) 2015 The Regents of the University of California.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+__author__ = "Alex Huszagh"
+__maintainer__ = "Alex Huszagh"
+__email__ = "ahuszagh@gmail.com"
+
+# This program indexes the precursors of every scan across the MGF files
+# of an experiment, ie, the corrected PAVA or TPP files, by neutral mass,
+# and answers which scans have a precursor within a ppm window of an m/z
+# or a mass, without re-parsing the files. The index is built once, with
+# -i or -b, and queried with --mz or --mass, optionally printing the
+# text of each matching scan, read directly at its byte offset.
+
+# Ex.:
+#       python mass_index.py -b corrected -x experiment.mzidx
+#       python mass_index.py -x experiment.mzidx --mz 652.8132 -z 2
+#       python mass_index.py -x experiment.mzidx --mass 1303.61 --text
+
+# load modules
+import argparse
+import os
+import sys
+
+# load objects/functions
+from lanhuang.batch import find_spectra
+from lanhuang.masses import COLUMNS, PPM_TOLERANCE, SUFFIX, MassIndex
+
+# constants
+PATH = os.path.dirname(os.path.realpath(__file__))
+INDEX_NAME = 'experiment' + SUFFIX
+
+# process arguments
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument("-i", "--inputs", help="MGF Files to index",
+                    nargs='+', type=str)
+PARSER.add_argument("-b", "--batch", help="Directory or manifest of the "
+                    "MGF files to index", type=str)
+PARSER.add_argument("-x", "--index", help="Index File Name (Optional)",
+                    type=str, default=INDEX_NAME)
+PARSER.add_argument("--mz", help="Precursor m/z values to query",
+                    nargs='+', type=float)
+PARSER.add_argument("--mass", help="Neutral precursor masses to query",
+                    nargs='+', type=float)
+PARSER.add_argument("-z", "--charge", help="Only find the scans at this "
+                    "charge, or without a CHARGE line, rather than at any "
+                    "charge", type=int)
+PARSER.add_argument("--ppm", help="Precursor tolerance, in ppm",
+                    type=float, default=PPM_TOLERANCE)
+PARSER.add_argument("--text", help="Print the text of each matching scan",
+                    action="store_true")
+PARSER.add_argument("-o", "--output", help="Output File Name, rather than "
+                    "the console (Optional)", type=str)
+
+# ------------------
+#       MAIN
+# ------------------
+
+
+def main(argv=None):
+    '''Runs the core tasks'''
+
+    args = PARSER.parse_args(argv)
+    # parse arguments
+    index_path = os.path.join(PATH, args.index)
+    paths = None
+    if args.batch:
+        paths = find_spectra(os.path.join(PATH, args.batch))
+    elif args.inputs:
+        paths = [os.path.join(PATH, i) for i in args.inputs]
+    if paths is None and not (args.mz or args.mass):
+        raise argparse.ArgumentTypeError("Please include the MGF files to "
+                                         "index, or the m/z values or "
+                                         "masses to query")
+    for path in paths or []:
+        if not os.path.exists(path):
+            raise argparse.ArgumentTypeError("MGF File not found: "
+                                             "{0}".format(path))
+    if paths is None and not os.path.exists(index_path):
+        raise argparse.ArgumentTypeError("Index not found. Build it from "
+                                         "the MGF files with -i or -b.")
+    if args.ppm <= 0:
+        raise argparse.ArgumentTypeError("The ppm tolerance must be "
+                                         "positive")
+
+    try:
+        if paths is not None:
+            index = MassIndex.build(paths, index_path)
+        else:
+            index = MassIndex.load(index_path)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+    out = sys.stdout
+    if args.output:
+        out = open(os.path.join(PATH, args.output), 'w')
+    try:
+        if args.mz or args.mass:
+            out.write('\t'.join(COLUMNS) + '\n')
+        for mz in args.mz or []:
+            records = index.query(mz, args.charge, args.ppm)
+            index.write(records, out, mz=mz, text=args.text)
+        for mass in args.mass or []:
+            records = index.query_mass(mass, args.ppm, args.charge)
+            index.write(records, out, mass=mass, text=args.text)
+    finally:
+        index.close()
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+'''
+Copyright (C) 2015 The Regents of the University of California.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from __future__ import division
+
+__author__ = "Alex Huszagh"
+__maintainer__ = "Alex Huszagh"
+__email__ = "ahuszagh@gmail.com"
+
+# This program converts the MGF extractions of any registered dialect,
+# ie, RV, PD or TPP, to the PAVA-like format recognized by Protein
+# Prospector. The dialect is sniffed from the leading scans of the file,
+# unless given. New dialects are registered through
+# lanhuang.dialects.register(), and can then be converted by name.
+
+# Ex.:
+# INPUT:
+#   $ python mgf_converter.py -m G6E.MGF
+#   $ python mgf_converter.py -m G6E.MGF -d PD
+
+# load modules
+import argparse
+import os
+
+# load objects/functions
+from lanhuang.compression import strip_extension
+from lanhuang.converters import convert_mgf
+from lanhuang.dialects import DIALECTS
+from lanhuang.peaks import TOP_WINDOW, PeakFilter
+from lanhuang.shards import MODES, Sharding, parse_cuts
+
+# constants
+PATH = os.path.dirname(os.path.realpath(__file__))
+
+# process arguments
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument("-m", "--MGF", help="MGF File", required=True,
+                    type=str)
+PARSER.add_argument("-o", "--output", help="Output File Name (Optional)",
+                    type=str)
+PARSER.add_argument("-d", "--dialect", help="MGF dialect, sniffed from "
+                    "the leading scans by default", choices=list(DIALECTS))
+PARSER.add_argument("--cache", help="Read the scans through a columnar "
+                    "cache, built on first use", action="store_true")
+PARSER.add_argument("--pipeline", help="Read ahead and write behind in "
+                    "background threads, overlapping I/O with parsing",
+                    action="store_true")
+PARSER.add_argument("--resume", help="Continue an interrupted conversion "
+                    "from its last checkpoint, rather than from the start",
+                    action="store_true")
+PARSER.add_argument("--top", help="Keep the most intense peaks within "
+                    "each --top-window m/z window", type=int)
+PARSER.add_argument("--top-window", help="m/z width of the windows for "
+                    "--top", type=float, default=TOP_WINDOW)
+PARSER.add_argument("--floor", help="Drop the peaks below this fraction "
+                    "of the base peak intensity", type=float)
+PARSER.add_argument("--precursor-window", help="Drop the peaks within "
+                    "this m/z of the precursor", type=float)
+PARSER.add_argument("--deisotope", help="Drop the heavier isotopes of "
+                    "each fragment peak", action="store_true")
+PARSER.add_argument("--shards", help="Split the output into this many "
+                    "shards, balanced by --shard-by, with a manifest",
+                    type=int)
+PARSER.add_argument("--shard-by", help="Balance the shards by scan count, "
+                    "peak count or byte size (default scans), or cut "
+                    "them by retention time (min) or precursor m/z at "
+                    "--shard-cuts", choices=MODES)
+PARSER.add_argument("--shard-cuts", help="Comma-separated retention times "
+                    "or m/z values to cut the shards at", type=parse_cuts)
+
+# ------------------
+#       MAIN
+# ------------------
+
+
+def main(argv=None):
+    '''Runs the core tasks'''
+
+    args = PARSER.parse_args(argv)
+    # parse arguments
+    mgf_path = os.path.join(PATH, args.MGF)
+    base_name = os.path.basename(strip_extension(args.MGF))
+    base_name = os.path.splitext(base_name)[0] + "_corrected.txt"
+    out_path = os.path.join(PATH, base_name)
+    if args.output:
+        out_path = os.path.join(PATH, args.output)
+    if not os.path.exists(mgf_path):
+        raise argparse.ArgumentTypeError("MGF File not found. Make sure "
+                                         "it is in the current working "
+                                         "directory.")
+
+    sharding = None
+    if args.shards is not None or args.shard_by or args.shard_cuts:
+        try:
+            sharding = Sharding(args.shards, args.shard_by or 'scans',
+                                args.shard_cuts)
+        except ValueError as error:
+            raise argparse.ArgumentTypeError(str(error))
+    peak_filter = None
+    if (args.top is not None or args.floor or args.precursor_window or
+            args.deisotope):
+        try:
+            peak_filter = PeakFilter(args.top, args.top_window, args.floor,
+                                     args.precursor_window, args.deisotope)
+        except ValueError as error:
+            raise argparse.ArgumentTypeError(str(error))
+    if sharding is not None and args.resume:
+        raise argparse.ArgumentTypeError("Sharded outputs cannot be "
+                                         "resumed.")
+
+    try:
+        convert_mgf(mgf_path, out_path, args.dialect, args.cache,
+                    args.pipeline, args.resume, sharding, peak_filter)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+if __name__ == '__main__':
+    main()
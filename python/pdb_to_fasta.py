@@ -60,13 +60,9 @@ import argparse
 import os
 import shutil
 
-from Bio import PDB
-
 # import functions/objects
 from six import StringIO
 
-from Bio.SeqUtils import seq1
-
 # ------------------
 #     ARGUMENTS
 # ------------------
@@ -80,27 +76,6 @@ PARSER.add_argument('-l', "--line-length", type=int, default=80,
                     help="Characters per line")
 PARSER.add_argument('-o', "--output", type=str, default="out.fasta",
                     help="Characters per line")
-ARGS = PARSER.parse_args()
-
-# check arguments
-if ARGS.code and len(ARGS.code) != 4:
-    raise argparse.ArgumentTypeError("Please enter a valid PDB code if "
-                                     "downloading a sequence.")
-elif ARGS.code:
-    FILE = None
-elif ARGS.file and os.path.exists(ARGS.file):
-    FILE = ARGS.file
-elif ARGS.file and os.path.exists(os.path.join(os.getcwd(), ARGS.file)):
-    FILE = os.path.join(os.getcwd(), ARGS.file)
-elif ARGS.file:
-    raise argparse.ArgumentTypeError("Please enter a valid path to a "
-                                     "PDB file.")
-elif ARGS.code is None and ARGS.file is None:
-    raise argparse.ArgumentTypeError("Please enter either a file path or "
-                                     "a PDB code.")
-
-# CONSTANTS
-LINE_LENGTH = ARGS.line_length
 
 # ------------------
 #      CLASSES
@@ -113,6 +88,9 @@ class ParsePDB(object):
     def __init__(self):
         super(ParsePDB, self).__init__()
 
+        # Biopython is slow to import, only load it once needed
+        from Bio import PDB
+
         # bind insstanee attributes
         self.parser = PDB.PDBParser(QUIET=True)
         self.file_io = PDB.PDBIO()
@@ -144,10 +122,11 @@ class ParsePDB(object):
 class MakeSequence(ParsePDB):
     '''Makes the sequence from a given PDB path or code'''
 
-    def __init__(self, code=None, path=None):
+    def __init__(self, code=None, path=None, line_length=80):
         super(MakeSequence, self).__init__()
 
         # bind instance attributes
+        self.line_length = line_length
         self.structure = self.get_structure(code, path)
         # only need first model -- same sequence
         self.model = self.structure.child_list[0]
@@ -170,6 +149,8 @@ class MakeSequence(ParsePDB):
         # make our output
         header = '>{0}:{1}|PDBID|CHAIN|SEQUENCE'.format(self.code, key)
         print(header, file=self.buf)
+        from Bio.SeqUtils import seq1
+
         # init our sequence
         seq = []
         # grab attributes
@@ -180,8 +161,9 @@ class MakeSequence(ParsePDB):
             seq.append(seq1(res.resname))
         # write sequence
         length = len(seq)
-        for index in range(0, length, LINE_LENGTH):
-            out = ''.join(seq[index:index+LINE_LENGTH])
+        step = self.line_length
+        for index in range(0, length, step):
+            out = ''.join(seq[index:index+step])
             print(out, file=self.buf)
 
 # ------------------
@@ -189,14 +171,34 @@ class MakeSequence(ParsePDB):
 # ------------------
 
 
-def main():
+def find_file(args):
+    '''Returns the full path to the PDB file, or None for a PDB code'''
+
+    if args.code and len(args.code) != 4:
+        raise argparse.ArgumentTypeError("Please enter a valid PDB code if "
+                                         "downloading a sequence.")
+    elif args.code:
+        return None
+    elif args.file and os.path.exists(args.file):
+        return args.file
+    elif args.file and os.path.exists(os.path.join(os.getcwd(), args.file)):
+        return os.path.join(os.getcwd(), args.file)
+    elif args.file:
+        raise argparse.ArgumentTypeError("Please enter a valid path to a "
+                                         "PDB file.")
+    raise argparse.ArgumentTypeError("Please enter either a file path or "
+                                     "a PDB code.")
+
+
+def main(argv=None):
     '''On init'''
 
+    args = PARSER.parse_args(argv)
     # grab code path
-    cls = MakeSequence(code=ARGS.code, path=FILE)
+    cls = MakeSequence(args.code, find_file(args), args.line_length)
     cls.run()
     cls.buf.seek(0)         # if not, empty output
-    with open(ARGS.output, 'w') as dst:
+    with open(args.output, 'w') as dst:
         shutil.copyfileobj(cls.buf, dst)
 
 if __name__ == '__main__':
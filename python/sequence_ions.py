@@ -57,11 +57,8 @@ import os
 import re
 import sys
 
-import matplotlib
 from PySide import QtCore, QtGui
 
-matplotlib.rcParams['mathtext.default'] = 'regular'
-
 # CONSTANTS
 
 QLABEL_BANNER_STYLE = '''
@@ -75,7 +72,7 @@ AMINO_ACIDS = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N',
                'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'Y']
 # display constans
 AXIS_0 = 0
-HEIGHT = 200
+BASE_HEIGHT = 200
 WIDTH = 100
 
 # REGEXES
@@ -194,46 +191,66 @@ PARSER.add_argument('-fl', '--fixed-length', type=int, choices=range(10, 41),
                     default=20, help="Fixed length for ion lines")
 PARSER.add_argument('-ds', '--different-line-span', type=float,
                     default=0.75, help="Ion series different line span")
-ARGS = PARSER.parse_args()
-
-if ARGS.peptide is None and ARGS.ions is not None:
-    raise argparse.ArgumentTypeError("Please enter a valid peptide before "
-                                     "specifying sequencing ions.")
-elif not (0.2 <= ARGS.same_line_font <= 0.5):
-    raise argparse.ArgumentTypeError("Please enter a valid same line font "
-                                     "size from 0.2 to 0.5.")
-elif not (0.2 <= ARGS.different_line_font <= 1):
-    raise argparse.ArgumentTypeError("Please enter a valid different line "
-                                     "font size from 0.2 to 1.0.")
-elif not (0.2 <= ARGS.different_line_span <= 1):
-    raise argparse.ArgumentTypeError("Please enter a valid different line "
-                                     "span ratio from 0.2 to 1.0.")
-if ARGS.peptide is not None:
-    if not PEPTIDE.match(ARGS.peptide):
-        raise argparse.ArgumentTypeError("Please enter a valid peptide "
-                                         "sequence. Supports TEX-like "
-                                         "subscript and superscripts.")
-if ARGS.ions is not None:
-    check_ions(ARGS.peptide, ARGS.ions)
-if not ARGS.same_line:
-    HEIGHT += 200
 
 # DEPENDENT FONT SETTINGS
 # font constants
 FONTSIZE = 50
-if ARGS.same_line:
-    SUB_FONTSIZE = FONTSIZE*ARGS.same_line_font
-else:
-    SUB_FONTSIZE = FONTSIZE*ARGS.different_line_font
-# define height for font to be set at
-FONT_HEIGHT = (HEIGHT//2) - (FONTSIZE//2)
 # define the font position
 FONT_POSITION = (WIDTH//2)-(FONTSIZE//2)
 SUBSCRIPT_RATIO = 0.75
-# need to set the minimum and max to flank the rest
-VERT_LINE_MIN = HEIGHT/2 - 5*FONTSIZE/4
-VERT_LINE_MAX = HEIGHT/2 + 5*FONTSIZE/4
-VERTICAL_LINE_LENGTH = VERT_LINE_MAX - VERT_LINE_MIN
+
+
+class Display(object):
+    '''
+    Display settings which depend on the arguments, ie, the figure
+    height and the ion label font size.
+
+    Arguments:
+        args -- validated arguments
+    '''
+
+    def __init__(self, args):
+        super(Display, self).__init__()
+
+        self.args = args
+        self.height = BASE_HEIGHT
+        if not args.same_line:
+            self.height += 200
+        if args.same_line:
+            self.sub_fontsize = FONTSIZE*args.same_line_font
+        else:
+            self.sub_fontsize = FONTSIZE*args.different_line_font
+        # define height for font to be set at
+        self.font_height = (self.height//2) - (FONTSIZE//2)
+        # need to set the minimum and max to flank the rest
+        self.vert_line_min = self.height/2 - 5*FONTSIZE/4
+        self.vert_line_max = self.height/2 + 5*FONTSIZE/4
+
+
+def configure(args):
+    '''Validates the arguments and returns their Display settings'''
+
+    if args.peptide is None and args.ions is not None:
+        raise argparse.ArgumentTypeError("Please enter a valid peptide "
+                                         "before specifying sequencing "
+                                         "ions.")
+    elif not (0.2 <= args.same_line_font <= 0.5):
+        raise argparse.ArgumentTypeError("Please enter a valid same line "
+                                         "font size from 0.2 to 0.5.")
+    elif not (0.2 <= args.different_line_font <= 1):
+        raise argparse.ArgumentTypeError("Please enter a valid different "
+                                         "line font size from 0.2 to 1.0.")
+    elif not (0.2 <= args.different_line_span <= 1):
+        raise argparse.ArgumentTypeError("Please enter a valid different "
+                                         "line span ratio from 0.2 to 1.0.")
+    if args.peptide is not None:
+        if not PEPTIDE.match(args.peptide):
+            raise argparse.ArgumentTypeError("Please enter a valid peptide "
+                                             "sequence. Supports TEX-like "
+                                             "subscript and superscripts.")
+    if args.ions is not None:
+        check_ions(args.peptide, args.ions)
+    return Display(args)
 
 # pylint: disable=too-few-public-methods, invalid-name
 
@@ -339,10 +356,12 @@ class MainWindow(QtGui.QMainWindow):
     _nterm_offset = 0
     _cterm_offset = 0
 
-    def __init__(self, color, output, peptide=None, ions=None):
+    def __init__(self, display, color, output, peptide=None, ions=None):
         super(MainWindow, self).__init__()
 
         # bind instance attributes
+        self.display = display
+        self.args = display.args
         self.color = color
         self.peptide = peptide
         self.ions = ions
@@ -395,14 +414,16 @@ class MainWindow(QtGui.QMainWindow):
         else:
             # need to split into two categories
             self._split_ions()
-        # dynamic imports
+        # dynamic imports, as matplotlib is slow to import
+        import matplotlib
+        matplotlib.rcParams['mathtext.default'] = 'regular'
         import matplotlib.pyplot as plt
         # grab desktop settings
         app = QtGui.QApplication.instance()
         dpi = app.desktop().logicalDpiX()
         length = self._get_length()
         width = self._get_width()/dpi
-        height = HEIGHT/dpi
+        height = self.display.height/dpi
         # make figure for width/height and set axes
         fig = plt.figure(figsize=(width, height), dpi=dpi)
         axes = self._init_axes(fig)
@@ -422,8 +443,8 @@ class MainWindow(QtGui.QMainWindow):
             self.output = dialog[0]
         # if exited, don't save a null string
         if self.output:
-            fig.savefig(self.output, bbox_inches='tight', format=ARGS.format,
-                        pad_inches=0)
+            fig.savefig(self.output, bbox_inches='tight',
+                        format=self.args.format, pad_inches=0)
         plt.close()
         # close main app
         sys.exit(0)
@@ -545,7 +566,7 @@ class MainWindow(QtGui.QMainWindow):
         '''Initializes the axes for the current plot'''
 
         axes = fig.add_subplot(111)
-        axes.set_ylim(AXIS_0, HEIGHT)
+        axes.set_ylim(AXIS_0, self.display.height)
         # ylim is the width of regular characters + subscript adjustments
         axes.set_xlim(AXIS_0, self._get_width())
         axes.get_xaxis().set_visible(False)
@@ -563,13 +584,14 @@ class MainWindow(QtGui.QMainWindow):
         from matplotlib.font_manager import FontProperties
         font = FontProperties()
         font.set_family('monospace')
+        font_height = self.display.font_height
         # now need to plot ytext widgets
         index = 0
         peptide = self.peptide
         # first try nterm
         if self._nterm != '':
             text = r'$%s$' % self._nterm
-            axes.text(FONT_POSITION, FONT_HEIGHT, text, fontsize=FONTSIZE,
+            axes.text(FONT_POSITION, font_height, text, fontsize=FONTSIZE,
                       fontproperties=font)
         # iteratively find the next sub
         while peptide:
@@ -586,7 +608,7 @@ class MainWindow(QtGui.QMainWindow):
             x_pos = (WIDTH*index+FONT_POSITION +
                      sum(self.offsets[:-1]) +
                      self._nterm_offset)
-            axes.text(x_pos, FONT_HEIGHT, residue, fontsize=FONTSIZE,
+            axes.text(x_pos, font_height, residue, fontsize=FONTSIZE,
                       fontproperties=font)
             # reset out peptide and adjust idx
             peptide = peptide[match.end():]
@@ -596,7 +618,7 @@ class MainWindow(QtGui.QMainWindow):
             text = r'$%s$' % self._cterm
             x_pos = (WIDTH*index-FONT_POSITION + sum(self.offsets) +
                      self._nterm_offset)
-            axes.text(x_pos, FONT_HEIGHT, text, fontsize=FONTSIZE,
+            axes.text(x_pos, font_height, text, fontsize=FONTSIZE,
                       fontproperties=font)
 
     def _add_lines(self, axes, length):
@@ -613,14 +635,15 @@ class MainWindow(QtGui.QMainWindow):
         for index in range(1, length):
             offset = sum(self.offsets[:index]) + self._nterm_offset
             # pylint: disable=bad-continuation
-            if (ARGS.keep_lines or
+            if (self.args.keep_lines or
                 # b-ions have a line
                 self.ions[1][index-1] or
                 # y-ions have a line
                 self.ions[0][length - index - 1]):
                 axes.plot((WIDTH*index+offset, WIDTH*index+offset),
-                          (VERT_LINE_MIN, VERT_LINE_MAX), self.color,
-                          linewidth=ARGS.line_width)
+                          (self.display.vert_line_min,
+                           self.display.vert_line_max), self.color,
+                          linewidth=self.args.line_width)
         # now have 20+30 room for the horizontal lines
         # bottom ion series
         b_ions = self.ions[1]
@@ -654,8 +677,8 @@ class MainWindow(QtGui.QMainWindow):
         adjust = self._ion_label_position('b', index, label)
         # x, y, text
         axes.text(xstart+adjust, self._ion_label_height('b'), label,
-                  color=ARGS.bion_color,
-                  fontsize=SUB_FONTSIZE,
+                  color=self.args.bion_color,
+                  fontsize=self.display.sub_fontsize,
                   fontproperties=font)
 
     def _process_y_line(self, axes, font, length, index):
@@ -675,8 +698,8 @@ class MainWindow(QtGui.QMainWindow):
         adjust = self._ion_label_position('y', offset_index, label)
         # no need to adjust height
         axes.text(xstart+adjust, self._ion_label_height('y'), label,
-                  color=ARGS.yion_color,
-                  fontsize=SUB_FONTSIZE,
+                  color=self.args.yion_color,
+                  fontsize=self.display.sub_fontsize,
                   fontproperties=font)
 
     # ------------------
@@ -705,29 +728,29 @@ class MainWindow(QtGui.QMainWindow):
             xstart -= length
         axes.plot((xstart, xstart+length),
                   (height, height),
-                  self.color, linewidth=ARGS.line_width)
+                  self.color, linewidth=self.args.line_width)
 
     def _length(self, index):
         '''Calculates the ion label line length'''
 
-        if ARGS.same_line or not ARGS.variable_length:
-            return ARGS.fixed_length
+        if self.args.same_line or not self.args.variable_length:
+            return self.args.fixed_length
         else:
-            return ARGS.different_line_span*(WIDTH + self.offsets[index])
+            return self.args.different_line_span*(WIDTH + self.offsets[index])
 
     def _ion_line_height(self, series):
         '''Calculates the ion line y position'''
 
         if series == 'b':
-            height = VERT_LINE_MIN
+            height = self.display.vert_line_min
         else:
-            height = VERT_LINE_MAX
+            height = self.display.vert_line_max
         return height
 
     def _ion_label_height(self, series):
         '''Calculates the ion label y position'''
 
-        if ARGS.same_line:
+        if self.args.same_line:
             return self._same_ion_label_height(series)
         else:
             return self._different_ion_label_height(series)
@@ -735,7 +758,7 @@ class MainWindow(QtGui.QMainWindow):
     def _ion_label_position(self, series, index, label):
         '''Calculates the ion label relative x position'''
 
-        if ARGS.same_line:
+        if self.args.same_line:
             return self._same_ion_label_position(series, index, label)
         else:
             return self._different_ion_label_position(series, index, label)
@@ -747,20 +770,22 @@ class MainWindow(QtGui.QMainWindow):
     def _same_ion_label_height(self, series):
         '''Returns the height for same line series'''
 
+        display = self.display
         if series == 'b':
-            height = VERT_LINE_MIN - (SUB_FONTSIZE/2)
+            height = display.vert_line_min - (display.sub_fontsize/2)
         else:
-            height = VERT_LINE_MAX
+            height = display.vert_line_max
         return height
 
     def _same_ion_label_position(self, series, index, label):
         '''Returns the relative x position for the same line series'''
 
-        label_shift = ARGS.fixed_length + SUB_FONTSIZE/2
+        sub_fontsize = self.display.sub_fontsize
+        label_shift = self.args.fixed_length + sub_fontsize/2
         num_length = len(NOT_ALNUM.sub('', label)) - 1
         if series == 'b':
-            adjust = -(label_shift + SUB_FONTSIZE +
-                       SUB_FONTSIZE*SUBSCRIPT_RATIO*(num_length))
+            adjust = -(label_shift + sub_fontsize +
+                       sub_fontsize*SUBSCRIPT_RATIO*(num_length))
         else:
             adjust = label_shift
         return adjust
@@ -772,10 +797,12 @@ class MainWindow(QtGui.QMainWindow):
     def _different_ion_label_height(self, series):
         '''Returns the label height when not on same line'''
 
+        display = self.display
         if series == 'b':
-            height = VERT_LINE_MIN - 3*(SUB_FONTSIZE/2) - ARGS.line_width
+            height = (display.vert_line_min - 3*(display.sub_fontsize/2) -
+                      self.args.line_width)
         else:
-            height = VERT_LINE_MAX + SUB_FONTSIZE
+            height = display.vert_line_max + display.sub_fontsize
         return height
 
     def _different_ion_label_position(self, series, index, label):
@@ -783,22 +810,23 @@ class MainWindow(QtGui.QMainWindow):
 
         length = self._length(index)
         # only shift adjustment if necessary
-        if ARGS.variable_length:
-            length /= ARGS.different_line_span
+        if self.args.variable_length:
+            length /= self.args.different_line_span
         label_shift = length/2
         num_length = len(NOT_ALNUM.sub('', label)) - 1
-        label_adjust = (SUB_FONTSIZE +
-                        SUB_FONTSIZE*SUBSCRIPT_RATIO*(num_length))
+        sub_fontsize = self.display.sub_fontsize
+        label_adjust = (sub_fontsize +
+                        sub_fontsize*SUBSCRIPT_RATIO*(num_length))
         if series == 'b':
-            if ARGS.variable_length:
-                adjust = -(label_shift+(label_adjust-SUB_FONTSIZE)/2)
+            if self.args.variable_length:
+                adjust = -(label_shift+(label_adjust-sub_fontsize)/2)
             else:
-                adjust = -(label_shift*2+(label_adjust-SUB_FONTSIZE))
+                adjust = -(label_shift*2+(label_adjust-sub_fontsize))
         else:
-            if ARGS.variable_length:
+            if self.args.variable_length:
                 adjust = label_shift - label_adjust/2
             else:
-                adjust = SUB_FONTSIZE/2
+                adjust = sub_fontsize/2
         return adjust
 
 # ------------------
@@ -806,13 +834,15 @@ class MainWindow(QtGui.QMainWindow):
 # ------------------
 
 
-def main():
+def main(argv=None):
     '''On init'''
 
+    display = configure(PARSER.parse_args(argv))
+    args = display.args
     # init app
     app = QtGui.QApplication([])
-    mainwindow = MainWindow(ARGS.color, ARGS.output, peptide=ARGS.peptide,
-                            ions=ARGS.ions)
+    mainwindow = MainWindow(display, args.color, args.output,
+                            peptide=args.peptide, ions=args.ions)
     mainwindow.show()
     status = app.exec_()
     sys.exit(status)
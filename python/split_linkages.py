@@ -53,7 +53,6 @@ PARSER.add_argument('-f', "--file", type=str, required=True,
                     help="Full (preferably) or local path to CSV file")
 PARSER.add_argument('-o', "--output", type=str, default="linkages_out.txt",
                     help="Output file")
-ARGS = PARSER.parse_args()
 
 
 # FUNCTIONS
@@ -76,11 +75,12 @@ def write_data(iterator, fout):
         print("\t".join(item), file=fout)
 
 
-def main():
+def main(argv=None):
     '''On init'''
 
-    with open(os.path.expanduser(ARGS.file), 'r') as fin:
-        with open(ARGS.output, 'w') as fout:
+    args = PARSER.parse_args(argv)
+    with open(os.path.expanduser(args.file), 'r') as fin:
+        with open(args.output, 'w') as fout:
             write_data(split_csv(fin), fout)
 
 if __name__ == '__main__':
@@ -0,0 +1,66 @@
+'''Shared fixtures: synthetic TPP and PAVA inputs, and the script runner'''
+
+# load modules/submodules
+import os
+import sys
+
+import pytest
+
+# the scripts and the lanhuang package sit beside the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from lanhuang.synthetic import write_mgf
+
+
+# CONSTANTS
+# ---------
+
+SCANS = 300
+PEAKS = 20
+
+
+# FIXTURES
+# --------
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    '''
+    Writes a synthetic TPP and PAVA pair, returning their paths. The TPP
+    file is drawn from another seed, so its charges differ.
+    '''
+
+    tpp = write_mgf(str(tmp_path / 'synthetic_tpp.mgf'), 'TPP', SCANS,
+                    PEAKS, seed=1)
+    pava = write_mgf(str(tmp_path / 'synthetic_pava.txt'), 'PAVA', SCANS,
+                     PEAKS)
+    return tpp, pava
+
+
+@pytest.fixture
+def run(tmp_path):
+    '''
+    Returns a runner for the main() of a correction script, which
+    writes each run to its own directory and returns the bytes of the
+    output followed by those of any summary or report.
+    '''
+
+    def runner(script, name, tpp, pava, *flags):
+        directory = tmp_path / name
+        directory.mkdir()
+        out_path = str(directory / 'corrected.txt')
+        script.main(['-t', tpp, '-p', pava, '-o', out_path] + list(flags))
+        return read_outputs(str(directory))
+
+    return runner
+
+
+def read_outputs(directory):
+    '''Returns the bytes of the files in directory, ordered by name'''
+
+    data = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as fileobj:
+            data.append((name, fileobj.read()))
+    return data
@@ -0,0 +1,209 @@
+'''Each correction mode must write the same bytes as the plain path'''
+
+# load modules/submodules
+import bz2
+import functools
+import gzip
+import io
+import os
+import shutil
+
+import pytest
+
+import fix_fusion
+import fix_mgf
+import fix_pava
+from lanhuang import checkpoint, fusion, output, pava
+from lanhuang.converters import convert_mgf
+from lanhuang.synthetic import write_mgf
+
+from conftest import SCANS, PEAKS, read_outputs
+
+
+# CONSTANTS
+# ---------
+
+COMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.BZ2File}
+
+# input bytes between checkpoints, so a short run saves several
+CHECKPOINT_INTERVAL = 4096
+
+
+# HELPERS
+# -------
+
+
+def compress(path, extension):
+    '''Writes a compressed copy of path, returning its path'''
+
+    compressed = path + extension
+    with open(path, 'rb') as src:
+        with COMPRESSORS[extension](compressed, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+    return compressed
+
+
+def reverse_scans(path):
+    '''Reverses the scan order of a TPP file, returning the new path'''
+
+    with io.open(path, 'rb') as fileobj:
+        scans = fileobj.read().split(b'BEGIN IONS')[1:]
+    reversed_path = path.replace('.mgf', '_reversed.mgf')
+    with io.open(reversed_path, 'wb') as fileobj:
+        fileobj.write(b''.join(b'BEGIN IONS' + i for i in scans[::-1]))
+    return reversed_path
+
+
+def interrupt_and_resume(monkeypatch, script, argv, parser, method):
+    '''
+    Runs the script until the parser method, called once per scan, has
+    processed half the scans, then resumes it from the checkpoint.
+
+    Arguments:
+        script -- correction script module
+        argv -- script arguments, with the output path after '-o'
+        parser, method -- parser class and per-scan method to interrupt
+    '''
+
+    process = getattr(parser, method)
+    count = [0]
+
+    def interrupted(self, *args):
+        count[0] += 1
+        if count[0] > SCANS // 2:
+            raise KeyboardInterrupt
+        return process(self, *args)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(parser, method, interrupted)
+        patch.setattr(output, 'Checkpoint', functools.partial(
+            checkpoint.Checkpoint, interval=CHECKPOINT_INTERVAL))
+        with pytest.raises(KeyboardInterrupt):
+            script.main(argv)
+    out_path = argv[argv.index('-o') + 1]
+    assert os.path.exists(checkpoint.checkpoint_path(out_path))
+    script.main(argv + ['--resume'])
+
+
+# FIX PAVA
+# --------
+
+
+@pytest.mark.parametrize('flags', [
+    ['--stream'],
+    ['-j', '2'],
+    ['--splice'],
+    ['--splice', '-j', '2'],
+    ['--pipeline'],
+    ['--cache'],
+])
+def test_pava_modes(inputs, run, flags):
+    plain = run(fix_pava, 'plain', inputs[0], inputs[1], '-s')
+    assert run(fix_pava, 'mode', inputs[0], inputs[1], '-s', *flags) == plain
+
+
+def test_pava_corrects(inputs, run):
+    (_, summary), (_, corrected) = run(fix_pava, 'plain', inputs[0],
+                                       inputs[1], '-s')
+    with open(inputs[1], 'rb') as fileobj:
+        assert corrected != fileobj.read()
+    assert summary
+
+
+def test_pava_unsorted_stream(inputs, run):
+    reversed_path = reverse_scans(inputs[0])
+    plain = run(fix_pava, 'plain', inputs[0], inputs[1], '-s')
+    assert run(fix_pava, 'stream', reversed_path, inputs[1], '-s',
+               '--stream') == plain
+
+
+@pytest.mark.parametrize('extension', sorted(COMPRESSORS))
+def test_pava_compressed(inputs, run, tmp_path, extension):
+    plain = run(fix_pava, 'plain', inputs[0], inputs[1], '-s')
+    tpp, pava_path = [compress(i, extension) for i in inputs]
+    assert run(fix_pava, 'compressed', tpp, pava_path, '-s') == plain
+
+    # compressed output
+    out_path = str(tmp_path / ('corrected.txt' + extension))
+    fix_pava.main(['-t', tpp, '-p', pava_path, '-o', out_path])
+    with COMPRESSORS[extension](out_path, 'rb') as fileobj:
+        assert fileobj.read() == plain[1][1]
+
+
+@pytest.mark.parametrize('flags', [[], ['--charge-source', 'both']])
+def test_pava_resume(inputs, run, tmp_path, monkeypatch, flags):
+    plain = run(fix_pava, 'plain', inputs[0], inputs[1], '-s', *flags)
+
+    directory = tmp_path / 'resumed'
+    directory.mkdir()
+    argv = ['-t', inputs[0], '-p', inputs[1], '-o',
+            str(directory / 'corrected.txt'), '-s'] + flags
+    interrupt_and_resume(monkeypatch, fix_pava, argv, pava.ParseMgf,
+                         'write_scan')
+    assert read_outputs(str(directory)) == plain
+
+
+# FIX FUSION
+# ----------
+
+
+@pytest.mark.parametrize('flags', [
+    ['--stream'],
+    ['-j', '2'],
+    ['--pipeline'],
+    ['--cache'],
+])
+def test_fusion_modes(inputs, run, flags):
+    plain = run(fix_fusion, 'plain', inputs[0], inputs[1])
+    assert run(fix_fusion, 'mode', inputs[0], inputs[1], *flags) == plain
+
+
+@pytest.mark.parametrize('extension', sorted(COMPRESSORS))
+def test_fusion_compressed(inputs, run, extension):
+    plain = run(fix_fusion, 'plain', inputs[0], inputs[1])
+    tpp, pava_path = [compress(i, extension) for i in inputs]
+    assert run(fix_fusion, 'compressed', tpp, pava_path) == plain
+
+
+def test_fusion_resume(inputs, run, tmp_path, monkeypatch):
+    plain = run(fix_fusion, 'plain', inputs[0], inputs[1])
+
+    directory = tmp_path / 'resumed'
+    directory.mkdir()
+    argv = ['-t', inputs[0], '-p', inputs[1], '-o',
+            str(directory / 'corrected.txt')]
+    interrupt_and_resume(monkeypatch, fix_fusion, argv, fusion.ParseMgf,
+                         'process_scan')
+    assert read_outputs(str(directory)) == plain
+
+
+# FIX MGF
+# -------
+
+
+@pytest.mark.parametrize('flags', [['--stream'], ['--pipeline']])
+def test_fixers_modes(inputs, run, flags):
+    plain = run(fix_mgf, 'plain', inputs[0], inputs[1], '-s')
+    assert run(fix_mgf, 'mode', inputs[0], inputs[1], '-s', *flags) == plain
+
+
+# CONVERTERS
+# ----------
+
+
+@pytest.mark.parametrize('dialect', ['RV', 'PD'])
+@pytest.mark.parametrize('options', [
+    {'cache': True},
+    {'pipeline': True},
+    {'cache': True, 'pipeline': True},
+])
+def test_convert_modes(tmp_path, dialect, options):
+    path = write_mgf(str(tmp_path / 'synthetic.mgf'), dialect, SCANS,
+                     PEAKS)
+    outputs = []
+    for name, kwds in (('plain.txt', {}), ('mode.txt', options)):
+        out_path = str(tmp_path / name)
+        convert_mgf(path, out_path, dialect, **kwds)
+        with open(out_path, 'rb') as fileobj:
+            outputs.append(fileobj.read())
+    assert outputs[0] == outputs[1]
@@ -76,16 +76,6 @@ PARSER.add_argument('-o', "--output", type=str, default="xl_out.txt",
 PARSER.add_argument('-m', "--mode", type=str, default="all",
                     choices=['all', 'single'],
                     help="Single XL per Ambiguous or All")
-ARGS = PARSER.parse_args()
-
-# check arguments
-if os.path.exists(ARGS.file):
-    FILE = ARGS.file
-elif os.path.exists(os.path.join(os.getcwd(), ARGS.file)):
-    FILE = os.path.join(os.getcwd(), ARGS.file)
-else:
-    raise argparse.ArgumentTypeError("Please enter a valid path to a "
-                                     "XL position file.")
 
 # CONSTANTS
 NTERM_MODS = ['N-term', 'nterm']
@@ -102,10 +92,11 @@ class CrosslinkPositionParser(object):
     residue objects.
     '''
 
-    def __init__(self, fileobj):
+    def __init__(self, fileobj, mode='all'):
         super(CrosslinkPositionParser, self).__init__()
 
         self.fileobj = fileobj
+        self.mode = mode
         self.crosslinks = set()
 
     def run(self):
@@ -135,7 +126,7 @@ class CrosslinkPositionParser(object):
         residues_1 = self._split_residue(res1)
         residues_2 = self._split_residue(res2)
         # now need to add all lines
-        if ARGS.mode == 'single':
+        if self.mode == 'single':
             self._process_single(prot1, residues_1, prot2, residues_2)
         else:
             self._process_all(prot1, residues_1, prot2, residues_2)
@@ -180,8 +171,8 @@ class CrosslinkPositionParser(object):
 class MakeOutput(CrosslinkPositionParser):
     '''Makes the output from a given file path'''
 
-    def __init__(self, fileobj):
-        super(MakeOutput, self).__init__(fileobj)
+    def __init__(self, fileobj, mode='all'):
+        super(MakeOutput, self).__init__(fileobj, mode)
 
         self.buf = StringIO()
 
@@ -202,18 +193,30 @@ class MakeOutput(CrosslinkPositionParser):
 # ------------------
 
 
-def main():
+def find_file(path):
+    '''Returns the full path to the XL position file'''
+
+    if os.path.exists(path):
+        return path
+    elif os.path.exists(os.path.join(os.getcwd(), path)):
+        return os.path.join(os.getcwd(), path)
+    raise argparse.ArgumentTypeError("Please enter a valid path to a "
+                                     "XL position file.")
+
+
+def main(argv=None):
     '''On init'''
 
-    with open(FILE, 'r') as fileobj:
-        cls = MakeOutput(fileobj)
+    args = PARSER.parse_args(argv)
+    with open(find_file(args.file), 'r') as fileobj:
+        cls = MakeOutput(fileobj, args.mode)
         cls.run()
         # process output
         cls.write_header()
         cls.write_lines()
         cls.buf.seek(0)         # if not, empty output
 
-    with open(ARGS.output, 'w') as dst:
+    with open(args.output, 'w') as dst:
         shutil.copyfileobj(cls.buf, dst)
 
 if __name__ == '__main__':